@@ -1,26 +1,50 @@
-from flask import Flask, request, redirect, url_for, render_template, send_file
+import time
+# Startzeitpunkt für die Messung der Importdauer
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, request, redirect, url_for, render_template, send_file, send_from_directory, abort
 import os
-import uuid
+import io
 import shutil
-import tensorflow as tf
-import numpy as np
-from tensorflow.keras.models import load_model
-import paho.mqtt.publish as publish
 import logging
 import json
-import zipfile
+import queue
+import threading
 from datetime import datetime
+from inference import InferenceWorker
+from mqtt_client import MqttPublisher
+from state_tracker import StateTracker
+from frame_cache import FrameCache, frame_signature
+from model_registry import ModelRegistry
+from heads import HeadRegistry, head_path
+from backends import import_framework
+from retrain_jobs import RetrainJobManager
+from file_index import FileIndex, dataset_folders
+from devices import Device, DEFAULT_MODEL, NAME_PATTERN, load_devices
+from camera_poller import Camera, CameraPoller
+import thumbnails
+import zip_stream
+import dedup
+import metrics
+import log_tail
+import preprocessing
 
 # Ordnerpfade
-UPLOAD_FOLDER = '/app/static/uploads'
+# Basisverzeichnis für Daten, Modell und Logs (abweichend z. B. für Benchmarks)
+BASE_DIR = os.getenv('APP_BASE_DIR', '/app')
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
 LAST_IMAGE_FOLDER = os.path.join(UPLOAD_FOLDER, 'last_image')
-MODEL_FOLDER = '/app/model'
-DATASET_FOLDER = '/app/dataset'
-STATE_FILE = '/app/state.txt'
-LOCK_FILE = '/app/prediction.lock'
-RETRAIN_LOCK = '/app/retrain.lock'
-RETRAIN_LOG_FILE = '/app/retrain.log'
-LOG_FILE = '/app/app.log'
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbs')
+MODEL_FOLDER = os.path.join(BASE_DIR, 'model')
+DATASET_FOLDER = os.path.join(BASE_DIR, 'dataset')
+STATE_FILE = os.path.join(BASE_DIR, 'state.txt')
+RETRAIN_LOCK = os.path.join(BASE_DIR, 'retrain.lock')
+RETRAIN_LOG_FILE = os.path.join(BASE_DIR, 'retrain.log')
+RETRAIN_METRICS_FILE = os.path.join(BASE_DIR, 'retrain_metrics.jsonl')
+FILE_INDEX_PATH = os.getenv('FILE_INDEX_PATH', os.path.join(BASE_DIR, 'file_index.sqlite'))
+# Mehrere Kameras/Tore; ohne Datei gibt es ein Gerät aus den Umgebungsvariablen
+DEVICES_FILE = os.getenv('DEVICES_FILE', os.path.join(BASE_DIR, 'devices.json'))
+LOG_FILE = os.path.join(BASE_DIR, 'app.log')
 
 # LOGGING
 # Logger-Objekt erstellen
@@ -45,10 +69,14 @@ app = Flask(__name__)
 # Sicherstellen, dass die Ordner existieren
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(LAST_IMAGE_FOLDER, exist_ok=True)  # Ordner für das letzte Bild
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)  # Vorschaubilder der Galerie
 os.makedirs(os.path.join(DATASET_FOLDER, 'open'), exist_ok=True)
 os.makedirs(os.path.join(DATASET_FOLDER, 'closed'), exist_ok=True)
 os.makedirs(MODEL_FOLDER, exist_ok=True)
 
+# Index über Uploads und Dataset-Bilder (ersetzt Verzeichnis-Scans)
+file_index = FileIndex(FILE_INDEX_PATH)
+
 # MQTT-Konfiguration aus Umgebungsvariablen
 MQTT_HOST = os.getenv('MQTT_HOST', 'localhost')
 MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
@@ -62,80 +90,294 @@ DEVICE_ID = os.getenv('DEVICE_ID', '')
 DEVICE_NAME = os.getenv('DEVICE_NAME', '')
 DEVICE_MODEL = os.getenv('DEVICE_MODEL', '')
 DEVICE_MANUFACTURER = os.getenv('DEVICE_MANUFACTURER', '')
+AVAILABILITY_TOPIC = os.getenv('AVAILABILITY_TOPIC', f"{RESULT_TOPIC}/availability" if RESULT_TOPIC else '')
+MQTT_QOS = int(os.getenv('MQTT_QOS', 1))
+MQTT_CLIENT_ID = os.getenv('MQTT_CLIENT_ID', '')
+
+# Snapshots selbst abholen (Pull); die URL gilt für das Gerät aus den Umgebungsvariablen,
+# die übrigen Werte sind Standardwerte für alle Geräte
+SNAPSHOT_URL = os.getenv('SNAPSHOT_URL', '')
+# Abstand zwischen zwei Abrufen in Sekunden
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 60))
+# Kürzerer Abstand, solange ein Zustandswechsel aussteht oder kürzlich bestätigt wurde
+SNAPSHOT_ACTIVE_INTERVAL = float(os.getenv('SNAPSHOT_ACTIVE_INTERVAL', 10))
+# So lange nach einem bestätigten Wechsel gilt der kürzere Abstand
+SNAPSHOT_ACTIVE_SECONDS = float(os.getenv('SNAPSHOT_ACTIVE_SECONDS', 300))
+# Timeout pro Abruf in Sekunden
+SNAPSHOT_TIMEOUT = float(os.getenv('SNAPSHOT_TIMEOUT', 10))
+# Maximaler Abstand in Sekunden nach wiederholten Fehlern
+SNAPSHOT_MAX_BACKOFF = float(os.getenv('SNAPSHOT_MAX_BACKOFF', 300))
+# Abgeholte Bilder speichern: all, changed (nur ohne Frame-Cache-Treffer) oder none
+SNAPSHOT_SAVE = os.getenv('SNAPSHOT_SAVE', 'changed').lower()
+
+# Inferenz-Konfiguration
+# Backend für die Vorhersage: 'keras' oder 'tflite' (benötigt das von retrain.py exportierte .tflite-Modell)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+# Anzahl Threads für den TFLite-Interpreter (leer = Standard)
+TFLITE_THREADS = int(os.getenv('TFLITE_THREADS')) if os.getenv('TFLITE_THREADS') else None
+# Maximale Anzahl Bilder pro model.predict-Aufruf
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 8))
+# Maximale Wartezeit, um weitere Bilder für einen Batch zu sammeln
+BATCH_MAX_WAIT_MS = int(os.getenv('BATCH_MAX_WAIT_MS', 20))
+# Maximale Anzahl wartender Bilder, bevor neue Anfragen abgewiesen werden
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', 64))
+# Maximale Zeit in Sekunden, die ein Request auf seine Vorhersage wartet
+PREDICTION_TIMEOUT = float(os.getenv('PREDICTION_TIMEOUT', 30))
+
+# Entprellung des MQTT-States
+# Anzahl aufeinanderfolgender Bilder, die einen Zustandswechsel bestätigen müssen
+STATE_CONFIRM_FRAMES = int(os.getenv('STATE_CONFIRM_FRAMES', 2))
+# Mindestabstand der Wahrscheinlichkeit vom Schwellwert 0.5, damit ein Bild zählt
+STATE_MARGIN = float(os.getenv('STATE_MARGIN', 0.1))
+# Anzahl der pro Gerät gehaltenen Wahrscheinlichkeiten
+STATE_WINDOW_SIZE = int(os.getenv('STATE_WINDOW_SIZE', 5))
+# Bestätigten Zustand alle n Sekunden erneut senden (0 = aus)
+STATE_HEARTBEAT_SECONDS = float(os.getenv('STATE_HEARTBEAT_SECONDS', 0))
+
+# Vorfilter für unveränderte Bilder
+FRAME_CACHE_ENABLED = os.getenv('FRAME_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Maximaler Hamming-Abstand des 64-Bit-Difference-Hashes
+FRAME_CACHE_HASH_DISTANCE = int(os.getenv('FRAME_CACHE_HASH_DISTANCE', 4))
+# Maximale mittlere Helligkeitsabweichung (0-255) des verkleinerten Graustufenbilds
+FRAME_CACHE_PIXEL_DIFF = float(os.getenv('FRAME_CACHE_PIXEL_DIFF', 4.0))
+# Spätestens nach so vielen Sekunden wird wieder das Modell befragt (0 = nie)
+FRAME_CACHE_MAX_AGE = float(os.getenv('FRAME_CACHE_MAX_AGE', 900))
+
+# Modellwechsel ohne Neustart
+# Abstand in Sekunden, in dem die Modelldatei auf eine neue Version geprüft wird (0 = aus)
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', 30))
+# Anzahl archivierter Modellversionen für ein Rollback
+MODEL_KEEP_VERSIONS = int(os.getenv('MODEL_KEEP_VERSIONS', 3))
+
+# Retraining-Prozess mit niedrigerer Priorität starten (nice-Wert, 0 = unverändert)
+TRAIN_NICE = int(os.getenv('TRAIN_NICE', 10))
+
+# Maximaler Abstand (Bits des Difference-Hash), ab dem Dataset-Bilder als Duplikat gelten
+DEDUP_HASH_DISTANCE = int(os.getenv('DEDUP_HASH_DISTANCE', 2))
+
+# Bilder pro Seite in der Galerie
+GALLERY_PAGE_SIZE = int(os.getenv('GALLERY_PAGE_SIZE', 48))
+# Cache-Dauer der Vorschaubilder im Browser in Sekunden (Dateinamen sind eindeutig, der Inhalt ändert sich nicht)
+THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', 604800))
+
+# Maximale Anzahl Bytes pro Antwort von /logs
+LOG_CHUNK_BYTES = int(os.getenv('LOG_CHUNK_BYTES', 65536))
+# Maximale Anzahl gleichzeitiger /logs/stream-Verbindungen; jede belegt einen Server-Thread (0 = aus)
+LOG_STREAM_MAX = int(os.getenv('LOG_STREAM_MAX', 2))
 
 
 # Modellpfad
 MODEL_PATH = os.path.join(MODEL_FOLDER, 'garage_door_model.keras')
 
-# Modell initialisieren (global)
-model = None
-if os.path.exists(MODEL_PATH):
-    try:
-        logger.info(f"Lade Model von {MODEL_PATH} ...")
-        model = load_model(MODEL_PATH)
-        logger.info("Model erfolgreich geladen.")
-    except Exception as e:
-        logger.error(f"Fehler beim Laden des Modells: {e}")
-else:
-    logger.warning(f"Modellpfad {MODEL_PATH} existiert nicht.")
+# Geräte: eigene Topics, Zustände und letzte Bilder, Modelle über den Namen zugeordnet
+devices = load_devices(DEVICES_FILE, Device(
+    DEVICE_ID if NAME_PATTERN.match(DEVICE_ID) else 'default',
+    name=DEVICE_NAME,
+    sensor_name=SENSOR_NAME,
+    unique_id=DEVICE_ID,
+    state_topic=STATE_TOPIC,
+    config_topic=CONFIG_TOPIC,
+    hardware_model=DEVICE_MODEL,
+    manufacturer=DEVICE_MANUFACTURER,
+    snapshot_url=SNAPSHOT_URL
+))
+for device in devices:
+    os.makedirs(os.path.join(LAST_IMAGE_FOLDER, device.id), exist_ok=True)
+
+def dataset_folder_for(model, label):
+    """Dataset-Ordner einer Klasse: das gemeinsame Dataset für das Standardmodell, sonst dataset/models/<name>/."""
+    if model == DEFAULT_MODEL:
+        return os.path.join(DATASET_FOLDER, label)
+    return os.path.join(DATASET_FOLDER, 'models', model, label)
+
+# Geräte mit eigenem Modell erhalten einen Kopf auf dem gemeinsamen Backbone
+head_models = [model for model in devices.models() if model != DEFAULT_MODEL]
+for model in head_models:
+    for label in ('open', 'closed'):
+        os.makedirs(dataset_folder_for(model, label), exist_ok=True)
+
+# Zwischenspeicher für die Vorhersage des zuletzt ausgewerteten Bildes
+frame_cache = FrameCache(
+    max_hash_distance=FRAME_CACHE_HASH_DISTANCE,
+    max_pixel_diff=FRAME_CACHE_PIXEL_DIFF,
+    max_age_seconds=FRAME_CACHE_MAX_AGE
+)
+
+def invalidate_frame_cache(model=None):
+    """Nach einem Modellwechsel gelten die zwischengespeicherten Vorhersagen der betroffenen Geräte nicht mehr.
+
+    Ohne Modellnamen betrifft es alle Geräte (neues Backbone).
+    """
+    for device in (devices if model is None else devices.using_model(model)):
+        frame_cache.invalidate(device.id)
 
-# Locking-Funktionen
-def is_locked():
-    return os.path.exists(LOCK_FILE)
+# Gemeinsames Backbone mit Standardkopf: ein geladenes Modell für alle Geräte, lädt neue
+# Versionen im Hintergrund und tauscht sie atomar aus
+model_registry = ModelRegistry(
+    MODEL_PATH,
+    backend=INFERENCE_BACKEND,
+    num_threads=TFLITE_THREADS,
+    poll_seconds=MODEL_POLL_SECONDS,
+    keep_versions=MODEL_KEEP_VERSIONS,
+    on_swap=lambda loaded: invalidate_frame_cache(),
+    warmup_batch_sizes=sorted({1, MAX_BATCH_SIZE}),
+    warmup_embeddings=bool(head_models)
+)
+# Köpfe der Geräte-Modelle (wenige KB), ebenfalls mit Neuladen, Archiv und Rollback
+model_registries = {DEFAULT_MODEL: model_registry}
+model_registries.update({
+    model: HeadRegistry(
+        head_path(MODEL_FOLDER, model),
+        poll_seconds=MODEL_POLL_SECONDS,
+        keep_versions=MODEL_KEEP_VERSIONS,
+        on_swap=lambda loaded, model=model: invalidate_frame_cache(model)
+    )
+    for model in head_models
+})
 
-def lock():
-    open(LOCK_FILE, 'w').close()
-    logger.info(f"Lock-Datei erstellt: {LOCK_FILE}")
+def registry_for(model=None):
+    """Registry eines Modells, ohne Namen die des Backbones. Wirft KeyError für unbekannte Modelle."""
+    return model_registries[model] if model else model_registry
 
-def unlock():
-    if os.path.exists(LOCK_FILE):
-        os.remove(LOCK_FILE)
-        logger.info(f"Lock-Datei entfernt: {LOCK_FILE}")
+# Bereits gemeldete unpassende Köpfe, damit nicht jede Vorhersage eine Warnung schreibt
+head_warnings = set()
+
+def active_head(device, backbone):
+    """Kopf für die Vorhersage eines Geräts oder None für den Standardkopf.
+
+    Ein Kopf passt nur zu dem Backbone, auf dessen Embeddings er trainiert
+    wurde. Fehlt er, stammt er von einem anderen Backbone (z. B. nach einem
+    Rollback) oder liefert das Backend keine Embeddings, gilt bis zum nächsten
+    Retraining der Standardkopf.
+    """
+    if device.model == DEFAULT_MODEL:
+        return None
+    head = model_registries[device.model].current()
+    if head is not None and backbone.supports_embeddings and head.backend.matches(backbone.meta):
+        return head
+    if head is None:
+        reason = "noch nicht trainiert"
+    elif not backbone.supports_embeddings:
+        reason = f"Backend {backbone.backend.name} liefert keine Embeddings"
+    else:
+        reason = f"trainiert für ein anderes Backbone als Version {backbone.version}"
+    warning = (device.model, head.version if head else None, backbone.version)
+    if warning not in head_warnings:
+        head_warnings.add(warning)
+        logger.warning(f"Kopf für Modell {device.model} nicht verwendbar ({reason}), verwende den Standardkopf.")
+    return None
+
+def model_version(backbone, head=None):
+    """Version einer Vorhersage: Backbone-Version, bei Geräte-Köpfen zusätzlich die Kopf-Version."""
+    return backbone.version if head is None else f"{backbone.version}+{head.version}"
+
+# Startzeiten und Bereitschaft; TensorFlow und das Modell werden erst in warm_up() geladen
+startup_timings = {}
+ready = threading.Event()
+
+def warm_up():
+    """Importiert das ML-Framework, lädt das Modell und führt Aufwärm-Vorhersagen aus.
+
+    Wird vor dem Annehmen von Anfragen aufgerufen; die gemessenen Zeiten liefert /ready.
+    """
+    started = time.perf_counter()
+    for model, registry in model_registries.items():
+        if os.path.exists(registry.model_path):
+            try:
+                if "framework_import_seconds" not in startup_timings:
+                    startup_timings["framework_import_seconds"] = round(import_framework(INFERENCE_BACKEND), 3)
+                registry.reload()
+                loaded = registry.current()
+                startup_timings.setdefault("models", {})[model] = {
+                    "model_load_seconds": round(loaded.load_seconds, 3),
+                    "first_inference_seconds": round(loaded.warmup_seconds, 3)
+                }
+                if registry is model_registry:
+                    startup_timings.update(startup_timings["models"][model])
+                logger.info(f"Modell {model} erfolgreich geladen.")
+            except Exception as e:
+                logger.error(f"Fehler beim Laden des Modells {model}: {e}")
+        elif registry is model_registry:
+            logger.warning(f"Modellpfad {registry.model_path} existiert nicht.")
+        else:
+            logger.info(f"Für Modell {model} ist noch kein Kopf trainiert, verwende den Standardkopf.")
+        registry.start_watching()
+    startup_timings["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    ready.set()
+    logger.info(f"Startzeiten: {startup_timings}")
+
+# Inferenz-Worker: sammelt gleichzeitige Anfragen aller Geräte und führt sie gebündelt auf dem Backbone aus
+inference_worker = InferenceWorker(
+    get_model=model_registry.current,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    queue_size=INFERENCE_QUEUE_SIZE
+)
+inference_worker.start()
+
+# Retraining als überwachter Hintergrundprozess (ein Job gleichzeitig, abbrechbar)
+retrain_jobs = RetrainJobManager(
+    RETRAIN_LOG_FILE,
+    RETRAIN_METRICS_FILE,
+    RETRAIN_LOCK,
+    nice=TRAIN_NICE
+)
 
 def is_retraining():
-    return os.path.exists(RETRAIN_LOCK)
-
-
-
-CONFIG_PAYLOAD = {
-    "name": SENSOR_NAME,
-    "state_topic": STATE_TOPIC,
-    "payload_on": "open",
-    "payload_off": "closed",
-    "device_class": "door",
-    "unique_id": DEVICE_ID,
-    "device": {
-        "identifiers": [DEVICE_ID],
-        "name": DEVICE_NAME,
-        "model": DEVICE_MODEL,
-        "manufacturer": DEVICE_MANUFACTURER
-    }
-}
+    return retrain_jobs.is_running()
+
+
+
+# Dauerhafte MQTT-Verbindung; Nachrichten werden nur eingereiht und im Hintergrund gesendet
+mqtt_publisher = MqttPublisher(
+    MQTT_HOST,
+    MQTT_PORT,
+    username=MQTT_USER,
+    password=MQTT_PASSWORD,
+    client_id=MQTT_CLIENT_ID,
+    availability_topic=AVAILABILITY_TOPIC,
+    qos=MQTT_QOS
+)
+mqtt_publisher.start()
+
+# Letzte Vorhersage pro Gerät; die Statusseite liest nur diesen Wert und startet kein Modell
+last_results = {}
+last_result_lock = threading.Lock()
+
+# Zustand wird nur bei bestätigten Wechseln gesendet
+state_tracker = StateTracker(
+    confirm_frames=STATE_CONFIRM_FRAMES,
+    margin=STATE_MARGIN,
+    window_size=STATE_WINDOW_SIZE,
+    heartbeat_seconds=STATE_HEARTBEAT_SECONDS
+)
 
 def send_mqtt_discovery():
-    try:
-        logger.info("Sende MQTT Discovery-Konfiguration ...")
-        publish.single(
-            CONFIG_TOPIC,
-            payload=json.dumps(CONFIG_PAYLOAD),
-            retain=True,
-            hostname=MQTT_HOST,
-            port=MQTT_PORT,
-            auth={'username': MQTT_USER, 'password': MQTT_PASSWORD} if MQTT_USER else None
-        )
-        logger.info("MQTT Discovery-Konfiguration erfolgreich gesendet.")
-    except Exception as e:
-        logger.error(f"Fehler beim Senden der MQTT Discovery-Konfiguration: {e}")
+    for device in devices:
+        logger.info(f"Sende MQTT Discovery-Konfiguration für {device.id} ...")
+        if mqtt_publisher.publish(device.config_topic, json.dumps(device.config_payload(AVAILABILITY_TOPIC)), retain=True):
+            logger.info("MQTT Discovery-Konfiguration eingereiht.")
+        else:
+            logger.error("Fehler beim Senden der MQTT Discovery-Konfiguration.")
 
 
 def remove_old_locks():
     """Entfernt alte Lock-Dateien beim Start."""
-    lock_files = [LOCK_FILE, RETRAIN_LOCK]
+    lock_files = [RETRAIN_LOCK]
     for lock_file in lock_files:
         if os.path.exists(lock_file):
             os.remove(lock_file)
             logger.info(f"Alte Lock-Datei entfernt: {lock_file}")
 
+def reconcile_file_index():
+    """Gleicht den Datei-Index beim Start mit den Ordnern ab (z. B. nach manuellem Kopieren)."""
+    folders = [(UPLOAD_FOLDER, 'upload', None)]
+    folders += [(folder, 'dataset', label) for label in ('open', 'closed') for folder in dataset_folders(DATASET_FOLDER, label)]
+    for folder, kind, label in folders:
+        added, removed = file_index.reconcile(folder, kind, label)
+        if added or removed:
+            logger.info(f"Datei-Index {folder}: {added} Dateien aufgenommen, {removed} entfernt.")
+
 def remove_old_logs():
     """Entfernt alte Log-Dateien beim Start."""
     log_files = [RETRAIN_LOG_FILE, LOG_FILE]
@@ -154,71 +396,306 @@ def remove_old_logs():
    #         os.remove(log_file)
    #         logger.info(f"Alte Log-Datei entfernt: {log_file}")
 
+def save_upload(data, signature=None, device=None):
+    """Speichert ein hochgeladenes Bild unter dem Hash seines Inhalts.
+
+    Identische Snapshots landen in derselben Datei und werden nicht erneut
+    geschrieben; nur der Zeitstempel wird aktualisiert, damit das Bild nicht
+    vorzeitig vom Cleanup entfernt wird. Gibt (Dateiname, Pfad, Signatur) zurück;
+    die Signatur (Difference-Hash und Graustufenbild) nutzt auch der Frame-Cache
+    und wird nur berechnet, wenn sie nicht übergeben wurde. Das Gerät bestimmt
+    beim Labeln das Dataset.
+    """
+    metrics.UPLOAD_BYTES.observe(len(data))
+    filename = dedup.content_name(data)
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    if os.path.exists(filepath):
+        logger.info(f"Bild {filename} ist bereits vorhanden, wird nicht erneut gespeichert.")
+        os.utime(filepath)
+    else:
+        tmp_path = filepath + '.tmp'
+        with open(tmp_path, 'wb') as upload_file:
+            upload_file.write(data)
+        os.replace(tmp_path, filepath)
+        try:
+            thumbnails.create_thumbnail(filepath, THUMBNAIL_FOLDER)
+        except Exception as e:
+            logger.warning(f"Vorschaubild für {filename} konnte nicht erstellt werden: {e}")
+    file_index.add(filepath, 'upload', size=len(data), file_hash=os.path.splitext(filename)[0],
+                   device=device.id if device else None)
+
+    try:
+        signature = signature or frame_signature(io.BytesIO(data))
+        file_index.set_phash(filepath, dedup.phash_hex(signature[0]))
+    except Exception as e:
+        logger.warning(f"Hash für {filename} nicht berechenbar: {e}")
+    return filename, filepath, signature
+
+def predict_files(device, uploads):
+    """Reiht mehrere Bilder eines Geräts beim Inferenz-Worker ein und wartet auf die Ergebnisse.
+
+    ``uploads`` enthält (Dateiname, Quelle, Signatur); die Quelle ist ein Pfad
+    oder die hochgeladenen Bytes. Fehlt die Signatur, wird sie hier berechnet. Alle Bilder eines Requests werden mit derselben
+    Modellversion des Geräts vorverarbeitet und vorhergesagt. Bilder, die dem zuletzt ausgewerteten Bild des Geräts gleichen,
+    übernehmen dessen Vorhersage aus dem Frame-Cache. Gibt pro Bild ein Dict mit
+    Dateiname, Wahrscheinlichkeit für "open", Cache-Treffer, Dauer in Sekunden
+    und Modellversion zurück. Bilder, die nicht geladen oder nicht vorhergesagt
+    werden können, werden übersprungen.
+    """
+    loaded = model_registry.current()
+    if loaded is None:
+        metrics.PREDICTIONS_SKIPPED.labels(reason='no_model').inc(len(uploads))
+        return []
+    head = active_head(device, loaded)
+    version = model_version(loaded, head)
+
+    results = []
+    pending = []
+    for filename, source, signature in uploads:
+        started = time.perf_counter()
+        if FRAME_CACHE_ENABLED:
+            try:
+                signature = signature or frame_signature(io.BytesIO(source) if isinstance(source, bytes) else source)
+                cached = frame_cache.lookup(device.id, signature)
+                if cached is not None:
+                    logger.info(f"Bild {filename} unverändert, verwende zwischengespeicherte Vorhersage.")
+                    metrics.PREDICTIONS.labels(source='cache').inc()
+                    results.append({"filename": filename, "probability": cached, "cache_hit": True,
+                                    "latency": time.perf_counter() - started, "model_version": version})
+                    continue
+            except Exception as e:
+                logger.warning(f"Frame-Cache für {filename} nicht verfügbar: {e}")
+
+        try:
+            decode_started = time.perf_counter()
+            img = preprocessing.decode_image(source, loaded.meta)
+            preprocess_started = time.perf_counter()
+            img_array = preprocessing.prepare_image(img, loaded.meta)
+            metrics.DECODE_SECONDS.observe(preprocess_started - decode_started)
+            metrics.PREPROCESS_SECONDS.observe(time.perf_counter() - preprocess_started)
+        except Exception as e:
+            logger.error(f"Bild konnte nicht geladen werden {filename}: {e}")
+            metrics.PREDICTIONS_SKIPPED.labels(reason='decode_error').inc()
+            continue
+        try:
+            pending.append((filename, signature, started, inference_worker.submit(img_array, model=loaded, head=head, timeout=PREDICTION_TIMEOUT)))
+        except queue.Full:
+            logger.error(f"Inferenz-Queue voll, keine Vorhersage für {filename}.")
+            metrics.PREDICTIONS_SKIPPED.labels(reason='queue_full').inc()
+
+    for filename, signature, started, future in pending:
+        try:
+            probability = future.result(timeout=PREDICTION_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Vorhersage fehlgeschlagen für {filename}: {e}")
+            metrics.PREDICTIONS_SKIPPED.labels(reason='predict_error').inc()
+            continue
+        metrics.PREDICTIONS.labels(source='model').inc()
+        if signature is not None:
+            frame_cache.store(device.id, signature, probability)
+        results.append({"filename": filename, "probability": probability, "cache_hit": False,
+                        "latency": time.perf_counter() - started, "model_version": version})
+
+    # Ergebnisse in der Reihenfolge der Uploads zurückgeben
+    order = {filename: i for i, (filename, _, _) in enumerate(uploads)}
+    results.sort(key=lambda result: order[result["filename"]])
+    return results
+
+def update_last_image(device, filename):
+    """Ersetzt das letzte Bild des Geräts (Hardlink statt Kopie)."""
+    last_image_folder = os.path.join(LAST_IMAGE_FOLDER, device.id)
+    for old_file in os.listdir(last_image_folder):
+        os.remove(os.path.join(last_image_folder, old_file))
+    dedup.link_or_copy(os.path.join(UPLOAD_FOLDER, filename), last_image_folder)
+
+def apply_prediction(device, prediction):
+    """Übernimmt eine Vorhersage: Datei-Index, entprellter MQTT-Zustand und letzte Vorhersage. Gibt die Klasse zurück."""
+    probability = prediction["probability"]
+    predicted_class = "open" if probability > 0.5 else "closed"
+    file_index.set_prediction(os.path.join(UPLOAD_FOLDER, prediction["filename"]), predicted_class, probability)
+
+    # Nur bestätigte Zustandswechsel senden
+    confirmed_state = state_tracker.update(device.id, probability)
+    if confirmed_state:
+        publish_state(device, confirmed_state)
+    else:
+        logger.info(f"Vorhersage {predicted_class} ({probability:.2f}) ändert den gemeldeten Zustand nicht.")
+    record_last_result(device, prediction)
+    return predicted_class
+
+def handle_snapshot(camera, data):
+    """Wertet einen abgeholten Snapshot aus.
+
+    Die Vorhersage läuft direkt auf den Bytes und der Zustand wird sofort
+    gesendet; gespeichert wird das Bild (je nach SNAPSHOT_SAVE) erst danach.
+    """
+    device = devices.get(camera.id)
+    filename = dedup.content_name(data)
+    signature = None
+    try:
+        signature = frame_signature(io.BytesIO(data))
+    except Exception as e:
+        logger.warning(f"Snapshot von {device.id} ist kein gültiges Bild: {e}")
+        return
+    predictions = predict_files(device, [(filename, data, signature)])
+    for prediction in predictions:
+        apply_prediction(device, prediction)
+
+    if SNAPSHOT_SAVE == 'all' or (SNAPSHOT_SAVE == 'changed' and not any(p["cache_hit"] for p in predictions)):
+        _, filepath, _ = save_upload(data, signature, device)
+        update_last_image(device, filename)
+        for prediction in predictions:
+            probability = prediction["probability"]
+            file_index.set_prediction(filepath, "open" if probability > 0.5 else "closed", probability)
+
+def camera_active(camera):
+    """Kürzeres Abfrageintervall, solange ein Wechsel aussteht oder kurz nach einem bestätigten Wechsel."""
+    if state_tracker.pending_change(camera.id):
+        return True
+    last_change = state_tracker.last_change(camera.id)
+    return last_change is not None and time.time() - last_change < SNAPSHOT_ACTIVE_SECONDS
+
+def publish_state(device, predicted_class):
+    """Reiht den Zustand eines Geräts zum Senden per MQTT ein."""
+    if mqtt_publisher.publish(device.state_topic, predicted_class, retain=True):
+        logger.info(f"MQTT-State: {predicted_class} für {device.state_topic} eingereiht.")
+
+def record_last_result(device, prediction):
+    """Speichert die letzte Vorhersage eines Geräts im Speicher und in state.txt."""
+    result = {
+        "device": device.id,
+        "filename": prediction["filename"],
+        "prediction": "open" if prediction["probability"] > 0.5 else "closed",
+        "probability": round(prediction["probability"], 4),
+        "state": state_tracker.current_state(device.id),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "latency_ms": round(prediction["latency"] * 1000, 1),
+        "cache_hit": prediction["cache_hit"],
+        "model_version": prediction["model_version"]
+    }
+    with last_result_lock:
+        last_results[device.id] = result
+        try:
+            with open(STATE_FILE, 'w') as state_file:
+                json.dump({"devices": last_results}, state_file)
+        except OSError as e:
+            logger.error(f"Fehler beim Schreiben von {STATE_FILE}: {e}")
+
+def get_last_result(device):
+    with last_result_lock:
+        return last_results.get(device.id)
+
+def load_last_results():
+    """Lädt die letzten Vorhersagen aus state.txt.
+
+    Ältere Versionen speichern nur den Zustand oder eine einzelne Vorhersage;
+    diese gehört dann zum Standardgerät.
+    """
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r') as state_file:
+            results = json.load(state_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(results, dict):
+        return {}
+    if "devices" not in results:
+        return {devices.default.id: results} if "filename" in results else {}
+    return {device_id: result for device_id, result in results["devices"].items()
+            if isinstance(result, dict) and device_id in {device.id for device in devices}}
+
+def heartbeat_loop():
+    """Sendet den bestätigten Zustand regelmäßig erneut."""
+    while True:
+        time.sleep(min(STATE_HEARTBEAT_SECONDS, 60))
+        for device_id, state in state_tracker.due_heartbeats():
+            logger.info(f"Heartbeat: sende Zustand {state} für {device_id} erneut.")
+            publish_state(devices.get(device_id), state)
+
+last_results = load_last_results()
+
+if STATE_HEARTBEAT_SECONDS > 0:
+    threading.Thread(target=heartbeat_loop, name='state-heartbeat', daemon=True).start()
+
+# Snapshot-Abfrage für alle Geräte mit snapshot_url; gestartet wird sie nach dem Laden der Modelle
+camera_poller = CameraPoller(
+    [
+        Camera(
+            device.id,
+            device.snapshot_url,
+            interval=device.snapshot_interval or SNAPSHOT_INTERVAL,
+            active_interval=device.snapshot_active_interval or SNAPSHOT_ACTIVE_INTERVAL,
+            timeout=device.snapshot_timeout or SNAPSHOT_TIMEOUT
+        )
+        for device in devices if device.snapshot_url
+    ],
+    handle_snapshot,
+    is_active=camera_active,
+    max_backoff=SNAPSHOT_MAX_BACKOFF
+)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
+        request_started = time.perf_counter()
+        # Gerät per ?device=<id> oder Formularfeld, sonst das Standardgerät
+        try:
+            device = devices.get(request.values.get('device'))
+        except KeyError:
+            return f"Unbekanntes Gerät: {request.values.get('device')}", 404
         # Datei-Upload
         files = request.files.getlist('file')
         predictions = []
+        uploads = []
 
         for file in files:
             if file:
-                filename = f"{uuid.uuid4()}.jpg"
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(filepath)
-
-                # Letztes Bild aktualisieren
-                for old_file in os.listdir(LAST_IMAGE_FOLDER):
-                    os.remove(os.path.join(LAST_IMAGE_FOLDER, old_file))
-                shutil.copy(filepath, LAST_IMAGE_FOLDER)
-
-                # Automatische Vorhersage nur durchführen, wenn kein Lock existiert
-                if not is_locked() and not is_retraining() and model:
-                    lock()
-                    try:
-                        img = tf.keras.utils.load_img(filepath, target_size=(512, 896))
-                        img_array = tf.keras.utils.img_to_array(img) / 255.0
-                        img_array = tf.expand_dims(img_array, axis=0)
-
-                        # Vorhersage durchführen
-                        prediction = model.predict(img_array, batch_size=1)
-                        predicted_class = "open" if prediction[0][0] > 0.5 else "closed"
-                        predictions.append((filename, predicted_class))
-
-                        # MQTT-Nachricht senden
-                        try:
-                            publish.single(
-                                STATE_TOPIC,
-                                payload=predicted_class,
-                                retain=True,
-                                hostname=MQTT_HOST,
-                                port=MQTT_PORT,
-                                auth={'username': MQTT_USER, 'password': MQTT_PASSWORD} if MQTT_USER else None
-                            )
-#                            logger.info(f"MQTT-Nachricht gesendet: {predicted_class}")
-                            logger.info(f"MQTT-State: {predicted_class} wurde an {STATE_TOPIC} gesendet.")
-                        except Exception as mqtt_error:
-                            logger.error(f"Fehler beim Senden der MQTT-Nachricht: {mqtt_error}")
-
-                        # Status in state.txt speichern
-                        with open(STATE_FILE, 'w') as state_file:
-                            state_file.write(predicted_class)
-
-                    except Exception as e:
-                        logger.error(f"Vorhersage fehlgeschlagen für {filename}: {e}")
-                    finally:
-                        unlock()
-
-        return render_template('index.html', predictions=predictions, image_count=len(os.listdir(UPLOAD_FOLDER)))
-
-    # Liste der Bilder anzeigen (nur gültige Bilddateien filtern)
-    images = [
-        image for image in os.listdir(UPLOAD_FOLDER)
-        if os.path.isfile(os.path.join(UPLOAD_FOLDER, image)) and image.lower().endswith(('.png', '.jpg', '.jpeg'))
-    ]
-    images.sort(key=lambda x: os.path.getmtime(os.path.join(UPLOAD_FOLDER, x)), reverse=True)
-
-    return render_template('index.html', images=images, image_count=len(images))
+                data = file.read()
+                filename, _, signature = save_upload(data, device=device)
+                # Vorhersage direkt aus den hochgeladenen Bytes, ohne die Datei erneut zu lesen
+                uploads.append((filename, data, signature))
+
+        if uploads:
+            update_last_image(device, uploads[-1][0])
+
+        # Automatische Vorhersage; gleichzeitige Anfragen werden vom Inferenz-Worker gebündelt
+        if uploads:
+            for prediction in predict_files(device, uploads):
+                predicted_class = apply_prediction(device, prediction)
+                predictions.append((prediction["filename"], predicted_class))
+
+        metrics.UPLOAD_REQUEST_SECONDS.observe(time.perf_counter() - request_started)
+        return render_template('index.html', predictions=predictions, image_count=file_index.count('upload'), devices=list(devices))
+
+    # Bilder seitenweise aus dem Index anzeigen, neueste zuerst
+    image_count = file_index.count('upload')
+    pages = max(1, -(-image_count // GALLERY_PAGE_SIZE))
+    page = min(max(request.args.get('page', 1, type=int), 1), pages)
+    images = [entry["filename"] for entry in file_index.page('upload', (page - 1) * GALLERY_PAGE_SIZE, GALLERY_PAGE_SIZE)]
+
+    return render_template('index.html', images=images, image_count=image_count, page=page, pages=pages, devices=list(devices))
+
+@app.route('/thumbs/<path:filename>')
+def thumbnail(filename):
+    """Vorschaubild mit Cache-Headern und ETag; fehlende Vorschaubilder werden bei Bedarf erstellt."""
+    filename = os.path.basename(filename)
+    if not os.path.exists(thumbnails.thumbnail_path(THUMBNAIL_FOLDER, filename)):
+        source = os.path.join(UPLOAD_FOLDER, filename)
+        if not os.path.isfile(source):
+            abort(404)
+        try:
+            thumbnails.create_thumbnail(source, THUMBNAIL_FOLDER)
+        except Exception as e:
+            logger.error(f"Vorschaubild für {filename} konnte nicht erstellt werden: {e}")
+            abort(404)
+    return send_from_directory(THUMBNAIL_FOLDER, os.path.basename(thumbnails.thumbnail_path(THUMBNAIL_FOLDER, filename)),
+                               max_age=THUMBNAIL_MAX_AGE)
+
+@app.route('/frame_cache')
+def frame_cache_stats():
+    """Trefferquote und Schwellwerte des Frame-Caches."""
+    return {"enabled": FRAME_CACHE_ENABLED, **frame_cache.stats()}
 
 @app.route('/action/<action>/<path:filename>')
 def action(action, filename):
@@ -228,75 +705,145 @@ def action(action, filename):
         return "Datei nicht gefunden", 404
 
     if action in ['open', 'closed']:
-        dest = os.path.join(DATASET_FOLDER, action, os.path.basename(filename))
+        # Bilder eines Geräts mit eigenem Modell landen im Dataset seines Kopfes
+        dest_folder = dataset_folder_for(upload_model(source), action)
+        dest = os.path.join(dest_folder, os.path.basename(filename))
         try:
+            os.makedirs(dest_folder, exist_ok=True)
+            duplicate = find_dataset_duplicate(source, dest_folder, action)
+            if duplicate:
+                # Nahezu identisches Bild bereits gelabelt: Upload verwerfen statt das Dataset aufzublähen
+                os.remove(source)
+                file_index.remove(source)
+                thumbnails.remove_thumbnail(THUMBNAIL_FOLDER, filename)
+                logger.info(f"Die Datei '{filename}' gleicht '{duplicate['filename']}' im Dataset und wurde verworfen.")
+                return redirect(url_for('index', page=request.args.get('page', 1, type=int)))
             shutil.move(source, dest)
+            file_index.move(source, dest, 'dataset', action)
+            thumbnails.remove_thumbnail(THUMBNAIL_FOLDER, filename)
             logger.info(f"Die Datei '{filename}' wurde nach '{dest}' verschoben.")
         except Exception as e:
             logger.error(f"Fehler beim Verschieben der Datei: {e}")
             return f"Fehler beim Verschieben der Datei: {e}", 500
 
-    return redirect(url_for('index'))
+    return redirect(url_for('index', page=request.args.get('page', 1, type=int)))
+
+def upload_model(source):
+    """Modell des Geräts, von dem ein Upload stammt; ohne (bekanntes) Gerät das Standardmodell."""
+    device_id = (file_index.get(source) or {}).get("device")
+    try:
+        return devices.get(device_id).model if device_id else DEFAULT_MODEL
+    except KeyError:
+        return DEFAULT_MODEL
+
+def find_dataset_duplicate(source, folder, label):
+    """Sucht ein identisches oder nahezu identisches Bild derselben Klasse im Dataset-Ordner."""
+    entry = file_index.get(source) or {}
+    file_hash = entry.get("content_hash")
+    if file_hash:
+        for match in file_index.find_by_hash(file_hash, 'dataset'):
+            if match["label"] == label and os.path.dirname(match["path"]) == folder:
+                return match
+    phash = entry.get("phash")
+    if not phash:
+        return None
+    entries = [entry for entry in file_index.query('dataset', label) if os.path.dirname(entry["path"]) == folder]
+    candidates = dedup.ensure_phashes(file_index, entries)
+    return dedup.find_near_duplicate(phash, candidates, DEDUP_HASH_DISTANCE)
+
+@app.route('/dedup_dataset', methods=['POST'])
+def dedup_dataset():
+    """Fasst nahezu identische Bilder im Dataset zusammen; ``dry_run=1`` zeigt sie nur an."""
+    dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    max_distance = request.values.get('max_distance', DEDUP_HASH_DISTANCE, type=int)
+    removed = {}
+    for label in ('open', 'closed'):
+        duplicates = dedup.collapse_near_duplicates(file_index, label, max_distance, dry_run=dry_run)
+        removed[label] = [os.path.basename(path) for path in duplicates]
+        logger.info(f"Dataset {label}: {len(duplicates)} Duplikate {'gefunden' if dry_run else 'entfernt'}.")
+    return {"dry_run": dry_run, "max_distance": max_distance, "duplicates": removed,
+            "remaining": {label: file_index.count('dataset', label) for label in ('open', 'closed')}}
 
 @app.route('/retrain', methods=['POST'])
 def retrain():
     if is_retraining():
         return "Retraining läuft bereits.", 409
 
-    try:
-        # Retraining-Lock setzen
-        open(RETRAIN_LOCK, 'w').close()
+    # 'head' trainiert nur den Klassifikationskopf auf zwischengespeicherten Embeddings
+    mode = request.form.get('mode', os.getenv('RETRAIN_MODE', 'full'))
+    if mode not in ('full', 'head'):
+        return f"Unbekannter Modus: {mode}", 400
 
-        # Prüfen, ob ein altes Retrain-Log existiert
-        if os.path.exists(RETRAIN_LOG_FILE):
-            if not is_locked():  # Nur löschen, wenn kein Lock besteht
-                os.remove(RETRAIN_LOG_FILE)
-
-        # Starte das Retraining
-        os.system(f'python retrain.py {MODEL_PATH} >> {RETRAIN_LOG_FILE} 2>&1 &')
-
-        return redirect(url_for('last_prediction'))
+    try:
+        retrain_jobs.start(MODEL_PATH, mode)
+    except RuntimeError:
+        return "Retraining läuft bereits.", 409
     except Exception as e:
         logger.error(f"Error during retraining: {e}")
         return f"Error during retraining: {e}", 500
-    finally:
-        if os.path.exists(RETRAIN_LOCK):
-            os.remove(RETRAIN_LOCK)
+    return redirect(url_for('last_prediction'))
+
+@app.route('/retrain/status')
+def retrain_status():
+    """Zustand des Retraining-Jobs mit Epochen-Fortschritt und geschätzter Restdauer."""
+    return retrain_jobs.status()
+
+@app.route('/retrain/cancel', methods=['POST'])
+def retrain_cancel():
+    if not retrain_jobs.cancel():
+        return {"cancelled": False, "error": "Kein laufendes Retraining."}, 409
+    return {"cancelled": True, **retrain_jobs.status()}
+
+def parse_time(value):
+    """Zeitpunkt aus Unix-Sekunden oder ISO-Datum (z. B. 2025-01-31 oder 2025-01-31T12:00) in Sekunden."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 @app.route('/download_dataset', methods=['GET'])
 def download_dataset():
+    """Lädt das Dataset als ZIP herunter, das während des Sendens erzeugt wird.
+
+    Filter: ``label`` (open/closed), ``since``/``until`` (Aufnahmezeitpunkt) und
+    ``changed_since`` (seitdem hinzugefügt oder gelabelt). Der Header
+    ``X-Dataset-Timestamp`` eignet sich als ``changed_since`` für den nächsten
+    inkrementellen Download.
+    """
+    label = request.args.get('label') or None
+    if label not in (None, 'open', 'closed'):
+        return f"Unbekanntes Label: {label}", 400
     try:
-        # Erstelle einen temporären Zip-Dateinamen basierend auf Datum und Uhrzeit
-        zip_filename = f"dataset_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zip"
-        zip_filepath = os.path.join('/app', zip_filename)
-
-        # Zip den Dataset-Ordner
-        with zipfile.ZipFile(zip_filepath, 'w') as zipf:
-            for root, dirs, files in os.walk(DATASET_FOLDER):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, DATASET_FOLDER)
-                    zipf.write(file_path, arcname)
-
-        # Sende die Datei zum Download
-        return send_file(zip_filepath, as_attachment=True, download_name=zip_filename)
-
-    finally:
-        # Entferne die Zip-Datei nach dem Download
-        if os.path.exists(zip_filepath):
-            os.remove(zip_filepath)
-            logging.info(f"Temporäre Zip-Datei gelöscht: {zip_filepath}")
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        changed_since = parse_time(request.args.get('changed_since'))
+    except ValueError as e:
+        return f"Ungültiger Zeitpunkt: {e}", 400
+
+    snapshot = time.time()
+    entries = file_index.query('dataset', label, since, until, changed_since)
+    zip_filename = f"dataset_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zip"
+    logger.info(f"Sende Dataset-ZIP mit {len(entries)} Dateien.")
+    archive = zip_stream.stream_zip(
+        (entry["path"], zip_stream.archive_name(entry["path"], DATASET_FOLDER)) for entry in entries
+    )
+    return Response(archive, mimetype='application/zip', headers={
+        "Content-Disposition": f"attachment; filename={zip_filename}",
+        "X-Dataset-Timestamp": f"{snapshot:.3f}",
+        "X-Dataset-Files": str(len(entries))
+    })
 
 @app.route('/delete_dataset', methods=['POST'])
 def delete_dataset():
     try:
         for subfolder in ['open', 'closed']:
-            folder_path = os.path.join(DATASET_FOLDER, subfolder)
-            for file in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    logging.info(f"Datei gelöscht: {file_path}")
+            # Manuell hinzugefügte Dateien zuerst aufnehmen, dann alles über den Index löschen (auch Datasets der Köpfe)
+            for folder in dataset_folders(DATASET_FOLDER, subfolder):
+                file_index.reconcile(folder, 'dataset', subfolder, hash_files=False)
+            deleted = file_index.delete_files('dataset', subfolder)
+            logging.info(f"{len(deleted)} Dateien aus {subfolder} gelöscht.")
         return "Dataset erfolgreich geleert.", 200
     except Exception as e:
         logging.error(f"Fehler beim Löschen des Dataset: {e}")
@@ -304,59 +851,193 @@ def delete_dataset():
 
 @app.route('/last_prediction')
 def last_prediction():
-    global training_logs
-    mqtt_status = "Not Sent"
+    try:
+        device = devices.get(request.args.get('device'))
+    except KeyError:
+        return f"Unbekanntes Gerät: {request.args.get('device')}", 404
+    result = get_last_result(device)
+
+    if result is None:
+        if model_registry.current() is None:
+            prediction_error = "Das Modell konnte nicht geladen werden. Überprüfen Sie den Pfad oder die Modelldatei."
+        else:
+            prediction_error = "Es liegt noch keine Vorhersage vor."
+        return render_template('last_prediction.html', error=prediction_error, device=device, devices=list(devices))
 
-    # Initialisiere `training_logs`
-    if os.path.exists(RETRAIN_LOG_FILE):
-        with open(RETRAIN_LOG_FILE, 'r') as log_file:
-            training_logs = log_file.read()
+    # Letztes Bild nur anzeigen, wenn es noch im Ordner des Geräts liegt
+    last_image = result['filename'] if os.path.isfile(os.path.join(LAST_IMAGE_FOLDER, device.id, result['filename'])) else None
+
+    if mqtt_publisher.last_error:
+        mqtt_status = f"Failed: {mqtt_publisher.last_error}"
+    elif result['state']:
+        mqtt_status = f"Success, Status sent: {result['state']}"
     else:
-        training_logs = "Keine Trainings-Logs vorhanden."
-
-    # Modell überprüfen
-    if model is None:
-        prediction_error = "Das Modell konnte nicht geladen werden. Überprüfen Sie den Pfad oder die Modelldatei."
-        return render_template('last_prediction.html', error=prediction_error, logs=training_logs)
-
-    # Letztes Bild im LAST_IMAGE_FOLDER finden
-    last_image_files = [
-        image for image in os.listdir(LAST_IMAGE_FOLDER)
-        if os.path.isfile(os.path.join(LAST_IMAGE_FOLDER, image)) and image.lower().endswith(('.png', '.jpg', '.jpeg'))
-    ]
-    if not last_image_files:
-        prediction_error = "Kein Bild im Ordner für das letzte Bild gefunden."
-        return render_template('last_prediction.html', error=prediction_error, logs=training_logs)
-
-    # Nehme das erste Bild im LAST_IMAGE_FOLDER
-    last_image_path = os.path.join(LAST_IMAGE_FOLDER, last_image_files[0])
-
-    # Vorhersage mit dem Modell
+        mqtt_status = None
+
+    return render_template('last_prediction.html', prediction=result['prediction'], result=result, last_image=last_image,
+                           mqtt_status=mqtt_status, device=device, devices=list(devices))
+
+@app.route('/last_prediction.json')
+def last_prediction_json():
+    """Letzte Vorhersage eines Geräts (?device=) als JSON, ohne das Modell erneut auszuführen."""
     try:
-        img = tf.keras.utils.load_img(last_image_path, target_size=(512, 896))
-        img_array = tf.keras.utils.img_to_array(img) / 255.0
-        img_array = tf.expand_dims(img_array, axis=0)
+        device = devices.get(request.args.get('device'))
+    except KeyError:
+        return {"error": f"Unbekanntes Gerät: {request.args.get('device')}"}, 404
+    result = get_last_result(device)
+    if result is None:
+        return {"error": "Es liegt noch keine Vorhersage vor."}, 404
+    return result
 
-        predictions = model.predict(img_array, batch_size=1)
-        predicted_class = "open" if predictions[0][0] > 0.5 else "closed"
-        mqtt_status = f"Success, Status sent: {str(predicted_class)}"
-    except Exception as e:
-        prediction_error = f"Error in prediction: {e}"
-        logger.error(prediction_error)
-        mqtt_status = f"Failed: {str(e)}"
-        return render_template('last_prediction.html', error=prediction_error, logs=training_logs, mqtt_status=mqtt_status)
+@app.route('/cameras')
+def camera_status():
+    """Abrufstatistik der Snapshot-Abfrage pro Kamera."""
+    return {"cameras": camera_poller.status()}
 
-    return render_template('last_prediction.html', prediction=predicted_class, last_image=last_image_files[0], logs=training_logs, mqtt_status=mqtt_status)
+@app.route('/devices')
+def device_list():
+    """Alle Geräte mit bestätigtem Zustand, letzter Vorhersage und geladener Modellversion.
+
+    ``head`` gibt an, ob ein eigener Kopf aktiv ist (sonst gilt der Standardkopf).
+    """
+    backbone = model_registry.current()
+    result = []
+    for device in devices:
+        head = active_head(device, backbone) if backbone else None
+        result.append({
+            **device.info(),
+            "state": state_tracker.current_state(device.id),
+            "model_version": model_version(backbone, head) if backbone else None,
+            "head": head is not None,
+            "last_prediction": get_last_result(device)
+        })
+    return {"devices": result}
 
 @app.route('/logs')
 def get_logs():
-    if os.path.exists(RETRAIN_LOG_FILE):
-        with open(RETRAIN_LOG_FILE, 'r') as log_file:
-            logs = log_file.read()
-    else:
+    """Neue Zeilen des Trainings-Logs ab ?offset=<Offset> als JSON.
+
+    Ohne offset wird nur das Ende des Logs geliefert. Der Client sendet beim
+    nächsten Abruf den zurückgegebenen offset; reset=true bedeutet, dass ein
+    neues Log begonnen hat und die bisherige Anzeige verworfen werden muss.
+    """
+    offset = request.args.get('offset')
+    initial = log_tail.parse_offset(offset) is None
+    if initial:
+        offset = log_tail.tail_offset(RETRAIN_LOG_FILE, LOG_CHUNK_BYTES)
+    logs, next_offset, reset = log_tail.read_from_offset(RETRAIN_LOG_FILE, offset, LOG_CHUNK_BYTES)
+    if initial and not os.path.exists(RETRAIN_LOG_FILE):
         logs = "Keine Trainings-Logs vorhanden."
-    return {"logs": logs}  # Rückgabe als JSON
+    return {"logs": logs, "offset": next_offset, "reset": reset}  # Rückgabe als JSON
+
+# Jeder offene Stream belegt einen Server-Thread für bis zu 5 Minuten
+log_stream_slots = threading.BoundedSemaphore(LOG_STREAM_MAX) if LOG_STREAM_MAX > 0 else None
+
+@app.route('/logs/stream')
+def stream_logs():
+    """Trainings-Log als Server-Sent Events (höchstens LOG_STREAM_MAX gleichzeitig, sonst 503)."""
+    if log_stream_slots is None:
+        abort(404)
+    if not log_stream_slots.acquire(blocking=False):
+        return Response("Zu viele offene Log-Streams, bitte /logs abfragen.", status=503, headers={'Retry-After': '30'})
+    offset = request.headers.get('Last-Event-ID')
+    if log_tail.parse_offset(offset) is None:
+        offset = request.args.get('offset')
+    if log_tail.parse_offset(offset) is None:
+        offset = log_tail.tail_offset(RETRAIN_LOG_FILE, LOG_CHUNK_BYTES)
+    response = Response(
+        log_tail.stream_events(RETRAIN_LOG_FILE, offset),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Auch freigeben, wenn der Client vor dem ersten Event die Verbindung schließt
+    response.call_on_close(log_stream_slots.release)
+    return response
+
+@app.route('/logs/metrics')
+def get_log_metrics():
+    """Metriken des laufenden bzw. letzten Trainings pro Epoche."""
+    return {"epochs": log_tail.read_metrics(RETRAIN_METRICS_FILE)}
+
+
+@app.route('/model')
+def model_info():
+    """Aktuell geladene Modellversion und archivierte Versionen (?model=<name> für einen Geräte-Kopf, sonst das Backbone)."""
+    try:
+        registry = registry_for(request.args.get('model'))
+    except KeyError:
+        return {"error": f"Unbekanntes Modell: {request.args.get('model')}"}, 404
+    loaded = registry.current()
+    return {
+        "current": loaded.info() if loaded else None,
+        "file_version": registry.file_version(),
+        "versions": registry.versions(),
+        "models": list(model_registries)
+    }
+
+@app.route('/model/rollback', methods=['POST'])
+def model_rollback():
+    """Aktiviert eine archivierte Modellversion (Standard: die vorherige)."""
+    try:
+        registry = registry_for(request.values.get('model'))
+    except KeyError:
+        return {"error": f"Unbekanntes Modell: {request.values.get('model')}"}, 404
+    try:
+        version = registry.rollback(request.values.get('version'))
+        return {"version": version}
+    except ValueError as e:
+        return {"error": str(e)}, 404
+    except Exception as e:
+        logger.error(f"Fehler beim Rollback des Modells: {e}")
+        return {"error": str(e)}, 500
+
+def metrics_state():
+    """Zustandswerte für /metrics; ``metrics.StateCollector`` liest sie bei jedem Abruf."""
+    models = []
+    for model, registry in model_registries.items():
+        loaded = registry.current()
+        if loaded:
+            models.append({"model": model, "version": loaded.version, "backend": loaded.backend.name,
+                           "load_seconds": loaded.load_seconds, "warmup_seconds": loaded.warmup_seconds})
+    retrain_status = retrain_jobs.status()
+    epochs = log_tail.read_metrics(RETRAIN_METRICS_FILE)
+    last_epoch = epochs[-1] if epochs else {}
+    cache_stats = frame_cache.stats()
+    return {
+        "models": models,
+        "mqtt_connected": 1 if mqtt_publisher.is_connected() else 0,
+        "mqtt_queue_length": mqtt_publisher.queue_length(),
+        "retrain_running": 1 if retrain_status["state"] in ('running', 'cancelling') else 0,
+        "retrain_progress": retrain_status.get("progress"),
+        "retrain_eta_seconds": retrain_status.get("eta_seconds"),
+        "retrain_epoch_seconds": last_epoch.get("epoch_seconds"),
+        "retrain_images_per_second": last_epoch.get("images_per_second"),
+        "frame_cache_hits": cache_stats["hits"],
+        "frame_cache_misses": cache_stats["misses"]
+    }
+
+state_collector = metrics.StateCollector(metrics_state)
+metrics.REGISTRY.register(state_collector)
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metriken im Prometheus-Textformat."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/ready')
+def readiness():
+    """Bereitschaft des Servers mit den gemessenen Startzeiten (503 während des Aufwärmens)."""
+    loaded = model_registry.current()
+    body = {
+        "ready": ready.is_set(),
+        "model_loaded": loaded is not None,
+        "model_version": loaded.version if loaded else None,
+        "models": {model: registry.current().version if registry.current() else None
+                   for model, registry in model_registries.items()},
+        "timings": startup_timings
+    }
+    return body, 200 if ready.is_set() else 503
 
 @app.route('/download_model', methods=['GET'])
 def download_model():
@@ -370,8 +1051,31 @@ def download_model():
         logger.error(f"Error while downloading the model: {e}")
         return "Error while downloading the model", 500
 
-if __name__ == '__main__':
+startup_timings["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+startup_lock = threading.Lock()
+started = False
+
+def startup():
+    """Einmalige Startaufgaben: Discovery, Aufräumen, Index-Abgleich, Modelle laden, Snapshot-Abfrage.
+
+    Wird von serve.py bzw. beim direkten Start aufgerufen; weitere Aufrufe im
+    selben Prozess haben keine Wirkung.
+    """
+    global started
+    with startup_lock:
+        if started:
+            return
+        started = True
     send_mqtt_discovery()
     remove_old_locks()
     remove_old_logs()
-    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True)
+    reconcile_file_index()
+    warm_up()
+    camera_poller.start()
+
+if __name__ == '__main__':
+    # Entwicklungsserver; produktiv läuft serve.py. Ohne Reloader, sonst würden
+    # Modelle und Startaufgaben in zwei Prozessen laufen.
+    startup()
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True, use_reloader=False, threaded=True)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('keras', 'tflite')
+
+
+def tflite_path_for(model_path):
+    """Pfad des TFLite-Modells, das retrain.py neben dem Keras-Modell ablegt."""
+    return os.path.splitext(model_path)[0] + '.tflite'
+
+
+def embedding_model(model):
+    """Keras-Modell mit zwei Ausgaben: Vorhersage und Embedding vor dem Klassifikationskopf.
+
+    Voraussetzung ist ein Modell, das mit einer Dense(1)-Schicht endet (wie in
+    retrain.py); sonst None. Die Gewichte werden mit ``model`` geteilt.
+    """
+    import tensorflow as tf
+    head = model.layers[-1]
+    if len(model.layers) < 2 or not isinstance(head, tf.keras.layers.Dense) or head.units != 1:
+        return None
+    return tf.keras.Model(model.inputs, [model.output, model.layers[-2].output])
+
+
+class KerasBackend:
+    """Vorhersage mit dem vollständigen Keras-Modell."""
+
+    name = 'keras'
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(model_path)
+        self.input_shape = tuple(self.model.input_shape[1:])
+        try:
+            self._embedding_model = embedding_model(self.model)
+        except Exception as e:
+            logger.warning(f"Embeddings für Geräte-Köpfe nicht verfügbar: {e}")
+            self._embedding_model = None
+
+    @property
+    def supports_embeddings(self):
+        return self._embedding_model is not None
+
+    def predict(self, images, batch_size=None, verbose=0):
+        return self.model.predict(images, batch_size=batch_size, verbose=verbose)
+
+    def predict_with_embeddings(self, images, batch_size=None):
+        prediction, embeddings = self._embedding_model.predict(images, batch_size=batch_size, verbose=0)
+        return prediction, embeddings
+
+
+def split_outputs(output_details):
+    """Trennt die Ausgaben eines TFLite-Modells in (Vorhersage, Embedding oder None).
+
+    retrain.py exportiert beide Ausgaben; die Reihenfolge legt der Konverter
+    fest, daher wird die Vorhersage an ihrer Breite 1 erkannt.
+    """
+    prediction = next((o for o in output_details if int(o['shape'][-1]) == 1), output_details[0])
+    embedding = next((o for o in output_details if o is not prediction), None)
+    return prediction, embedding
+
+
+def _dequantize(output, details):
+    if details['dtype'] in (np.int8, np.uint8):
+        scale, zero_point = details['quantization']
+        output = (output.astype(np.float32) - zero_point) * scale
+    return output
+
+
+class TFLiteBackend:
+    """Vorhersage mit dem TFLite-Interpreter.
+
+    Verwendet ``tflite_runtime``, falls installiert, sonst ``tf.lite``. Die
+    Batchgröße des Interpreters wird bei Bedarf angepasst; quantisierte Ein- und
+    Ausgaben werden automatisch umgerechnet. Enthält das Modell zusätzlich die
+    Embeddings, stehen diese für Geräte-Köpfe zur Verfügung.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output, self._embedding = split_outputs(self.interpreter.get_output_details())
+        self._batch_size = int(self._input['shape'][0])
+        self.input_shape = tuple(int(dim) for dim in self._input['shape'][1:])
+        # Der Interpreter ist nicht threadsicher
+        self._lock = threading.Lock()
+
+    @property
+    def supports_embeddings(self):
+        return self._embedding is not None
+
+    def predict(self, images, batch_size=None, verbose=0):
+        return self._run(images)[0]
+
+    def predict_with_embeddings(self, images, batch_size=None):
+        return self._run(images, embeddings=True)
+
+    def _run(self, images, embeddings=False):
+        images = np.asarray(images, dtype=np.float32)
+        with self._lock:
+            if len(images) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], [len(images), *self.input_shape])
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output, self._embedding = split_outputs(self.interpreter.get_output_details())
+                self._batch_size = len(images)
+
+            if self._input['dtype'] in (np.int8, np.uint8):
+                scale, zero_point = self._input['quantization']
+                info = np.iinfo(self._input['dtype'])
+                images = np.clip(np.round(images / scale + zero_point), info.min, info.max)
+            self.interpreter.set_tensor(self._input['index'], images.astype(self._input['dtype']))
+            self.interpreter.invoke()
+            output = _dequantize(self.interpreter.get_tensor(self._output['index']), self._output)
+            embedding = None
+            if embeddings:
+                embedding = _dequantize(self.interpreter.get_tensor(self._embedding['index']), self._embedding)
+        return output, embedding
+
+
+def import_framework(backend='keras'):
+    """Importiert das für das Backend nötige Framework vorab und gibt die Dauer in Sekunden zurück.
+
+    Für TFLite genügt ``tflite_runtime``, falls installiert; TensorFlow wird dann
+    gar nicht geladen.
+    """
+    start = time.perf_counter()
+    if backend == 'tflite':
+        try:
+            import tflite_runtime.interpreter  # noqa: F401
+            return time.perf_counter() - start
+        except ImportError:
+            pass
+    import tensorflow  # noqa: F401
+    return time.perf_counter() - start
+
+
+def load_backend(model_path, backend='keras', num_threads=None):
+    """Lädt das Modell mit dem gewünschten Backend.
+
+    Fehlt das TFLite-Modell, wird auf Keras zurückgefallen.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unbekanntes Inferenz-Backend: {backend} (erlaubt: {', '.join(BACKENDS)})")
+
+    if backend == 'tflite':
+        tflite_path = tflite_path_for(model_path)
+        if os.path.exists(tflite_path):
+            logger.info(f"Lade TFLite-Modell von {tflite_path} ...")
+            return TFLiteBackend(tflite_path, num_threads=num_threads)
+        logger.warning(f"TFLite-Modell {tflite_path} existiert nicht, verwende Keras.")
+
+    logger.info(f"Lade Keras-Modell von {model_path} ...")
+    return KerasBackend(model_path)
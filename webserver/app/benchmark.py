@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+"""Reproduzierbare Benchmarks für Inferenz und Training.
+
+Alle Messungen laufen offline: Bilder sind synthetisch (oder stammen aus
+``--images-dir``), das Modell ist eine zufällig initialisierte Kopie der
+Architektur aus retrain.py. Die Ergebnisse werden als JSON gespeichert und
+lassen sich mit ``compare`` zwischen zwei Versionen vergleichen.
+
+Suiten:
+    preprocess  Vorverarbeitung allein: bisheriger Weg (volle Auflösung, float-Kopien) gegen den optimierten
+    latency     Einzelbild-Latenz (p50/p99) für Dekodieren, Vorverarbeitung und Vorhersage
+    throughput  Bilder pro Sekunde bei verschiedenen Batchgrößen
+    e2e         HTTP-Upload bis MQTT-Nachricht, gegen app.py und einen lokalen Ersatz-Broker
+    retrain     Trainingsdurchsatz (Bilder/s) der tf.data-Pipeline aus retrain.py und Dekodier-Durchsatz
+                nach num_parallel_calls
+    all         preprocess, latency, throughput, e2e und retrain (alle Suiten außer resolution)
+    resolution  Validierungsgenauigkeit und Latenz pro Auflösung nach kurzem Training auf dem eigenen Dataset
+                (Modell aus retrain.py mit ImageNet-Gewichten; nicht in all, da Dataset und Download nötig)
+
+Verwendung:
+    python benchmark.py preprocess --roi 0.2,0.3,0.8,1.0
+    python benchmark.py latency --resolutions 224x224,512x896 --backends keras,tflite
+    python benchmark.py throughput --batch-sizes 1,4,8,16 --roi 0.2,0.3,0.8,1.0
+    python benchmark.py resolution --resolutions 224x224,288x512,512x896 --roi 0.2,0.3,0.8,1.0
+    python benchmark.py all --output benchmark_results/vorher.json
+    python benchmark.py compare benchmark_results/vorher.json benchmark_results/nachher.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+import preprocessing
+from backends import load_backend, tflite_path_for
+
+SEED = 42
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Suiten von ``all``; ``resolution`` benötigt ein Dataset und läuft nur einzeln
+SUITES = ('preprocess', 'latency', 'throughput', 'e2e', 'retrain')
+DATASET_SUITES = ('resolution',)
+
+
+# Testdaten und Modell
+
+def synthetic_image(rng, width, height, brightness=0.5):
+    """Kamerabild-ähnliches Testbild (Verlauf mit Rauschen) als JPEG-Bytes."""
+    gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 0.08, (height, width, 3)).astype(np.float32)
+    pixels = np.clip((0.6 * brightness + 0.4 * gradient + noise) * 255, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def load_images(args, count):
+    """Bilder aus ``--images-dir`` oder synthetische Bilder in Kameraauflösung."""
+    if args.images_dir:
+        files = sorted(f for f in os.listdir(args.images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))[:count]
+        if not files:
+            raise SystemExit(f"Keine Bilder in {args.images_dir} gefunden.")
+        images = []
+        for filename in files:
+            with open(os.path.join(args.images_dir, filename), 'rb') as image_file:
+                images.append(image_file.read())
+        return images
+    rng = np.random.default_rng(SEED)
+    width, height = args.frame_size
+    return [synthetic_image(rng, width, height, brightness=rng.uniform(0.2, 0.8)) for _ in range(count)]
+
+
+def create_model(folder, img_height, img_width, roi, tflite=False):
+    """Speichert ein zufällig initialisiertes Modell mit Metadaten (und optional TFLite) in ``folder``."""
+    import tensorflow as tf
+    import retrain
+
+    tf.keras.utils.set_random_seed(SEED)
+    model, _ = retrain.build_model(img_height, img_width, weights=None)
+    meta = {"img_height": img_height, "img_width": img_width, "roi": roi, "rescale_in_model": retrain.rescales_input(model),
+            "jpeg_draft": preprocessing.JPEG_DRAFT}
+    os.makedirs(folder, exist_ok=True)
+    model_path = os.path.join(folder, 'garage_door_model.keras')
+    model.save(model_path, save_format='keras')
+    preprocessing.save_metadata(model_path, meta)
+    if tflite:
+        with open(tflite_path_for(model_path), 'wb') as tflite_file:
+            tflite_file.write(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+    return model, model_path, meta
+
+
+def summarize(seconds):
+    """p50, p99 und Mittelwert in Millisekunden."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(np.mean(ms)), 3),
+        "runs": len(ms)
+    }
+
+
+def model_variants(args, workdir):
+    """Erzeugt pro Auflösung ein Modell und liefert (Auflösung, Backend, geladenes Backend, Metadaten)."""
+    for img_height, img_width in args.resolutions:
+        folder = os.path.join(workdir, f"model_{img_height}x{img_width}")
+        _, model_path, meta = create_model(folder, img_height, img_width, args.roi, tflite='tflite' in args.backends)
+        for backend in args.backends:
+            yield f"{img_height}x{img_width}", backend, load_backend(model_path, backend, num_threads=args.threads), meta
+
+
+# Suiten
+
+def legacy_preprocess(data, meta):
+    """Bisheriger Weg: in voller Auflösung dekodieren, ausschneiden, skalieren, durch 255 teilen, Batch-Achse."""
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGB')
+    img = img.crop(preprocessing.roi_box(img.width, img.height, meta["roi"]))
+    img = img.resize((meta["img_width"], meta["img_height"]), Image.NEAREST)
+    return np.expand_dims(np.asarray(img, dtype=np.float32) / 255.0, axis=0)
+
+
+def run_preprocess(args, workdir):
+    """Mikro-Benchmark der Vorverarbeitung ohne Modell (kein TensorFlow nötig)."""
+    images = load_images(args, args.images)
+    results = []
+    for img_height, img_width in args.resolutions:
+        meta = {"img_height": img_height, "img_width": img_width, "roi": args.roi, "rescale_in_model": True,
+                "jpeg_draft": preprocessing.JPEG_DRAFT}
+        buffer = np.empty((1, img_height, img_width, 3), dtype=np.float32)
+        variants = {
+            'legacy': lambda data: legacy_preprocess(data, meta),
+            # Wie im Webserver: aus den Bytes mit draft dekodieren, in den wiederverwendeten Batchpuffer schreiben
+            'optimized': lambda data: preprocessing.to_model_input(preprocessing.load_image(data, meta), meta, out=buffer[0])
+        }
+        for variant, preprocess in variants.items():
+            times = []
+            for run in range(args.warmup + args.runs):
+                data = images[run % len(images)]
+                started = time.perf_counter()
+                preprocess(data)
+                if run >= args.warmup:
+                    times.append(time.perf_counter() - started)
+            result = {"suite": 'preprocess', "resolution": f"{img_height}x{img_width}", "variant": variant,
+                      "roi": args.roi, "total": summarize(times)}
+            print(f"preprocess {result['resolution']} {variant}: p50 {result['total']['p50_ms']:.1f} ms, "
+                  f"p99 {result['total']['p99_ms']:.1f} ms")
+            results.append(result)
+    return results
+
+
+def run_latency(args, workdir):
+    images = load_images(args, args.images)
+    results = []
+    for resolution, backend, model, meta in model_variants(args, workdir):
+        decode, preprocess, predict, total = [], [], [], []
+        for run in range(args.warmup + args.runs):
+            data = images[run % len(images)]
+            started = time.perf_counter()
+            img = preprocessing.decode_image(data, meta)
+            decoded = time.perf_counter()
+            img_array = preprocessing.to_model_input(preprocessing.prepare_image(img, meta), meta)
+            prepared = time.perf_counter()
+            model.predict(img_array[np.newaxis], batch_size=1, verbose=0)
+            finished = time.perf_counter()
+            if run >= args.warmup:
+                decode.append(decoded - started)
+                preprocess.append(prepared - decoded)
+                predict.append(finished - prepared)
+                total.append(finished - started)
+        result = {"suite": 'latency', "resolution": resolution, "backend": backend, "roi": meta["roi"],
+                  "decode": summarize(decode), "preprocess": summarize(preprocess),
+                  "predict": summarize(predict), "total": summarize(total)}
+        print(f"latency {resolution} {backend}: p50 {result['total']['p50_ms']:.1f} ms, "
+              f"p99 {result['total']['p99_ms']:.1f} ms (Vorhersage p50 {result['predict']['p50_ms']:.1f} ms)")
+        results.append(result)
+    return results
+
+
+def run_throughput(args, workdir):
+    images = load_images(args, max(args.batch_sizes))
+    results = []
+    for resolution, backend, model, meta in model_variants(args, workdir):
+        arrays = [preprocessing.load_image_array(io.BytesIO(data), meta) for data in images]
+        for batch_size in args.batch_sizes:
+            batch = np.stack([arrays[i % len(arrays)] for i in range(batch_size)])
+            times = []
+            for run in range(args.warmup + args.runs):
+                started = time.perf_counter()
+                model.predict(batch, batch_size=batch_size, verbose=0)
+                if run >= args.warmup:
+                    times.append(time.perf_counter() - started)
+            result = {"suite": 'throughput', "resolution": resolution, "backend": backend, "roi": meta["roi"],
+                      "batch_size": batch_size, "batch": summarize(times),
+                      "images_per_second": round(batch_size * len(times) / sum(times), 2)}
+            print(f"throughput {resolution} {backend} batch {batch_size}: {result['images_per_second']:.1f} Bilder/s")
+            results.append(result)
+    return results
+
+
+class StandInBroker:
+    """Minimaler MQTT-3.1.1-Broker für den End-to-End-Benchmark.
+
+    Nimmt Verbindungen und PUBLISH-Pakete an, bestätigt QoS 1 und merkt sich
+    Topic, Payload und Empfangszeitpunkt. Nachrichten werden nicht an
+    Abonnenten weitergeleitet.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.condition = threading.Condition()
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                broker._serve(self.rfile, self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _serve(self, stream, connection):
+        while True:
+            header = stream.read(1)
+            if not header:
+                return
+            length, multiplier = 0, 1
+            while True:
+                byte = stream.read(1)[0]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                if not byte & 0x80:
+                    break
+            body = stream.read(length)
+            packet_type, flags = header[0] >> 4, header[0] & 0x0F
+            if packet_type == 1:  # CONNECT
+                connection.sendall(b'\x20\x02\x00\x00')
+            elif packet_type == 3:  # PUBLISH
+                received = time.perf_counter()
+                topic_length = struct.unpack('!H', body[:2])[0]
+                topic = body[2:2 + topic_length].decode()
+                position = 2 + topic_length
+                qos = (flags >> 1) & 0x03
+                if qos:
+                    connection.sendall(b'\x40\x02' + body[position:position + 2])
+                    position += 2
+                with self.condition:
+                    self.messages.append((topic, body[position:].decode(errors='replace'), received))
+                    self.condition.notify_all()
+            elif packet_type == 8:  # SUBSCRIBE: alle Topics mit QoS 0 bestätigen
+                connection.sendall(bytes([0x90, 3]) + body[:2] + b'\x00')
+            elif packet_type == 12:  # PINGREQ
+                connection.sendall(b'\xd0\x00')
+            elif packet_type == 14:  # DISCONNECT
+                return
+
+    def wait_for(self, topic, payload, start_index, timeout):
+        """Wartet auf eine Nachricht ab ``start_index``; gibt (Index, Empfangszeitpunkt) oder None zurück."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                for index in range(start_index, len(self.messages)):
+                    if self.messages[index][0] == topic and self.messages[index][1] == payload:
+                        return index, self.messages[index][2]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+
+def calibrate_head(model, dark_array, bright_array):
+    """Stellt den Klassifikationskopf so ein, dass das helle Bild 'open' und das dunkle 'closed' ergibt.
+
+    So wechselt der Zustand bei abwechselnden Uploads jedes Mal und jeder
+    Upload erzeugt eine MQTT-Nachricht, obwohl das Backbone zufällig ist.
+    """
+    import tensorflow as tf
+
+    extractor = tf.keras.Model(model.inputs, model.layers[-2].output)
+    dark, bright = extractor.predict(np.stack([dark_array, bright_array]), verbose=0).astype(np.float64)
+    direction = bright - dark
+    scale = 12.0 / max(float(direction @ direction), 1e-12)
+    bias = -scale * float(direction @ (bright + dark)) / 2
+    model.layers[-1].set_weights([(scale * direction)[:, np.newaxis].astype(np.float32), np.array([bias], dtype=np.float32)])
+
+
+def upload(url, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"snapshot.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+
+
+def wait_until_ready(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app.py wurde mit Exit-Code {process.returncode} beendet.")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return json.loads(response.read())
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"app.py war nach {timeout} s nicht bereit.")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def run_e2e(args, workdir):
+    img_height, img_width = args.resolutions[0]
+    backend = args.backends[0]
+    rng = np.random.default_rng(SEED)
+    width, height = args.frame_size
+    dark, bright = synthetic_image(rng, width, height, 0.1), synthetic_image(rng, width, height, 0.9)
+
+    base_dir = os.path.join(workdir, 'e2e')
+    model, model_path, meta = create_model(os.path.join(base_dir, 'model'), img_height, img_width, args.roi)
+    calibrate_head(model,
+                   preprocessing.load_image_array(io.BytesIO(dark), meta),
+                   preprocessing.load_image_array(io.BytesIO(bright), meta))
+    model.save(model_path, save_format='keras')
+    if backend == 'tflite':
+        import tensorflow as tf
+        with open(tflite_path_for(model_path), 'wb') as tflite_file:
+            tflite_file.write(tf.lite.TFLiteConverter.from_keras_model(model).convert())
+
+    broker = StandInBroker()
+    port = free_port()
+    state_topic = 'benchmark/garage_door/state'
+    env = dict(
+        os.environ,
+        APP_BASE_DIR=base_dir, PORT=str(port), MQTT_HOST='127.0.0.1', MQTT_PORT=str(broker.port),
+        MQTT_USER='', MQTT_PASSWORD='', TOPIC='benchmark/garage_door', STATE_TOPIC=state_topic,
+        CONFIG_TOPIC='benchmark/garage_door/config', INFERENCE_BACKEND=backend,
+        STATE_CONFIRM_FRAMES='1', STATE_MARGIN='0', STATE_HEARTBEAT_SECONDS='0',
+        FRAME_CACHE_ENABLED='false', MODEL_POLL_SECONDS='0'
+    )
+    log_path = os.path.join(workdir, 'e2e_app.log')
+    with open(log_path, 'w') as log_file:
+        process = subprocess.Popen([sys.executable, os.path.join(APP_DIR, 'app.py')], cwd=APP_DIR, env=env,
+                                   stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        startup = wait_until_ready(f"http://127.0.0.1:{port}/ready", process, args.startup_timeout)
+        url = f"http://127.0.0.1:{port}/"
+        http_times, mqtt_times, missing = [], [], 0
+        for run in range(args.warmup + args.uploads):
+            # Abwechselnd dunkel (closed) und hell (open): jeder Upload ändert den Zustand
+            data, expected = (bright, 'open') if run % 2 else (dark, 'closed')
+            start_index = len(broker.messages)
+            started = time.perf_counter()
+            upload(url, data)
+            responded = time.perf_counter()
+            received = broker.wait_for(state_topic, expected, start_index, timeout=10)
+            if run < args.warmup:
+                continue
+            http_times.append(responded - started)
+            if received is None:
+                missing += 1
+            else:
+                mqtt_times.append(received[1] - started)
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+        broker.stop()
+
+    result = {"suite": 'e2e', "resolution": f"{img_height}x{img_width}", "backend": backend, "roi": meta["roi"],
+              "http": summarize(http_times), "upload_to_mqtt": summarize(mqtt_times) if mqtt_times else None,
+              "missing_mqtt": missing, "startup": startup.get("timings", startup)}
+    if mqtt_times:
+        print(f"e2e {result['resolution']} {backend}: Upload bis MQTT p50 {result['upload_to_mqtt']['p50_ms']:.1f} ms, "
+              f"p99 {result['upload_to_mqtt']['p99_ms']:.1f} ms, {missing} ohne MQTT-Nachricht")
+    else:
+        print(f"e2e: keine MQTT-Nachricht empfangen, siehe {log_path}")
+    return [result]
+
+
+def decode_throughput(retrain, samples, meta, parallel_calls):
+    """Bilder/s der Dekodier-Stufe von retrain.build_dataset (ohne Cache und Training) pro num_parallel_calls."""
+    import tensorflow as tf
+
+    rates = {}
+    for calls in parallel_calls:
+        dataset = retrain.build_dataset(samples, meta, 32, parallel_calls=tf.data.AUTOTUNE if calls == 'autotune' else int(calls))
+        # Aufwärmen: Tracing der Pipeline nicht mitmessen
+        for _ in dataset.take(1):
+            pass
+        started = time.perf_counter()
+        for _ in dataset:
+            pass
+        rates[str(calls)] = round(len(samples) / (time.perf_counter() - started), 2)
+    return rates
+
+
+def run_retrain(args, workdir):
+    import tensorflow as tf
+    import retrain
+
+    rng = np.random.default_rng(SEED)
+    width, height = args.frame_size
+    samples = []
+    for label, name in enumerate(['closed', 'open']):
+        folder = os.path.join(workdir, 'dataset', name)
+        os.makedirs(folder, exist_ok=True)
+        for i in range(args.train_images):
+            path = os.path.join(folder, f"{i:05d}.jpg")
+            with open(path, 'wb') as image_file:
+                image_file.write(synthetic_image(rng, width, height, brightness=0.3 + 0.4 * label))
+            samples.append((path, label))
+
+    results = []
+    for img_height, img_width in args.resolutions:
+        tf.keras.utils.set_random_seed(SEED)
+        model, _ = retrain.build_model(img_height, img_width, weights=None)
+        meta = {"img_height": img_height, "img_width": img_width, "roi": args.roi, "rescale_in_model": retrain.rescales_input(model),
+                "jpeg_draft": preprocessing.JPEG_DRAFT}
+        decode = decode_throughput(retrain, samples, meta, args.decode_parallel_calls)
+        epoch_times = []
+
+        class EpochTimer(tf.keras.callbacks.Callback):
+            def on_epoch_begin(self, epoch, logs=None):
+                self.started = time.perf_counter()
+
+            def on_epoch_end(self, epoch, logs=None):
+                epoch_times.append(time.perf_counter() - self.started)
+
+        dataset = retrain.build_dataset(samples, meta, 32, training=True, cache='')
+        model.fit(dataset, epochs=args.epochs, verbose=0, callbacks=[EpochTimer()])
+        images_per_second = [len(samples) / seconds for seconds in epoch_times]
+        result = {"suite": 'retrain', "resolution": f"{img_height}x{img_width}", "roi": args.roi,
+                  "images": len(samples), "epochs": args.epochs,
+                  "epoch_seconds": [round(seconds, 3) for seconds in epoch_times],
+                  # Die erste Epoche dekodiert die JPEGs, danach kommen die Bilder aus dem Cache
+                  "first_epoch_images_per_second": round(images_per_second[0], 2),
+                  "cached_images_per_second": round(float(np.mean(images_per_second[1:])), 2) if len(images_per_second) > 1 else None,
+                  "decode_images_per_second": decode}
+        print(f"retrain {result['resolution']}: erste Epoche {result['first_epoch_images_per_second']:.1f} Bilder/s, "
+              f"danach {result['cached_images_per_second'] or 0:.1f} Bilder/s, Dekodieren "
+              + ', '.join(f"{calls}: {rate:.1f}" for calls, rate in decode.items()) + " Bilder/s")
+        results.append(result)
+    return results
+
+
+def run_resolution(args, workdir):
+    """Trainiert das Modell aus retrain.py pro Auflösung kurz auf dem Dataset und misst Genauigkeit und Latenz."""
+    import tensorflow as tf
+    import retrain
+
+    training_samples, validation_samples = retrain.split_dataset(dataset_folder=args.dataset_dir)
+    if not training_samples or not validation_samples:
+        raise SystemExit(f"Dataset in {args.dataset_dir} zu klein für Training und Validierung.")
+    weights = None if args.weights == 'none' else args.weights
+
+    results = []
+    for img_height, img_width in args.resolutions:
+        tf.keras.utils.set_random_seed(SEED)
+        model, _ = retrain.build_model(img_height, img_width, weights=weights)
+        meta = {"img_height": img_height, "img_width": img_width, "roi": args.roi, "rescale_in_model": retrain.rescales_input(model),
+                "jpeg_draft": preprocessing.JPEG_DRAFT}
+        started = time.perf_counter()
+        model.fit(retrain.build_dataset(training_samples, meta, 32, training=True, cache=''), epochs=args.epochs, verbose=0)
+        train_seconds = time.perf_counter() - started
+        _, accuracy = model.evaluate(retrain.build_dataset(validation_samples, meta, 32), verbose=0)
+
+        # Latenz der Vorhersage für Einzelbilder aus dem Validierungsset, vorverarbeitet wie im Webserver
+        predict = []
+        for run in range(args.warmup + args.runs):
+            img_array = retrain.load_sample(validation_samples[run % len(validation_samples)][0], meta)
+            started = time.perf_counter()
+            model.predict(img_array, batch_size=1, verbose=0)
+            if run >= args.warmup:
+                predict.append(time.perf_counter() - started)
+        result = {"suite": 'resolution', "resolution": f"{img_height}x{img_width}", "roi": args.roi,
+                  "weights": args.weights, "images": len(training_samples) + len(validation_samples), "epochs": args.epochs,
+                  "train_seconds": round(train_seconds, 3), "val_accuracy": round(float(accuracy), 4),
+                  "predict": summarize(predict)}
+        print(f"resolution {result['resolution']}: Val_Accuracy {result['val_accuracy']:.3f}, "
+              f"p50 {result['predict']['p50_ms']:.1f} ms, p99 {result['predict']['p99_ms']:.1f} ms")
+        results.append(result)
+    return results
+
+
+RUNNERS = {'preprocess': run_preprocess, 'latency': run_latency, 'throughput': run_throughput, 'e2e': run_e2e, 'retrain': run_retrain,
+           'resolution': run_resolution}
+
+
+# Ergebnisse
+
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()}
+    if 'tensorflow' in sys.modules:
+        info["tensorflow"] = sys.modules['tensorflow'].__version__
+    try:
+        info["git_commit"] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                                            text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        info["git_commit"] = None
+    return info
+
+
+def flatten(result, prefix=''):
+    """Numerische Messwerte eines Ergebnisses als {Name: Wert}."""
+    values = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ('batch_size', 'runs', 'images', 'epochs'):
+            values[name] = value
+    return values
+
+
+def result_key(result):
+    parts = [result["suite"], result.get("resolution"), result.get("backend"), result.get("variant")]
+    if "batch_size" in result:
+        parts.append(f"batch {result['batch_size']}")
+    return ' '.join(str(part) for part in parts if part)
+
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path) as baseline_file:
+        baseline = {result_key(r): flatten(r) for r in json.load(baseline_file)["results"]}
+    with open(candidate_path) as candidate_file:
+        candidate = {result_key(r): flatten(r) for r in json.load(candidate_file)["results"]}
+    print(f"{'Messung':<40} {'Wert':<32} {'vorher':>12} {'nachher':>12} {'Änderung':>10}")
+    for key in sorted(set(baseline) & set(candidate)):
+        for name in sorted(set(baseline[key]) & set(candidate[key])):
+            before, after = baseline[key][name], candidate[key][name]
+            change = f"{(after - before) / before * 100:+.1f} %" if before else '-'
+            print(f"{key:<40} {name:<32} {before:>12.3f} {after:>12.3f} {change:>10}")
+    for key in sorted(set(baseline) ^ set(candidate)):
+        print(f"{key:<40} nur in {'vorher' if key in baseline else 'nachher'}")
+
+
+def parse_resolutions(value):
+    return [tuple(int(part) for part in item.lower().split('x')) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('suite', choices=SUITES + DATASET_SUITES + ('all', 'compare'))
+    parser.add_argument('files', nargs='*', help="Für compare: vorher.json nachher.json")
+    parser.add_argument('--resolutions', type=parse_resolutions, default=parse_resolutions('224x224,512x896'),
+                        help="Modellauflösungen als HÖHExBREITE, kommagetrennt")
+    parser.add_argument('--roi', type=preprocessing.parse_roi, default=preprocessing.parse_roi(os.environ.get('ROI', '')),
+                        help="ROI als x0,y0,x1,y1 (Anteile)")
+    parser.add_argument('--backends', type=lambda value: value.split(','), default=['keras'], help="keras und/oder tflite")
+    parser.add_argument('--threads', type=int, default=None, help="Threads für den TFLite-Interpreter")
+    parser.add_argument('--batch-sizes', type=lambda value: [int(v) for v in value.split(',')], default=[1, 4, 8, 16])
+    parser.add_argument('--frame-size', type=lambda value: tuple(int(v) for v in value.lower().split('x')), default=(1920, 1080),
+                        help="Größe der synthetischen Kamerabilder als BREITExHÖHE")
+    parser.add_argument('--images-dir', default='', help="Eigene Beispielbilder statt synthetischer Bilder")
+    parser.add_argument('--images', type=int, default=20, help="Anzahl verschiedener Bilder für preprocess und latency")
+    parser.add_argument('--runs', type=int, default=50, help="Messungen pro Variante")
+    parser.add_argument('--warmup', type=int, default=5, help="Nicht gemessene Aufwärmläufe")
+    parser.add_argument('--uploads', type=int, default=50, help="Uploads für e2e")
+    parser.add_argument('--startup-timeout', type=float, default=300, help="Maximale Startzeit von app.py für e2e")
+    parser.add_argument('--train-images', type=int, default=64, help="Bilder pro Klasse für retrain")
+    parser.add_argument('--epochs', type=int, default=3, help="Epochen für retrain und resolution")
+    parser.add_argument('--dataset-dir', default=os.path.join(os.environ.get('APP_BASE_DIR', '/app'), 'dataset'),
+                        help="Dataset mit open/ und closed/ für resolution")
+    parser.add_argument('--weights', default='imagenet', help="Startgewichte für resolution: imagenet oder none")
+    parser.add_argument('--decode-parallel-calls', type=lambda value: value.split(','), default=['1', '2', '4', 'autotune'],
+                        help="num_parallel_calls für den Dekodier-Durchsatz in retrain, kommagetrennt")
+    parser.add_argument('--output', default='', help="Ergebnisdatei (Standard: benchmark_results/<suite>_<zeit>.json)")
+    parser.add_argument('--keep-workdir', action='store_true', help="Temporäre Modelle und Bilder nicht löschen")
+    args = parser.parse_args()
+
+    if args.suite == 'compare':
+        if len(args.files) != 2:
+            parser.error("compare benötigt zwei Ergebnisdateien.")
+        compare(*args.files)
+        return
+    unknown = set(args.backends) - {'keras', 'tflite'}
+    if unknown:
+        parser.error(f"Unbekanntes Backend: {', '.join(unknown)}")
+
+    suites = SUITES if args.suite == 'all' else (args.suite,)
+    workdir = tempfile.mkdtemp(prefix='garage_benchmark_')
+    results = []
+    try:
+        for suite in suites:
+            results.extend(RUNNERS[suite](args, workdir))
+    finally:
+        if args.keep_workdir:
+            print(f"Arbeitsverzeichnis: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join('benchmark_results', f"{args.suite}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key not in ('files', 'output', 'keep_workdir')}
+    with open(output, 'w') as output_file:
+        json.dump({"suite": args.suite, "timestamp": datetime.now().isoformat(timespec='seconds'),
+                   "environment": environment(), "config": config, "results": results}, output_file, indent=2)
+    print(f"Ergebnisse gespeichert unter {output}")
+
+
+if __name__ == '__main__':
+    main()
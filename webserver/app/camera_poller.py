@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Holt Snapshots der Kameras selbst ab, statt auf Uploads zu warten.
+
+Alle Kameras werden gleichzeitig in einer asyncio-Schleife in einem eigenen
+Thread abgefragt. Eine gemeinsame aiohttp-Session hält die Verbindungen zu den
+Kameras offen.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Camera:
+    """Snapshot-Quelle eines Geräts mit eigenem Intervall und Timeout (Sekunden)."""
+
+    def __init__(self, camera_id, url, interval=60, active_interval=10, timeout=10):
+        self.id = camera_id
+        self.url = url
+        self.interval = interval
+        self.active_interval = active_interval
+        self.timeout = timeout
+
+
+class CameraPoller:
+    """Fragt die Snapshot-URLs aller Kameras ab und übergibt die Bilder an ``handle_frame``.
+
+    Pro Kamera gilt ``interval`` im Ruhezustand und ``active_interval``, solange
+    ``is_active(camera)`` True liefert (z. B. kurz nach einem Zustandswechsel).
+    Nach fehlgeschlagenen Abrufen verdoppelt sich der Abstand bis höchstens
+    ``max_backoff``. ``handle_frame(camera, data)`` läuft in einem Thread-Pool,
+    damit Vorhersagen die Abfragen der anderen Kameras nicht aufhalten.
+    """
+
+    def __init__(self, cameras, handle_frame, is_active=None, max_backoff=300, max_connections=10):
+        self.cameras = list(cameras)
+        self.handle_frame = handle_frame
+        self.is_active = is_active or (lambda camera: False)
+        self.max_backoff = max_backoff
+        self.max_connections = max_connections
+        # Ohne URL, da sie Zugangsdaten enthalten kann
+        self._status = {camera.id: {
+            "frames": 0,
+            "failures": 0,
+            "last_success": None,
+            "last_error": None,
+            "next_poll_seconds": None
+        } for camera in self.cameras}
+        self._status_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.cameras)), thread_name_prefix='camera-frame')
+        self._loop = None
+        self._stopping = None
+        self._thread = None
+
+    def start(self):
+        """Startet den Hintergrund-Thread, falls Kameras konfiguriert sind."""
+        if not self.cameras or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name='camera-poller', daemon=True)
+        self._thread.start()
+        logger.info(f"Snapshot-Abfrage für {len(self.cameras)} Kamera(s) gestartet.")
+
+    def stop(self, timeout=10):
+        """Beendet alle Abfragen und wartet auf den Thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def status(self):
+        """Abrufstatistik pro Kamera."""
+        with self._status_lock:
+            return {camera_id: dict(status) for camera_id, status in self._status.items()}
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        # Begrenzter Verbindungspool; Keep-Alive-Verbindungen werden zwischen den Abrufen wiederverwendet
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(self._poll(session, camera) for camera in self.cameras))
+
+    async def _poll(self, session, camera):
+        failures = 0
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            interval = camera.active_interval if self.is_active(camera) else camera.interval
+            try:
+                data = await self._fetch(session, camera)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                failures += 1
+                # Nur der Statuscode, die Fehlermeldung von aiohttp enthält die URL
+                error = f"HTTP {e.status}" if isinstance(e, aiohttp.ClientResponseError) else str(e) or type(e).__name__
+                reason = 'timeout' if isinstance(e, asyncio.TimeoutError) else 'error'
+                metrics.SNAPSHOT_FAILURES.labels(camera=camera.id, reason=reason).inc()
+                delay = min(interval * 2 ** failures, max(self.max_backoff, interval))
+                logger.warning(f"Snapshot von {camera.id} fehlgeschlagen ({failures}x): {error}. Nächster Versuch in {delay:.0f} s.")
+                self._update_status(camera, failures=failures, last_error=error, next_poll_seconds=delay)
+                await self._sleep(delay)
+                continue
+
+            if failures:
+                logger.info(f"Snapshot von {camera.id} nach {failures} Fehlversuch(en) wieder erreichbar.")
+            failures = 0
+            metrics.SNAPSHOT_FETCH_SECONDS.labels(camera=camera.id).observe(time.monotonic() - started)
+            try:
+                await self._loop.run_in_executor(self._executor, self.handle_frame, camera, data)
+            except Exception as e:
+                logger.error(f"Snapshot von {camera.id} konnte nicht ausgewertet werden: {e}")
+
+            # Intervall nach der Auswertung neu bestimmen, damit ein eben erkannter Wechsel sofort zählt
+            interval = camera.active_interval if self.is_active(camera) else camera.interval
+            with self._status_lock:
+                self._status[camera.id]["frames"] += 1
+            self._update_status(camera, failures=0, last_success=time.time(), next_poll_seconds=interval)
+            await self._sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def _fetch(self, session, camera):
+        async with session.get(camera.url, timeout=aiohttp.ClientTimeout(total=camera.timeout)) as response:
+            response.raise_for_status()
+            data = await response.read()
+        if not data:
+            raise ValueError("Leere Antwort")
+        return data
+
+    async def _sleep(self, seconds):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def _update_status(self, camera, **values):
+        with self._status_lock:
+            self._status[camera.id].update(values)
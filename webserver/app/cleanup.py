@@ -2,13 +2,18 @@
 import os
 import time
 import logging
+from file_index import FileIndex, dataset_folders
+import thumbnails
 
 # Konfiguration
-UPLOAD_FOLDER = '/app/static/uploads'
-DATASET_FOLDER = '/app/dataset'
+BASE_DIR = os.getenv('APP_BASE_DIR', '/app')
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbs')
+DATASET_FOLDER = os.path.join(BASE_DIR, 'dataset')
 DAYS_TO_KEEP_UNCAT = int(os.environ.get('DAYS_TO_KEEP_UNCAT', 1))
 DAYS_TO_KEEP_DATASET = int(os.environ.get('DAYS_TO_KEEP_DATASET', 30))
-LOG_FILE = '/app/cleanup.log'
+LOG_FILE = os.path.join(BASE_DIR, 'cleanup.log')
+FILE_INDEX_PATH = os.getenv('FILE_INDEX_PATH', os.path.join(BASE_DIR, 'file_index.sqlite'))
 
 # Logging konfigurieren
 logging.basicConfig(
@@ -20,29 +25,34 @@ logging.basicConfig(
     ]
 )
 
-def cleanup_old_files(folder, days):
-    """Löscht Dateien, die älter als die angegebene Anzahl von Tagen sind."""
-    now = time.time()
-    cutoff = now - (days * 86400)  # 86400 Sekunden = 1 Tag
-    for filename in os.listdir(folder):
-        file_path = os.path.join(folder, filename)
-        if os.path.isfile(file_path):
-            file_mtime = os.path.getmtime(file_path)
-            if file_mtime < cutoff:
-                logging.info(f"Lösche Datei: {file_path}")
-                os.remove(file_path)
+def cleanup_old_files(file_index, folder, kind, label, days):
+    """Löscht Dateien, die älter als die angegebene Anzahl von Tagen sind.
+
+    Die Auswahl erfolgt über den Datei-Index (Zeitstempel = mtime), nicht per
+    getmtime auf jede Datei. Vorher wird der Index mit dem Ordner abgeglichen.
+    """
+    cutoff = time.time() - (days * 86400)  # 86400 Sekunden = 1 Tag
+    file_index.reconcile(folder, kind, label)
+    for file_path in file_index.delete_files(kind, label, until=cutoff):
+        logging.info(f"Datei gelöscht: {file_path}")
+        if kind == 'upload':
+            thumbnails.remove_thumbnail(THUMBNAIL_FOLDER, os.path.basename(file_path))
 
 
 def cleanup():
     """Führt den vollständigen Cleanup-Prozess aus."""
+    file_index = FileIndex(FILE_INDEX_PATH)
+
     # Cleanup für nicht kategorisierte Bilder
     logging.info("Starte Cleanup für nicht kategorisierte Bilder...")
-    cleanup_old_files(UPLOAD_FOLDER, DAYS_TO_KEEP_UNCAT)
+    cleanup_old_files(file_index, UPLOAD_FOLDER, 'upload', None, DAYS_TO_KEEP_UNCAT)
 
     # Cleanup für kategorisierte Bilder im Dataset
     logging.info("Starte Cleanup für Dataset...")
-    cleanup_old_files(os.path.join(DATASET_FOLDER, 'open'), DAYS_TO_KEEP_DATASET)
-    cleanup_old_files(os.path.join(DATASET_FOLDER, 'closed'), DAYS_TO_KEEP_DATASET)
+    for label in ('open', 'closed'):
+        # Gemeinsames Dataset und Datasets der Geräte-Köpfe
+        for folder in dataset_folders(DATASET_FOLDER, label):
+            cleanup_old_files(file_index, folder, 'dataset', label, DAYS_TO_KEEP_DATASET)
 
 
 if __name__ == "__main__":
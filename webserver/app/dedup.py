@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import shutil
+
+from frame_cache import frame_signature, hash_distance
+
+logger = logging.getLogger(__name__)
+
+
+def content_name(data, extension='.jpg'):
+    """Dateiname aus dem SHA-1 des Inhalts; identische Bilder ergeben denselben Namen.
+
+    Für Dateien auf der Platte liefert ``file_index.content_hash`` denselben Hash.
+    """
+    return hashlib.sha1(data).hexdigest() + extension
+
+
+def phash_hex(dhash):
+    return f"{dhash:016x}"
+
+
+def image_phash(path):
+    """Difference-Hash eines Bildes als Hex-String (derselbe Hash wie im Frame-Cache)."""
+    return phash_hex(frame_signature(path)[0])
+
+
+def find_near_duplicate(phash, entries, max_distance):
+    """Erster Eintrag, dessen Hash höchstens ``max_distance`` Bits von ``phash`` abweicht, sonst None."""
+    value = int(phash, 16)
+    for entry in entries:
+        if entry.get("phash") and hash_distance(value, int(entry["phash"], 16)) <= max_distance:
+            return entry
+    return None
+
+
+def ensure_phashes(file_index, entries):
+    """Berechnet fehlende Hashes (z. B. für Bilder von vor der Deduplizierung) und speichert sie im Index."""
+    for entry in entries:
+        if not entry.get("phash"):
+            try:
+                entry["phash"] = image_phash(entry["path"])
+                file_index.set_phash(entry["path"], entry["phash"])
+            except Exception as e:
+                logger.warning(f"Hash für {entry['path']} nicht berechenbar: {e}")
+    return entries
+
+
+def collapse_near_duplicates(file_index, label, max_distance, dry_run=False):
+    """Fasst nahezu identische Dataset-Bilder einer Klasse zusammen.
+
+    Die Bilder werden chronologisch durchlaufen; ein Bild wird gelöscht, wenn es
+    einem bereits behaltenen Bild im selben Ordner gleicht (die Datasets der
+    Geräte-Köpfe bleiben getrennt). Gibt die Pfade der (bei ``dry_run``
+    nur gefundenen) Duplikate zurück.
+    """
+    entries = ensure_phashes(file_index, file_index.query('dataset', label))
+    kept, duplicates = {}, []
+    for entry in entries:
+        folder_kept = kept.setdefault(os.path.dirname(entry["path"]), [])
+        if entry.get("phash") and find_near_duplicate(entry["phash"], folder_kept, max_distance):
+            duplicates.append(entry["path"])
+        else:
+            folder_kept.append(entry)
+    if not dry_run:
+        for path in duplicates:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        file_index.remove(duplicates)
+    return duplicates
+
+
+def link_or_copy(source, folder):
+    """Legt ``source`` per Hardlink in ``folder`` ab; kopiert nur, wenn das Dateisystem keine Links erlaubt."""
+    dest = os.path.join(folder, os.path.basename(source))
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy(source, dest)
+    return dest
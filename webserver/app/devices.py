@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Geräte-Registry für mehrere Kameras bzw. Tore in einem Prozess.
+
+Jedes Gerät hat eigene MQTT-Topics, eine eigene Discovery-Konfiguration, einen
+eigenen Zustand und ein eigenes letztes Bild. Alle Geräte teilen sich ein
+geladenes Backbone; ein Gerät mit eigenem ``model`` erhält einen eigenen Kopf
+darauf (siehe ``heads``).
+
+Beispiel für ``devices.json``::
+
+    [
+        {"id": "garage_left", "name": "Garage links"},
+        {"id": "garage_right", "name": "Garage rechts", "model": "right"}
+    ]
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Modellname des Standardmodells (model/garage_door_model.keras)
+DEFAULT_MODEL = 'default'
+# IDs und Modellnamen werden als Ordnernamen und in Topics verwendet
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+DEVICE_FIELDS = ('id', 'name', 'sensor_name', 'unique_id', 'state_topic', 'config_topic', 'model',
+                 'hardware_model', 'manufacturer', 'snapshot_url', 'snapshot_interval', 'snapshot_active_interval',
+                 'snapshot_timeout')
+
+
+class Device:
+    """Eine Kamera bzw. ein Tor mit eigenem Binärsensor in Home Assistant.
+
+    Mit ``snapshot_url`` holt der Server die Bilder selbst ab; Intervalle und
+    Timeout ohne Angabe kommen aus den Umgebungsvariablen.
+    """
+
+    def __init__(self, device_id, name='', sensor_name='', unique_id=None, state_topic='', config_topic='',
+                 model=DEFAULT_MODEL, hardware_model='', manufacturer='', snapshot_url='', snapshot_interval=None,
+                 snapshot_active_interval=None, snapshot_timeout=None):
+        self.id = device_id
+        self.name = name or device_id
+        self.sensor_name = sensor_name or self.name
+        self.unique_id = device_id if unique_id is None else unique_id
+        self.state_topic = state_topic or f"homeassistant/binary_sensor/{device_id}/state"
+        self.config_topic = config_topic or f"homeassistant/binary_sensor/{device_id}/config"
+        self.model = model or DEFAULT_MODEL
+        self.hardware_model = hardware_model
+        self.manufacturer = manufacturer
+        self.snapshot_url = snapshot_url
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_active_interval = snapshot_active_interval
+        self.snapshot_timeout = snapshot_timeout
+
+    def config_payload(self, availability_topic=''):
+        """Discovery-Konfiguration für Home Assistant."""
+        payload = {
+            "name": self.sensor_name,
+            "state_topic": self.state_topic,
+            "payload_on": "open",
+            "payload_off": "closed",
+            "device_class": "door",
+            "unique_id": self.unique_id,
+            "device": {
+                "identifiers": [self.unique_id],
+                "name": self.name,
+                "model": self.hardware_model,
+                "manufacturer": self.manufacturer
+            }
+        }
+        if availability_topic:
+            payload["availability_topic"] = availability_topic
+        return payload
+
+    def info(self):
+        return {"id": self.id, "name": self.name, "state_topic": self.state_topic, "model": self.model,
+                "snapshot_url": bool(self.snapshot_url)}
+
+
+class DeviceRegistry:
+    """Alle konfigurierten Geräte; das erste Gerät ist der Standard für Anfragen ohne ``device``."""
+
+    def __init__(self, devices):
+        if not devices:
+            raise ValueError("Mindestens ein Gerät erforderlich.")
+        self._devices = {}
+        for device in devices:
+            if not NAME_PATTERN.match(device.id):
+                raise ValueError(f"Ungültige Geräte-ID '{device.id}' (erlaubt: Buchstaben, Ziffern, _ und -)")
+            if not NAME_PATTERN.match(device.model):
+                raise ValueError(f"Ungültiger Modellname '{device.model}' für Gerät {device.id}")
+            if device.id in self._devices:
+                raise ValueError(f"Geräte-ID '{device.id}' ist mehrfach vergeben.")
+            self._devices[device.id] = device
+        self.default = devices[0]
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get(self, device_id=None):
+        """Gerät zur ID, ohne ID das Standardgerät. Wirft KeyError für unbekannte IDs."""
+        if not device_id:
+            return self.default
+        return self._devices[device_id]
+
+    def models(self):
+        """Namen der verwendeten Modelle in der Reihenfolge der Geräte."""
+        return list(dict.fromkeys(device.model for device in self))
+
+    def using_model(self, model):
+        return [device for device in self if device.model == model]
+
+
+def load_devices(path, fallback):
+    """Lädt die Geräte aus einer JSON-Datei (Liste oder ``{"devices": [...]}``).
+
+    Existiert die Datei nicht, wird nur ``fallback`` verwendet, das Gerät aus
+    den bisherigen Umgebungsvariablen.
+    """
+    try:
+        with open(path, 'r') as devices_file:
+            config = json.load(devices_file)
+    except FileNotFoundError:
+        return DeviceRegistry([fallback])
+
+    entries = config.get("devices", []) if isinstance(config, dict) else config
+    devices = []
+    for entry in entries:
+        unknown = set(entry) - set(DEVICE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unbekannte Felder in {path}: {', '.join(sorted(unknown))}")
+        if not entry.get("id"):
+            raise ValueError(f"Gerät ohne 'id' in {path}")
+        device_id = entry.pop("id")
+        devices.append(Device(device_id, **entry))
+    logger.info(f"{len(devices)} Geräte aus {path} geladen.")
+    return DeviceRegistry(devices)
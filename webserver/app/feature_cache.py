@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+def backbone_key(weights, meta):
+    """Schlüssel für Backbone-Gewichte und Vorverarbeitung.
+
+    Ändern sich die Gewichte (z. B. nach einer Feinjustierung), Auflösung/ROI
+    oder das verkleinerte JPEG-Dekodieren (``jpeg_draft``, liefert andere Pixel),
+    entsteht ein neuer Schlüssel und damit ein leerer Cache.
+    """
+    digest = hashlib.sha1(json.dumps({
+        "img_height": meta["img_height"],
+        "img_width": meta["img_width"],
+        "roi": meta["roi"],
+        "jpeg_draft": meta.get("jpeg_draft", False)
+    }, sort_keys=True).encode())
+    for weight in weights:
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class FeatureCache:
+    """Speichert Backbone-Embeddings pro Bildinhalt als .npy-Dateien.
+
+    Der Cache liegt unter ``<folder>/<backbone_key>/<inhalts-hash>.npy`` (Hash
+    wie im Datei-Index, ``file_index.content_hash``). Da jedes
+    Bild einzeln über seinen Inhalt adressiert wird, müssen nach neuen Bildern
+    im Dataset nur deren Embeddings berechnet werden.
+    """
+
+    def __init__(self, folder, key):
+        self.root = folder
+        self.folder = os.path.join(folder, key)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, content_hash):
+        return os.path.join(self.folder, f"{content_hash}.npy")
+
+    def get(self, content_hash):
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, content_hash, embedding):
+        path = self._path(content_hash)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as embedding_file:
+            np.save(embedding_file, np.asarray(embedding, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+    def prune(self, keep_hashes):
+        """Entfernt Embeddings nicht mehr vorhandener Bilder und Caches anderer Backbones.
+
+        Gibt die Anzahl entfernter Embeddings zurück.
+        """
+        removed = 0
+        for entry in os.listdir(self.folder):
+            if entry.endswith('.npy') and entry[:-4] not in keep_hashes:
+                os.remove(os.path.join(self.folder, entry))
+                removed += 1
+        for entry in os.listdir(self.root):
+            path = os.path.join(self.root, entry)
+            if path != self.folder and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        return removed
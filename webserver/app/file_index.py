@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    label TEXT,
+    filename TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT,
+    predicted_class TEXT,
+    probability REAL,
+    updated REAL,
+    phash TEXT,
+    device TEXT
+);
+CREATE INDEX IF NOT EXISTS files_kind_timestamp ON files (kind, timestamp);
+CREATE INDEX IF NOT EXISTS files_kind_label_timestamp ON files (kind, label, timestamp);
+CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash);
+"""
+
+def content_hash(path):
+    """SHA-1 des Dateiinhalts; derselbe Wert wie der Dateiname von Uploads (``dedup.content_name``).
+
+    Gemeinsamer Inhalts-Hash für Datei-Index und Embedding-Cache: gleiche Bilder
+    ergeben unabhängig vom Namen denselben Schlüssel.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dataset_folders(dataset_folder, label):
+    """Ordner einer Klasse: das gemeinsame Dataset und die Datasets der Geräte-Modelle (models/<name>/<label>)."""
+    folders = [os.path.join(dataset_folder, label)]
+    models_folder = os.path.join(dataset_folder, 'models')
+    if os.path.isdir(models_folder):
+        folders += [os.path.join(models_folder, name, label) for name in sorted(os.listdir(models_folder))
+                    if os.path.isdir(os.path.join(models_folder, name, label))]
+    return folders
+
+
+class FileIndex:
+    """SQLite-Index über hochgeladene Bilder und Dataset-Bilder.
+
+    Ersetzt wiederholte ``os.listdir``/``getmtime``-Scans: Galerie, Cleanup und
+    Dataset-Verwaltung lesen Dateiname, Zeitstempel (mtime), Größe, Label,
+    Vorhersage und Inhalts-Hash aus dem Index. ``kind`` ist ``upload`` oder
+    ``dataset``, ``label`` bei Dataset-Bildern ``open`` oder ``closed``,
+    ``device`` das Gerät, von dem ein Upload stammt. Der
+    Webserver und cleanup.py (Cron) greifen gleichzeitig zu, daher WAL-Modus
+    und eine Verbindung pro Thread.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+            # Später hinzugekommene Spalten nachrüsten: 'updated' (letzte Änderung, z. B. Labeln), 'phash' (Difference-Hash),
+            # 'device' (Gerät des Uploads)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(files)")}
+            if 'updated' not in columns:
+                connection.execute("ALTER TABLE files ADD COLUMN updated REAL")
+                connection.execute("UPDATE files SET updated = timestamp")
+            if 'phash' not in columns:
+                connection.execute("ALTER TABLE files ADD COLUMN phash TEXT")
+            if 'device' not in columns:
+                connection.execute("ALTER TABLE files ADD COLUMN device TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS files_kind_updated ON files (kind, updated)")
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def add(self, path, kind, label=None, timestamp=None, size=None, file_hash=None, hash_file=True, device=None):
+        """Nimmt eine Datei auf oder aktualisiert ihren Eintrag; fehlende Werte werden aus der Datei gelesen.
+
+        Ein bekanntes Gerät bleibt erhalten, wenn ``device`` fehlt.
+        """
+        if timestamp is None or size is None:
+            stat = os.stat(path)
+            timestamp = stat.st_mtime if timestamp is None else timestamp
+            size = stat.st_size if size is None else size
+        if file_hash is None and hash_file:
+            file_hash = content_hash(path)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO files (path, kind, label, filename, timestamp, size, content_hash, updated, device) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET kind = excluded.kind, label = excluded.label, filename = excluded.filename, "
+                "timestamp = excluded.timestamp, size = excluded.size, content_hash = excluded.content_hash, updated = excluded.updated, "
+                "device = COALESCE(excluded.device, files.device)",
+                (path, kind, label, os.path.basename(path), timestamp, size, file_hash, time.time(), device)
+            )
+
+    def set_prediction(self, path, predicted_class, probability):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE files SET predicted_class = ?, probability = ? WHERE path = ?",
+                (predicted_class, probability, path)
+            )
+
+    def set_phash(self, path, phash):
+        with self._connect() as connection:
+            connection.execute("UPDATE files SET phash = ? WHERE path = ?", (phash, path))
+
+    def find_by_hash(self, file_hash, kind=None):
+        """Einträge mit identischem Inhalt."""
+        sql, params = "SELECT * FROM files WHERE content_hash = ?", [file_hash]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def move(self, old_path, new_path, kind, label=None):
+        """Überträgt den Eintrag nach einem Verschieben; Zeitstempel, Hash und Vorhersage bleiben erhalten."""
+        with self._connect() as connection:
+            if new_path != old_path:
+                connection.execute("DELETE FROM files WHERE path = ?", (new_path,))
+            updated = connection.execute(
+                "UPDATE files SET path = ?, kind = ?, label = ?, filename = ?, updated = ? WHERE path = ?",
+                (new_path, kind, label, os.path.basename(new_path), time.time(), old_path)
+            ).rowcount
+        if not updated:
+            self.add(new_path, kind, label)
+
+    def remove(self, paths):
+        """Entfernt Einträge; ``paths`` ist ein Pfad oder eine Liste von Pfaden."""
+        if isinstance(paths, str):
+            paths = [paths]
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def get(self, path):
+        row = self._connect().execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def _where(self, kind, label=None, since=None, until=None, changed_since=None):
+        clauses, params = ["kind = ?"], [kind]
+        if label is not None:
+            clauses.append("label = ?")
+            params.append(label)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if changed_since is not None:
+            clauses.append("updated >= ?")
+            params.append(changed_since)
+        return " AND ".join(clauses), params
+
+    def count(self, kind, label=None):
+        where, params = self._where(kind, label)
+        return self._connect().execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+
+    def page(self, kind, offset=0, limit=50, label=None):
+        """Einträge neueste zuerst, für die paginierte Galerie."""
+        where, params = self._where(kind, label)
+        rows = self._connect().execute(
+            f"SELECT * FROM files WHERE {where} ORDER BY timestamp DESC, path LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def query(self, kind, label=None, since=None, until=None, changed_since=None):
+        """Alle Einträge im Zeitraum [since, until), älteste zuerst.
+
+        ``changed_since`` filtert auf Einträge, die seitdem aufgenommen oder
+        verschoben (gelabelt) wurden.
+        """
+        where, params = self._where(kind, label, since, until, changed_since)
+        rows = self._connect().execute(f"SELECT * FROM files WHERE {where} ORDER BY timestamp, path", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_files(self, kind, label=None, since=None, until=None):
+        """Löscht alle Dateien im Zeitraum samt Index-Einträgen und gibt ihre Pfade zurück."""
+        rows = self.query(kind, label, since, until)
+        for row in rows:
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+        self.remove([row["path"] for row in rows])
+        return [row["path"] for row in rows]
+
+    def reconcile(self, folder, kind, label=None, hash_files=True):
+        """Gleicht den Index mit einem Ordner ab: neue Dateien aufnehmen, verschwundene entfernen.
+
+        Bereits bekannte Dateien werden nicht erneut gelesen, es genügt ein
+        ``os.listdir``. Gibt (hinzugefügt, entfernt) zurück.
+        """
+        on_disk = set()
+        if os.path.isdir(folder):
+            on_disk = {
+                os.path.join(folder, entry) for entry in os.listdir(folder)
+                if entry.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(folder, entry))
+            }
+        where, params = self._where(kind, label)
+        indexed = {
+            row["path"] for row in self._connect().execute(f"SELECT path FROM files WHERE {where}", params)
+            if os.path.dirname(row["path"]) == folder
+        }
+        added = 0
+        for path in sorted(on_disk - indexed):
+            try:
+                self.add(path, kind, label, hash_file=hash_files)
+                added += 1
+            except OSError as e:
+                logger.warning(f"Datei {path} konnte nicht indiziert werden: {e}")
+        stale = indexed - on_disk
+        self.remove(list(stale))
+        return added, len(stale)
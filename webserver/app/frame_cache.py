@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# Größe des Graustufenbilds für den Pixelvergleich
+DIFF_SIZE = (32, 18)
+# Größe für den Difference-Hash (9x8 ergibt 64 Bit)
+HASH_SIZE = (9, 8)
+
+
+def frame_signature(source):
+    """Berechnet Difference-Hash und verkleinertes Graustufenbild eines Bildes.
+
+    ``source`` kann ein Dateipfad oder ein dateiähnliches Objekt sein.
+    """
+    with Image.open(source) as img:
+        # JPEGs direkt in reduzierter Auflösung dekodieren
+        img.draft('L', (DIFF_SIZE[0] * 4, DIFF_SIZE[1] * 4))
+        gray = img.convert('L')
+    pixels = np.asarray(gray.resize(DIFF_SIZE, Image.BILINEAR), dtype=np.float32)
+    hash_pixels = np.asarray(gray.resize(HASH_SIZE, Image.BILINEAR), dtype=np.int16)
+    bits = (hash_pixels[:, 1:] > hash_pixels[:, :-1]).flatten()
+    dhash = int(''.join('1' if bit else '0' for bit in bits), 2)
+    return dhash, pixels
+
+
+def hash_distance(a, b):
+    """Hamming-Abstand zweier Hashes."""
+    return bin(a ^ b).count('1')
+
+
+class FrameCache:
+    """Merkt sich pro Gerät das zuletzt ausgewertete Bild und dessen Vorhersage.
+
+    Ein neues Bild gilt als unverändert, wenn sein Hash höchstens
+    ``max_hash_distance`` Bits und sein Graustufenbild im Mittel höchstens
+    ``max_pixel_diff`` Helligkeitsstufen vom zuletzt ausgewerteten Bild abweicht.
+    Einträge, die älter als ``max_age_seconds`` sind, werden nicht mehr verwendet,
+    damit das Modell regelmäßig neu auswertet.
+    """
+
+    def __init__(self, max_hash_distance=4, max_pixel_diff=4.0, max_age_seconds=900):
+        self.max_hash_distance = max_hash_distance
+        self.max_pixel_diff = max_pixel_diff
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, device_id, signature, now=None):
+        """Gibt die zwischengespeicherte Wahrscheinlichkeit zurück oder None."""
+        now = time.time() if now is None else now
+        dhash, pixels = signature
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and self._matches(entry, dhash, pixels, now):
+                self.hits += 1
+                return entry['probability']
+            self.misses += 1
+            return None
+
+    def store(self, device_id, signature, probability, now=None):
+        """Speichert das ausgewertete Bild als neue Referenz für das Gerät."""
+        dhash, pixels = signature
+        with self._lock:
+            self._entries[device_id] = {
+                'dhash': dhash,
+                'pixels': pixels,
+                'probability': probability,
+                'timestamp': time.time() if now is None else now
+            }
+
+    def invalidate(self, device_id=None):
+        """Verwirft die Referenz eines Geräts oder aller Geräte."""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(device_id, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'max_hash_distance': self.max_hash_distance,
+                'max_pixel_diff': self.max_pixel_diff,
+                'max_age_seconds': self.max_age_seconds
+            }
+
+    def _matches(self, entry, dhash, pixels, now):
+        if self.max_age_seconds and now - entry['timestamp'] > self.max_age_seconds:
+            return False
+        if hash_distance(entry['dhash'], dhash) > self.max_hash_distance:
+            return False
+        return float(np.mean(np.abs(entry['pixels'] - pixels))) <= self.max_pixel_diff
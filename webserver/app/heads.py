@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Klassifikationsköpfe pro Gerät auf dem gemeinsamen Backbone.
+
+Das Standardmodell (``model/garage_door_model.keras``) ist Backbone und
+Standardkopf zugleich. Ein Gerät mit eigenem ``model`` erhält nur eine eigene
+Dense-Schicht, trainiert auf den Embeddings des Backbones. Alle Geräte teilen
+sich damit ein geladenes Backbone und einen Vorhersage-Batch; der Kopf ist ein
+Skalarprodukt auf dem Embedding.
+
+Ein Kopf liegt als eine Datei ``model/heads/<name>/garage_door_head.npz`` vor
+(Gewichte plus Metadaten), damit Gewichte und Metadaten nie aus verschiedenen
+Versionen stammen.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from model_registry import LoadedModel, ModelRegistry
+
+HEAD_FILENAME = 'garage_door_head.npz'
+
+
+def head_path(model_folder, name):
+    """Pfad des Kopfes eines Modellnamens."""
+    return os.path.join(model_folder, 'heads', name, HEAD_FILENAME)
+
+
+class Head:
+    """Dense(1)-Kopf mit Sigmoid auf den Embeddings des Backbones."""
+
+    name = 'head'
+
+    def __init__(self, kernel, bias, meta):
+        self.kernel = np.asarray(kernel, dtype=np.float32).reshape(-1, 1)
+        self.bias = np.asarray(bias, dtype=np.float32).reshape(1)
+        self.meta = meta
+
+    def predict(self, embeddings, batch_size=None, verbose=0):
+        """Wahrscheinlichkeit für "open" pro Embedding (Form N x 1 wie beim Backbone)."""
+        logits = np.asarray(embeddings, dtype=np.float32) @ self.kernel + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def matches(self, meta):
+        """True, wenn der Kopf auf dem Backbone mit diesen Metadaten trainiert wurde."""
+        return bool(self.meta.get("backbone_key")) and self.meta.get("backbone_key") == meta.get("backbone_key")
+
+
+def save_head(path, kernel, bias, meta):
+    """Schreibt Gewichte und Metadaten atomar in eine Datei."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as head_file:
+        np.savez(head_file, kernel=np.asarray(kernel, dtype=np.float32), bias=np.asarray(bias, dtype=np.float32),
+                 meta=np.array(json.dumps(meta)))
+    os.replace(tmp_path, path)
+
+
+def load_head(path):
+    with np.load(path) as data:
+        return Head(data["kernel"], data["bias"], json.loads(str(data["meta"])))
+
+
+class HeadRegistry(ModelRegistry):
+    """Wie ``ModelRegistry`` (Neuladen, Archiv, Rollback), aber für einen Kopf ohne eigenes Backbone."""
+
+    def load(self, path=None):
+        path = path or self.model_path
+        start = time.perf_counter()
+        head = load_head(path)
+        return LoadedModel(head, head.meta, self.file_version(path), path, time.perf_counter() - start, 0.0)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+import preprocessing
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceWorker:
+    """Hintergrund-Thread, der Vorhersage-Anfragen sammelt und gebündelt ausführt.
+
+    Anfragen landen in einer begrenzten Queue. Der Worker sammelt höchstens
+    ``max_wait_ms`` Millisekunden lang oder bis ``max_batch_size`` Bilder vorliegen
+    und führt dann einen einzigen ``model.predict``-Aufruf aus. Jeder Aufrufer
+    erhält ein Future mit der Wahrscheinlichkeit für "open".
+
+    Die Bilder kommen als uint8 an und werden erst hier in einen
+    wiederverwendeten float32-Batchpuffer im Eingabeformat des Modells geschrieben.
+    Bilder von Geräten mit eigenem Kopf (siehe ``heads``) laufen im selben Batch
+    durch das Backbone; ihr Kopf wird danach auf das Embedding angewendet.
+    """
+
+    def __init__(self, get_model, max_batch_size=8, max_wait_ms=20, queue_size=64):
+        self.get_model = get_model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0, max_wait_ms)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._processing = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._buffer = None
+
+    def start(self):
+        """Startet den Worker-Thread, falls er noch nicht läuft."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='inference-worker', daemon=True)
+                self._thread.start()
+                logger.info(
+                    f"Inferenz-Worker gestartet (max. {self.max_batch_size} Bilder, "
+                    f"max. {self.max_wait_ms} ms Wartezeit)."
+                )
+
+    def submit(self, img_array, model=None, timeout=None, head=None):
+        """Reiht ein vorverarbeitetes Bild (uint8, siehe ``preprocessing.prepare_image``) ein.
+
+        ``model`` legt fest, mit welchem Modell vorhergesagt wird, damit ein
+        Modellwechsel zwischen Vorverarbeitung und Vorhersage keine Rolle spielt.
+        Ohne Angabe wird das beim Ausführen aktuelle Modell verwendet. Mit
+        ``head`` bestimmt dieser Kopf statt des Standardkopfs die
+        Wahrscheinlichkeit. Blockiert höchstens ``timeout`` Sekunden, wenn die
+        Queue voll ist, und wirft dann ``queue.Full``.
+        """
+        future = Future()
+        self._queue.put((img_array, model, head, future), timeout=timeout)
+        return future
+
+    def is_busy(self):
+        """Gibt zurück, ob gerade eine Vorhersage läuft oder Anfragen warten."""
+        return self._processing.is_set() or not self._queue.empty()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._processing.set()
+            try:
+                self._process(batch)
+            finally:
+                self._processing.clear()
+
+    def _process(self, batch):
+        # Bereits abgebrochene Anfragen verwerfen und nach Modell gruppieren
+        current_model = None
+        groups = {}
+        for img_array, model, head, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            if model is None:
+                current_model = current_model or self.get_model()
+                model = current_model
+            if model is None:
+                future.set_exception(RuntimeError("Kein Modell geladen."))
+                continue
+            groups.setdefault(id(model), (model, []))[1].append((img_array, head, future))
+
+        for model, items in groups.values():
+            self._predict(model, items)
+
+    def _batch_buffer(self, model, batch):
+        """Schreibt die Bilder in den Batchpuffer; dieser wird nur bei geänderter Auflösung neu angelegt."""
+        shape = (self.max_batch_size,) + np.shape(batch[0][0])
+        if self._buffer is None or self._buffer.shape != shape:
+            self._buffer = np.empty(shape, dtype=np.float32)
+        images = self._buffer[:len(batch)]
+        meta = getattr(model, 'meta', None) or {}
+        for i, (img_array, _, _) in enumerate(batch):
+            preprocessing.to_model_input(img_array, meta, out=images[i])
+        return images
+
+    def _predict(self, model, batch):
+        try:
+            images = self._batch_buffer(model, batch)
+            started = time.perf_counter()
+            embeddings = None
+            if any(head is not None for _, head, _ in batch):
+                prediction, embeddings = model.predict_with_embeddings(images, batch_size=len(batch))
+            else:
+                prediction = model.predict(images, batch_size=len(batch), verbose=0)
+            backend = getattr(getattr(model, 'backend', model), 'name', 'unknown')
+            metrics.PREDICT_SECONDS.labels(backend=backend).observe(time.perf_counter() - started)
+            metrics.PREDICT_BATCH_SIZE.observe(len(batch))
+            logger.info(f"Vorhersage für {len(batch)} Bild(er) in einem Batch durchgeführt.")
+        except Exception as e:
+            logger.error(f"Vorhersage fehlgeschlagen für {len(batch)} Bild(er): {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for i, (_, head, future) in enumerate(batch):
+            try:
+                probability = prediction[i][0] if head is None else head.predict(embeddings[i:i + 1])[0][0]
+                future.set_result(float(probability))
+            except Exception as e:
+                logger.error(f"Vorhersage des Geräte-Kopfs fehlgeschlagen: {e}")
+                future.set_exception(e)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import time
+
+
+def file_identity(path):
+    """Kennung einer Logdatei aus Inode und erster Zeile, oder None, wenn sie fehlt.
+
+    retrain.py beginnt jedes Log mit einer Zeile samt Startzeit; die Kennung
+    ändert sich daher auch, wenn ein neues Log in dieselbe, geleerte Datei
+    geschrieben wird.
+    """
+    try:
+        with open(path, 'rb') as log_file:
+            first_line = log_file.readline(256)
+            inode = os.fstat(log_file.fileno()).st_ino
+    except FileNotFoundError:
+        return None
+    return hashlib.sha1(f"{inode}|".encode() + first_line).hexdigest()[:12]
+
+
+def parse_offset(token):
+    """Zerlegt einen Offset ``<Kennung>:<Bytes>`` (oder nur ``<Bytes>``) in (Kennung, Bytes).
+
+    Gibt None zurück, wenn ``token`` fehlt oder ungültig ist.
+    """
+    if token is None or token == '':
+        return None
+    identity, _, offset = str(token).rpartition(':')
+    try:
+        return identity or None, max(int(offset), 0)
+    except ValueError:
+        return None
+
+
+def read_from_offset(path, offset=0, max_bytes=65536):
+    """Liest den Teil einer Logdatei ab ``offset``.
+
+    ``offset`` ist ein zuvor zurückgegebener Offset ``<Kennung>:<Bytes>`` oder
+    eine Byte-Position. Gibt (Text, nächster Offset, Reset) zurück. Reset ist
+    True, wenn inzwischen ein neues Log begonnen hat (andere Kennung oder Datei
+    kürzer als der Offset); dann wird ab Anfang gelesen. Es werden höchstens
+    ``max_bytes`` gelesen und nur vollständige Zeilen zurückgegeben, solange die
+    Datei länger ist.
+    """
+    identity, position = parse_offset(offset) or (None, 0)
+    current = file_identity(path)
+    if current is None:
+        return "", "0", position > 0
+    size = os.path.getsize(path)
+    reset = position > size or (identity is not None and identity != current)
+    if reset:
+        position = 0
+    with open(path, 'rb') as log_file:
+        log_file.seek(position)
+        data = log_file.read(max_bytes)
+    if position + len(data) < size and b'\n' in data:
+        data = data[:data.rindex(b'\n') + 1]
+    return data.decode('utf-8', errors='replace'), f"{current}:{position + len(data)}", reset
+
+
+def tail_offset(path, max_bytes):
+    """Byte-Position, ab der die letzten ``max_bytes`` einer Datei beginnen."""
+    if not os.path.exists(path):
+        return 0
+    return max(0, os.path.getsize(path) - max_bytes)
+
+
+def stream_events(path, offset=0, poll_seconds=1.0, keepalive_seconds=15.0, max_seconds=300.0):
+    """Erzeugt Server-Sent Events mit neuen Logzeilen.
+
+    Jedes Event trägt den nächsten Offset als ``id``, damit der Browser nach
+    einem Verbindungsabbruch per Last-Event-ID nahtlos weiterlesen kann. Nach
+    ``max_seconds`` endet der Stream, der Browser verbindet sich selbst neu.
+    """
+    started = last_sent = time.monotonic()
+    yield "retry: 2000\n\n"
+    while time.monotonic() - started < max_seconds:
+        text, offset, reset = read_from_offset(path, offset)
+        if reset:
+            yield f"id: {offset}\nevent: reset\ndata: \n\n"
+        if text:
+            data = '\n'.join(f"data: {line}" for line in text.split('\n'))
+            yield f"id: {offset}\n{data}\n\n"
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= keepalive_seconds:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(poll_seconds)
+
+
+def read_metrics(path):
+    """Liest die Metriken pro Epoche (eine JSON-Zeile pro Epoche)."""
+    if not os.path.exists(path):
+        return []
+    metrics = []
+    with open(path, 'r') as metrics_file:
+        for line in metrics_file:
+            try:
+                metrics.append(json.loads(line))
+            except ValueError:
+                continue
+    return metrics
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""Metriken im Prometheus-Textformat mit ``prometheus_client``.
+
+Die Metriken der Hot Paths (Dekodieren, Vorverarbeitung, Vorhersage, MQTT,
+Uploads) sind unten zentral definiert und werden von den Modulen direkt
+aktualisiert. Zustandswerte (Modellversion, Retraining, Frame-Cache) liest
+``StateCollector`` erst beim Abruf von ``/metrics``.
+"""
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+
+# Latenz-Buckets in Sekunden
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Größen-Buckets in Bytes (Kamera-Snapshots liegen meist bei 100 KB bis 1 MB)
+SIZE_BUCKETS = (16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304, 8388608)
+
+# Eigene Registry, damit /metrics nur die Metriken dieses Dienstes liefert
+REGISTRY = CollectorRegistry()
+
+# Uploads und Vorhersage
+UPLOAD_BYTES = Histogram('garage_upload_bytes', "Größe hochgeladener Bilder in Bytes.", buckets=SIZE_BUCKETS, registry=REGISTRY)
+UPLOAD_REQUEST_SECONDS = Histogram('garage_upload_request_seconds', "Dauer eines Upload-Requests inklusive Vorhersage.", buckets=LATENCY_BUCKETS, registry=REGISTRY)
+DECODE_SECONDS = Histogram('garage_image_decode_seconds', "Dauer für das Dekodieren eines Bildes.", buckets=LATENCY_BUCKETS, registry=REGISTRY)
+PREPROCESS_SECONDS = Histogram('garage_image_preprocess_seconds', "Dauer für ROI-Ausschnitt, Skalierung und Normalisierung.", buckets=LATENCY_BUCKETS, registry=REGISTRY)
+PREDICT_SECONDS = Histogram('garage_predict_seconds', "Dauer von model.predict pro Batch.", ['backend'], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+PREDICT_BATCH_SIZE = Histogram('garage_predict_batch_size', "Bilder pro Vorhersage-Batch.", buckets=(1, 2, 4, 8, 16, 32, 64), registry=REGISTRY)
+PREDICTIONS = Counter('garage_predictions', "Ausgewertete Bilder nach Quelle (model oder cache).", ['source'], registry=REGISTRY)
+PREDICTIONS_SKIPPED = Counter('garage_predictions_skipped', "Bilder ohne Vorhersage nach Grund.", ['reason'], registry=REGISTRY)
+
+# MQTT
+MQTT_PUBLISH_SECONDS = Histogram('garage_mqtt_publish_seconds', "Zeit vom Einreihen bis zur Bestätigung durch den Broker (QoS 0: bis zum Senden).", buckets=LATENCY_BUCKETS, registry=REGISTRY)
+MQTT_PUBLISH_FAILURES = Counter('garage_mqtt_publish_failures', "Fehlgeschlagene MQTT-Nachrichten nach Grund.", ['reason'], registry=REGISTRY)
+
+# Snapshot-Abfrage der Kameras
+SNAPSHOT_FETCH_SECONDS = Histogram('garage_snapshot_fetch_seconds', "Dauer für das Abrufen eines Kamera-Snapshots.", ['camera'], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+SNAPSHOT_FAILURES = Counter('garage_snapshot_failures', "Fehlgeschlagene Snapshot-Abrufe nach Kamera und Grund.", ['camera', 'reason'], registry=REGISTRY)
+
+
+# Zustandswerte: (Name, Beschreibung, Schlüssel im Dict von ``read_state``)
+STATE_GAUGES = (
+    ('garage_mqtt_connected', "1, wenn eine Verbindung zum Broker besteht.", 'mqtt_connected'),
+    ('garage_mqtt_queue_length', "Nachrichten in der Sende-Queue.", 'mqtt_queue_length'),
+    ('garage_retrain_running', "1, solange ein Retraining läuft.", 'retrain_running'),
+    ('garage_retrain_progress', "Anteil abgeschlossener Epochen des laufenden bzw. letzten Trainings.", 'retrain_progress'),
+    ('garage_retrain_epoch_seconds', "Dauer der letzten Trainingsepoche.", 'retrain_epoch_seconds'),
+    ('garage_retrain_images_per_second', "Trainingsdurchsatz der letzten Epoche.", 'retrain_images_per_second'),
+    ('garage_retrain_eta_seconds', "Geschätzte Restdauer des laufenden Trainings.", 'retrain_eta_seconds'),
+    ('garage_frame_cache_hits', "Treffer des Frame-Caches seit dem Start.", 'frame_cache_hits'),
+    ('garage_frame_cache_misses', "Fehlschläge des Frame-Caches seit dem Start.", 'frame_cache_misses'),
+)
+
+
+class StateCollector:
+    """Liest Modelle und Zustandswerte bei jedem Abruf über ``read_state``.
+
+    ``read_state`` liefert ein Dict mit den Schlüsseln aus ``STATE_GAUGES`` und
+    ``models``, einer Liste von Dicts mit ``model``, ``version``, ``backend``,
+    ``load_seconds`` und ``warmup_seconds``. Eine abgelöste Modellversion
+    verschwindet damit aus ``garage_model_info``, ohne dass Labels gelöscht
+    werden müssen.
+    """
+
+    def __init__(self, read_state):
+        self.read_state = read_state
+
+    def describe(self):
+        # Kein Abruf von read_state bei der Registrierung
+        return []
+
+    def collect(self):
+        state = self.read_state()
+        info = GaugeMetricFamily('garage_model_info', "Aktuell geladenes Modell (Wert immer 1).",
+                                 labels=['model', 'version', 'backend'])
+        load_seconds = GaugeMetricFamily('garage_model_load_seconds', "Ladezeit des aktuellen Modells.", labels=['model'])
+        warmup_seconds = GaugeMetricFamily('garage_model_warmup_seconds',
+                                           "Dauer der Aufwärm-Vorhersage des aktuellen Modells.", labels=['model'])
+        for model in state["models"]:
+            info.add_metric([model["model"], model["version"], model["backend"]], 1)
+            load_seconds.add_metric([model["model"]], model["load_seconds"])
+            warmup_seconds.add_metric([model["model"]], model["warmup_seconds"] or 0)
+        yield info
+        yield load_seconds
+        yield warmup_seconds
+        for name, documentation, key in STATE_GAUGES:
+            yield GaugeMetricFamily(name, documentation, value=state.get(key) or 0)
+
+
+def render():
+    """Alle Metriken im Prometheus-Textformat und der passende Content-Type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
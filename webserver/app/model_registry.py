@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import preprocessing
+from backends import load_backend, tflite_path_for
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    """Ein geladenes Modell zusammen mit seiner Vorverarbeitung und Version."""
+
+    def __init__(self, backend, meta, version, path, load_seconds, warmup_seconds):
+        self.backend = backend
+        self.meta = meta
+        self.version = version
+        self.path = path
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+
+    def predict(self, images, batch_size=None, verbose=0):
+        return self.backend.predict(images, batch_size=batch_size, verbose=verbose)
+
+    @property
+    def supports_embeddings(self):
+        """True, wenn das Backend neben der Vorhersage die Embeddings für Geräte-Köpfe liefert."""
+        return getattr(self.backend, 'supports_embeddings', False)
+
+    def predict_with_embeddings(self, images, batch_size=None):
+        """Vorhersage des Standardkopfs und Embeddings des Backbones in einem Durchlauf."""
+        return self.backend.predict_with_embeddings(images, batch_size=batch_size)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "backend": self.backend.name,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": round(self.warmup_seconds, 3),
+            "img_height": self.meta["img_height"],
+            "img_width": self.meta["img_width"],
+            "roi": self.meta["roi"]
+        }
+
+
+class ModelRegistry:
+    """Hält das aktuelle Modell und tauscht es nach einem Retraining ohne Neustart aus.
+
+    Ein Hintergrund-Thread prüft regelmäßig die Änderungszeit der Modelldatei.
+    Ein neues Modell wird im Hintergrund geladen, mit einer Dummy-Vorhersage
+    aufgewärmt und erst danach atomar gegen das alte getauscht. Jede geladene
+    Version wird unter ``versions/`` archiviert, damit sie wiederhergestellt
+    werden kann.
+    """
+
+    def __init__(self, model_path, backend='keras', num_threads=None, poll_seconds=30,
+                 keep_versions=3, on_swap=None, warmup_batch_sizes=(1,), warmup_embeddings=False):
+        self.model_path = model_path
+        self.backend = backend
+        self.num_threads = num_threads
+        self.poll_seconds = poll_seconds
+        self.keep_versions = keep_versions
+        self.on_swap = on_swap
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.warmup_embeddings = warmup_embeddings
+        self.versions_folder = os.path.join(os.path.dirname(model_path), 'versions')
+        self._current = None
+        self._failed_version = None
+        self._swap_lock = threading.Lock()
+        self._thread = None
+
+    def current(self):
+        """Gibt das aktuell geladene Modell zurück oder None."""
+        return self._current
+
+    def file_version(self, path=None):
+        """Version einer Modelldatei, abgeleitet aus ihrer Änderungszeit."""
+        path = path or self.model_path
+        if not os.path.exists(path):
+            return None
+        return datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d-%H%M%S')
+
+    def load(self, path=None):
+        """Lädt ein Modell und wärmt es mit Dummy-Vorhersagen auf, ohne es zu aktivieren.
+
+        Die Aufwärm-Vorhersagen für alle ``warmup_batch_sizes`` sorgen dafür, dass
+        das Tracing nicht beim ersten echten Request anfällt; mit
+        ``warmup_embeddings`` auch für den Pfad mit Embeddings (Geräte-Köpfe).
+        """
+        path = path or self.model_path
+        version = self.file_version(path)
+        start = time.perf_counter()
+        backend = load_backend(path, self.backend, num_threads=self.num_threads)
+        meta = preprocessing.load_metadata(path, backend.input_shape)
+        if tuple(backend.input_shape[:2]) != (meta["img_height"], meta["img_width"]):
+            # Metadaten einer anderen Version (z. B. Neustart während des Speicherns)
+            raise ValueError(f"Metadaten ({meta['img_height']}x{meta['img_width']}) passen nicht zum Modell "
+                             f"{path} ({backend.input_shape[0]}x{backend.input_shape[1]}).")
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for batch_size in self.warmup_batch_sizes:
+            images = np.zeros((batch_size, meta["img_height"], meta["img_width"], 3), dtype=np.float32)
+            backend.predict(images, batch_size=batch_size)
+            if self.warmup_embeddings and getattr(backend, 'supports_embeddings', False):
+                backend.predict_with_embeddings(images, batch_size=batch_size)
+        return LoadedModel(backend, meta, version, path, load_seconds, time.perf_counter() - start)
+
+    def reload(self):
+        """Lädt die Modelldatei neu und aktiviert sie. Gibt True zurück, wenn getauscht wurde."""
+        with self._swap_lock:
+            version = self.file_version()
+            if version is None:
+                return False
+            logger.info(f"Lade Modellversion {version} ...")
+            loaded = self.load()
+            self._archive(loaded.version)
+            self._swap(loaded)
+            return True
+
+    def reload_if_changed(self):
+        version = self.file_version()
+        current = self._current
+        if version is None or version == self._failed_version or (current is not None and current.version == version):
+            return False
+        try:
+            return self.reload()
+        except Exception:
+            # Fehlerhafte Version nicht bei jedem Durchlauf erneut laden
+            self._failed_version = version
+            raise
+
+    def start_watching(self):
+        """Startet den Hintergrund-Thread, der auf neue Modellversionen prüft."""
+        if self.poll_seconds <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def versions(self):
+        """Archivierte Versionen, neueste zuerst."""
+        if not os.path.isdir(self.versions_folder):
+            return []
+        return sorted((v for v in os.listdir(self.versions_folder) if not v.endswith('.tmp')), reverse=True)
+
+    def rollback(self, version=None):
+        """Stellt eine archivierte Version wieder her (Standard: die vorherige) und aktiviert sie."""
+        current = self._current
+        candidates = [v for v in self.versions() if current is None or v != current.version]
+        if version is None:
+            if not candidates:
+                raise ValueError("Keine ältere Modellversion vorhanden.")
+            version = candidates[0]
+        elif version not in self.versions():
+            raise ValueError(f"Modellversion {version} existiert nicht.")
+
+        with self._swap_lock:
+            # Dateien mit Zeitstempel zurückkopieren, damit die Version gleich bleibt
+            model_folder = os.path.dirname(self.model_path)
+            archived = self._version_files(os.path.join(self.versions_folder, version))
+            archived_names = {os.path.basename(source) for source in archived}
+            for current_file in self._version_files(model_folder):
+                if os.path.basename(current_file) not in archived_names:
+                    os.remove(current_file)
+            for source in archived:
+                target = os.path.join(model_folder, os.path.basename(source))
+                shutil.copy2(source, target + '.tmp')
+                os.replace(target + '.tmp', target)
+            logger.info(f"Setze Modell auf Version {version} zurück ...")
+            self._swap(self.load())
+        return version
+
+    def _swap(self, loaded):
+        previous = self._current
+        self._current = loaded
+        logger.info(
+            f"Modellversion {loaded.version} aktiv ({loaded.backend.name}, geladen in {loaded.load_seconds:.1f} s, "
+            f"aufgewärmt in {loaded.warmup_seconds:.1f} s)"
+            + (f", vorher {previous.version}." if previous else ".")
+        )
+        if self.on_swap:
+            self.on_swap(loaded)
+
+    def _archive(self, version):
+        """Kopiert die Modelldateien nach versions/<version> und entfernt alte Versionen."""
+        target = os.path.join(self.versions_folder, version)
+        if os.path.isdir(target):
+            return
+        try:
+            os.makedirs(target + '.tmp', exist_ok=True)
+            for source in self._version_files(os.path.dirname(self.model_path)):
+                shutil.copy2(source, os.path.join(target + '.tmp', os.path.basename(source)))
+            os.replace(target + '.tmp', target)
+            for old_version in self.versions()[self.keep_versions:]:
+                shutil.rmtree(os.path.join(self.versions_folder, old_version), ignore_errors=True)
+        except OSError as e:
+            logger.error(f"Modellversion {version} konnte nicht archiviert werden: {e}")
+
+    def _version_files(self, folder):
+        """Modell, Metadaten und TFLite-Modell einer Version, soweit vorhanden."""
+        model_name = os.path.basename(self.model_path)
+        names = [
+            model_name,
+            os.path.basename(preprocessing.metadata_path(model_name)),
+            os.path.basename(tflite_path_for(model_name))
+        ]
+        return [os.path.join(folder, name) for name in names if os.path.exists(os.path.join(folder, name))]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logger.error(f"Fehler beim Laden der neuen Modellversion: {e}")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import logging
+import queue
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_ONLINE = 'online'
+PAYLOAD_OFFLINE = 'offline'
+
+
+class MqttPublisher:
+    """Langlebige MQTT-Verbindung mit Sende-Queue und automatischem Reconnect.
+
+    ``publish()`` reiht Nachrichten nur ein und kehrt sofort zurück. Ein eigener
+    Thread sendet sie, sobald eine Verbindung besteht. Nachrichten mit QoS > 0
+    übernimmt paho nach dem Einreihen selbst und stellt sie nach einem Reconnect
+    zu. Ist ein ``availability_topic`` gesetzt, wird dort beim Verbinden "online"
+    gesendet und per Last Will "offline" hinterlegt.
+    """
+
+    def __init__(self, host, port, username='', password='', client_id='',
+                 availability_topic='', qos=1, queue_size=1000, keepalive=60):
+        self.host = host
+        self.port = port
+        self.availability_topic = availability_topic
+        self.qos = qos
+        self.keepalive = keepalive
+        self.last_error = None
+
+        self.client = mqtt.Client(client_id=client_id, clean_session=True)
+        if username:
+            self.client.username_pw_set(username, password)
+        if availability_topic:
+            self.client.will_set(availability_topic, payload=PAYLOAD_OFFLINE, qos=1, retain=True)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Einreihzeitpunkt pro Message-ID für die Latenz bis zur Bestätigung
+        self._inflight = {}
+        self._acked = {}
+        self._inflight_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Baut die Verbindung im Hintergrund auf und startet den Sende-Thread."""
+        if self._thread is not None:
+            return
+        logger.info(f"Verbinde mit MQTT-Broker {self.host}:{self.port} ...")
+        self.client.connect_async(self.host, self.port, keepalive=self.keepalive)
+        self.client.loop_start()
+        self._thread = threading.Thread(target=self._run, name='mqtt-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Meldet das Gerät als offline ab und trennt die Verbindung."""
+        if self.availability_topic and self.is_connected():
+            self.client.publish(self.availability_topic, PAYLOAD_OFFLINE, qos=1, retain=True).wait_for_publish(timeout=5)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def queue_length(self):
+        return self._queue.qsize()
+
+    def publish(self, topic, payload, retain=False, qos=None):
+        """Reiht eine Nachricht ein. Gibt False zurück, wenn die Sende-Queue voll ist."""
+        try:
+            self._queue.put_nowait((topic, payload, retain, self.qos if qos is None else qos, time.perf_counter()))
+            return True
+        except queue.Full:
+            metrics.MQTT_PUBLISH_FAILURES.labels(reason='queue_full').inc()
+            self.last_error = "Sende-Queue voll"
+            logger.error(f"MQTT-Sende-Queue voll, Nachricht an {topic} verworfen.")
+            return False
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.last_error = mqtt.connack_string(rc)
+            logger.error(f"MQTT-Verbindung abgelehnt: {self.last_error}")
+            return
+        logger.info(f"Mit MQTT-Broker {self.host}:{self.port} verbunden.")
+        if self.availability_topic:
+            info = client.publish(self.availability_topic, PAYLOAD_ONLINE, qos=1, retain=True)
+            self._track(info.mid, None)
+        self._connected.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._connected.clear()
+        if rc != 0:
+            self.last_error = mqtt.error_string(rc)
+            logger.warning(f"MQTT-Verbindung verloren ({self.last_error}), neuer Versuch folgt.")
+
+    def _on_publish(self, client, userdata, mid):
+        # Kann vor der Rückkehr von client.publish() im Netzwerk-Thread eintreffen
+        with self._inflight_lock:
+            if mid not in self._inflight:
+                self._acked[mid] = time.perf_counter()
+                return
+            enqueued = self._inflight.pop(mid)
+        if enqueued is not None:
+            metrics.MQTT_PUBLISH_SECONDS.observe(time.perf_counter() - enqueued)
+
+    def _track(self, mid, enqueued):
+        """Merkt sich den Einreihzeitpunkt bis zur Bestätigung; ``enqueued=None`` wird nicht gemessen."""
+        with self._inflight_lock:
+            if mid not in self._acked:
+                self._inflight[mid] = enqueued
+                return
+            acked = self._acked.pop(mid)
+        if enqueued is not None:
+            metrics.MQTT_PUBLISH_SECONDS.observe(acked - enqueued)
+
+    def _run(self):
+        while True:
+            topic, payload, retain, qos, enqueued = self._queue.get()
+            while True:
+                self._connected.wait()
+                info = self.client.publish(topic, payload, qos=qos, retain=retain)
+                # QoS > 0 wird von paho auch ohne Verbindung vorgemerkt und später zugestellt
+                if info.rc == mqtt.MQTT_ERR_SUCCESS or (qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN):
+                    self.last_error = None
+                    self._track(info.mid, enqueued)
+                    logger.debug(f"MQTT-Nachricht an {topic} übergeben: {payload}")
+                    break
+                if info.rc != mqtt.MQTT_ERR_NO_CONN:
+                    self.last_error = mqtt.error_string(info.rc)
+                    metrics.MQTT_PUBLISH_FAILURES.labels(reason='error').inc()
+                    logger.error(f"Fehler beim Senden der MQTT-Nachricht an {topic}: {self.last_error}")
+                    break
+                # Verbindung zwischenzeitlich verloren: kurz warten und nach dem Reconnect erneut senden
+                time.sleep(1)
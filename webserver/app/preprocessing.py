@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+# Standardauflösung bisheriger Modelle
+DEFAULT_IMG_HEIGHT = 512
+DEFAULT_IMG_WIDTH = 896
+# JPEGs direkt in reduzierter Auflösung dekodieren (DCT-Skalierung 1/2, 1/4, 1/8 in libjpeg).
+# Nur die Vorgabe für neue Trainings; maßgeblich ist ``jpeg_draft`` in den Metadaten des Modells.
+JPEG_DRAFT = os.environ.get('JPEG_DRAFT', 'true').lower() in ('1', 'true', 'yes')
+
+
+def parse_roi(value):
+    """Liest einen ROI als 'x0,y0,x1,y1' in Anteilen (0-1) der Bildbreite/-höhe.
+
+    Ein leerer Wert bedeutet: ganzes Bild.
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        roi = [float(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError(f"Ungültiger ROI '{value}', erwartet 'x0,y0,x1,y1'")
+    if len(roi) != 4 or not (0 <= roi[0] < roi[2] <= 1 and 0 <= roi[1] < roi[3] <= 1):
+        raise ValueError(f"Ungültiger ROI '{value}', erwartet 'x0,y0,x1,y1' mit 0 <= x0 < x1 <= 1 und 0 <= y0 < y1 <= 1")
+    return roi
+
+
+def config_from_env():
+    """Vorverarbeitung für neues Training aus den Umgebungsvariablen IMG_HEIGHT, IMG_WIDTH und ROI."""
+    return {
+        "img_height": int(os.environ.get('IMG_HEIGHT', DEFAULT_IMG_HEIGHT)),
+        "img_width": int(os.environ.get('IMG_WIDTH', DEFAULT_IMG_WIDTH)),
+        "roi": parse_roi(os.environ.get('ROI', ''))
+    }
+
+
+def metadata_path(model_path):
+    """Pfad der Metadaten-Datei neben dem Modell."""
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def load_metadata(model_path, input_shape=None):
+    """Lädt die Vorverarbeitung, mit der das Modell trainiert wurde.
+
+    Ohne Metadaten-Datei (ältere Modelle) wird die Auflösung aus ``input_shape``
+    übernommen und das ganze Bild verwendet.
+    """
+    path = metadata_path(model_path)
+    if os.path.exists(path):
+        with open(path, 'r') as meta_file:
+            meta = json.load(meta_file)
+        meta["roi"] = meta.get("roi") or None
+        return meta
+    if input_shape is not None and input_shape[0] and input_shape[1]:
+        return {"img_height": int(input_shape[0]), "img_width": int(input_shape[1]), "roi": None}
+    return {"img_height": DEFAULT_IMG_HEIGHT, "img_width": DEFAULT_IMG_WIDTH, "roi": None}
+
+
+def save_metadata(model_path, meta):
+    """Schreibt die Metadaten atomar neben das Modell."""
+    meta = dict(meta, saved_at=datetime.now().isoformat(timespec='seconds'))
+    path = metadata_path(model_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def roi_box(width, height, roi):
+    """Rechnet einen ROI in Anteilen in eine Pixel-Box (links, oben, rechts, unten) um."""
+    if not roi:
+        return 0, 0, width, height
+    x0, y0, x1, y1 = roi
+    return (int(round(x0 * width)), int(round(y0 * height)),
+            max(int(round(x1 * width)), 1), max(int(round(y1 * height)), 1))
+
+
+def draft_size(meta):
+    """Mindestgröße des ganzen Bildes, damit der ROI noch mindestens die Modellauflösung hat."""
+    x0, y0, x1, y1 = meta.get("roi") or (0, 0, 1, 1)
+    return math.ceil(meta["img_width"] / (x1 - x0)), math.ceil(meta["img_height"] / (y1 - y0))
+
+def decode_image(source, meta=None):
+    """Dekodiert ein Bild als RGB. ``source`` kann ein Dateipfad, ein dateiähnliches Objekt oder Bytes sein.
+
+    Wurde das Modell mit verkleinert dekodierten JPEGs trainiert
+    (``meta["jpeg_draft"]``), werden JPEGs per ``draft`` gleich in der kleinsten
+    Stufe dekodiert, die für ROI und Modellauflösung noch ausreicht. Ältere
+    Modelle ohne diesen Eintrag erhalten wie beim Training die volle Auflösung.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as img:
+        if meta is not None and meta.get("jpeg_draft", False) and img.format == 'JPEG':
+            img.draft('RGB', draft_size(meta))
+        img.load()
+        return img if img.mode == 'RGB' else img.convert('RGB')
+
+def prepare_image(img, meta):
+    """Schneidet den ROI aus und skaliert auf die Modellauflösung in einem Schritt (uint8, HxWx3)."""
+    # 'nearest' wie tf.keras.utils.load_img, mit dem bisherige Modelle trainiert wurden
+    img = img.resize((meta["img_width"], meta["img_height"]), Image.NEAREST,
+                     box=roi_box(img.width, img.height, meta.get("roi")))
+    return np.asarray(img, dtype=np.uint8)
+
+def model_input_scale(meta):
+    """Faktor für die Pixelwerte vor der Vorhersage.
+
+    Neuere Modelle normalisieren selbst mit einer Rescaling-Schicht
+    (``rescale_in_model``) und erhalten die Pixel unverändert (0 bis 255);
+    ältere Modelle erwarten Werte von 0 bis 1.
+    """
+    return 1.0 if meta.get("rescale_in_model") else 1 / 255.0
+
+def to_model_input(images, meta, out=None):
+    """Wandelt uint8-Bilder in float32 im Eingabebereich des Modells.
+
+    ``out`` ist ein optionaler, bereits angelegter Puffer, in den geschrieben wird.
+    """
+    if out is None:
+        out = np.empty(np.shape(images), dtype=np.float32)
+    out[...] = images
+    scale = model_input_scale(meta)
+    if scale != 1.0:
+        out *= scale
+    return out
+
+def load_image(source, meta):
+    """Lädt ein Bild, schneidet den ROI aus und skaliert es auf die Modellauflösung (uint8).
+
+    Diese Vorverarbeitung verwenden Webserver und Training gleichermaßen.
+    """
+    return prepare_image(decode_image(source, meta), meta)
+
+def load_image_array(source, meta):
+    """Wie ``load_image``, aber als float32-Array im Eingabebereich des Modells."""
+    return to_model_input(load_image(source, meta), meta)
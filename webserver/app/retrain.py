@@ -1,25 +1,79 @@
 import os
 import sys
+import json
+import hashlib
+import random
+import shutil
+import signal
+import time
+import numpy as np
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras import layers, models
 from datetime import datetime, timedelta
+import preprocessing
+import feature_cache
+from file_index import content_hash
+import backends
+import heads
 
 # Pfade
-LOCK_FILE = '/app/retrain.lock'
-LOG_FILE = '/app/retrain.log'
+# Basisverzeichnis wie in app.py, damit Webserver und Training dieselben Dateien verwenden
+BASE_DIR = os.environ.get('APP_BASE_DIR', '/app')
+LOCK_FILE = os.path.join(BASE_DIR, 'retrain.lock')
+LOG_FILE = os.path.join(BASE_DIR, 'retrain.log')
+METRICS_FILE = os.path.join(BASE_DIR, 'retrain_metrics.jsonl')
+DATASET_FOLDER = os.path.join(BASE_DIR, 'dataset')
+# Datasets der Geräte-Modelle (dataset/models/<name>/open|closed), je ein Kopf auf dem gemeinsamen Backbone
+HEAD_DATASET_FOLDER = os.path.join(DATASET_FOLDER, 'models')
+CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'tfdata')
+EMBEDDING_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'embeddings')
+
+# Trainings-Pipeline
+# Zwischenspeicher der dekodierten, skalierten Bilder: 'disk', 'memory' oder 'none'
+TRAIN_CACHE = os.environ.get('TRAIN_CACHE', 'disk').lower()
+# Puffer (in Bildern) zum Mischen der zwischengespeicherten Bilder in jeder Epoche
+TRAIN_SHUFFLE_BUFFER = int(os.environ.get('TRAIN_SHUFFLE_BUFFER', 64))
+
+# 'full' = Feinjustierung mit Augmentierung, 'head' = nur Klassifikationskopf auf zwischengespeicherten Embeddings
+RETRAIN_MODES = ('full', 'head')
+RETRAIN_MODE = os.environ.get('RETRAIN_MODE', 'full').lower()
+HEAD_EPOCHS = int(os.environ.get('HEAD_EPOCHS', 50))
+
+# TFLite-Export
+TFLITE_EXPORT = os.environ.get('TFLITE_EXPORT', 'true').lower() in ('1', 'true', 'yes')
+# 'none', 'dynamic' (nur Gewichte) oder 'int8' (kalibriert auf dem Dataset)
+TFLITE_QUANTIZE = os.environ.get('TFLITE_QUANTIZE', 'none').lower()
+TFLITE_CALIBRATION_SAMPLES = int(os.environ.get('TFLITE_CALIBRATION_SAMPLES', 100))
+TFLITE_REPORT_SAMPLES = int(os.environ.get('TFLITE_REPORT_SAMPLES', 50))
+
+# Thread-Limits, damit das Training die Inferenz im Webserver nicht ausbremst (0 = TensorFlow-Standard)
+TRAIN_INTRA_OP_THREADS = int(os.environ.get('TRAIN_INTRA_OP_THREADS', 2))
+TRAIN_INTER_OP_THREADS = int(os.environ.get('TRAIN_INTER_OP_THREADS', 1))
+
+def configure_threads():
+    """Setzt die Thread-Limits; muss vor der ersten TensorFlow-Operation aufgerufen werden."""
+    tf.config.threading.set_intra_op_parallelism_threads(TRAIN_INTRA_OP_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(TRAIN_INTER_OP_THREADS)
+
+class RetrainCancelled(BaseException):
+    """Retraining wurde per SIGTERM abgebrochen."""
+
+def cancel_handler(signum, frame):
+    raise RetrainCancelled()
 
 def setup_logging():
     """Bereitet die Logdatei vor."""
     if not os.path.exists(LOCK_FILE):
-        # Logdatei löschen, wenn kein Lockfile existiert
-        if os.path.exists(LOG_FILE):
-            os.remove(LOG_FILE)
+        # Logdatei leeren, wenn kein Lockfile existiert (nicht löschen: die Ausgabe des Prozesses wird angehängt)
         with open(LOG_FILE, 'w') as log_file:
-            log_file.write("Starte neues Retraining...\n")
+            # Die Startzeit macht die erste Zeile eindeutig; daran erkennt /logs ein neues Log
+            log_file.write(f"Starte neues Retraining ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})...\n")
+        # Metriken des vorherigen Trainings verwerfen
+        if os.path.exists(METRICS_FILE):
+            os.remove(METRICS_FILE)
 
 def append_log(message):
-    with open('/app/retrain.log', 'a') as log_file:
+    with open(LOG_FILE, 'a') as log_file:
         log_file.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
 
 def lock():
@@ -38,147 +92,551 @@ def is_locked():
     """Überprüft, ob ein Retraining-Lock existiert."""
     return os.path.exists(LOCK_FILE)
 
-def retrain_model(model_path):
+def list_dataset(dataset_folder=DATASET_FOLDER):
+    """Gibt pro Klasse die sortierten Bildpfade zurück (Label 0 = closed, 1 = open)."""
+    classes = []
+    for subfolder in ['closed', 'open']:
+        folder = os.path.join(dataset_folder, subfolder)
+        files = sorted(f for f in os.listdir(folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))) if os.path.isdir(folder) else []
+        classes.append([os.path.join(folder, f) for f in files])
+    return classes
+
+def split_dataset(validation_split=0.2, dataset_folder=DATASET_FOLDER):
+    """Teilt das Dataset wie flow_from_directory: die ersten 20 % jeder Klasse dienen der Validierung."""
+    training, validation = [], []
+    for label, files in enumerate(list_dataset(dataset_folder)):
+        split = int(len(files) * validation_split)
+        validation.extend((path, label) for path in files[:split])
+        training.extend((path, label) for path in files[split:])
+    return training, validation
+
+def sample_dataset(count, seed=42):
+    """Wählt zufällig bis zu ``count`` Bilder mit Label (1 = open) aus dem Dataset."""
+    samples = [(path, label) for label, files in enumerate(list_dataset()) for path in files]
+    random.Random(seed).shuffle(samples)
+    return samples[:count]
+
+def load_sample(path, meta):
+    return np.expand_dims(preprocessing.load_image_array(path, meta), axis=0)
+
+class EpochMetricsLogger(tf.keras.callbacks.Callback):
+    """Schreibt pro Epoche eine Logzeile und eine JSON-Zeile mit den Metriken."""
+
+    def __init__(self, epochs, train_samples):
+        super().__init__()
+        self.epochs = epochs
+        self.train_samples = train_samples
+        self.epoch_started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        epoch_seconds = time.perf_counter() - self.epoch_started
+        images_per_second = self.train_samples / epoch_seconds if epoch_seconds > 0 else 0.0
+        append_log(
+            f"Epoche {epoch+1}/{self.epochs}: Loss: {logs['loss']:.4f}, Accuracy: {logs['accuracy']:.4f}, "
+            f"Val_Loss: {logs['val_loss']:.4f}, Val_Accuracy: {logs['val_accuracy']:.4f}, "
+            f"Dauer: {epoch_seconds:.1f} s, Durchsatz: {images_per_second:.1f} Bilder/s"
+        )
+        metrics = {
+            "epoch": epoch + 1,
+            "epochs": self.epochs,
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "epoch_seconds": round(epoch_seconds, 2),
+            "images_per_second": round(images_per_second, 2),
+            "learning_rate": float(tf.keras.backend.get_value(self.model.optimizer.learning_rate)),
+            **{name: float(value) for name, value in logs.items()}
+        }
+        with open(METRICS_FILE, 'a') as metrics_file:
+            metrics_file.write(json.dumps(metrics) + "\n")
+
+def decode_image(path, label, meta):
+    """Lädt ein Bild mit derselben Vorverarbeitung wie der Webserver (ROI, Skalierung, uint8).
+
+    Bewusst über ``tf.numpy_function`` mit PIL statt tf.io: verkleinertes
+    JPEG-Dekodieren (``jpeg_draft``), ROI-Ausschnitt und Resampling liefern so exakt
+    die Pixel, die das Modell beim Webserver sieht. PIL gibt den GIL beim
+    Dekodieren und Skalieren frei, daher können parallele Aufrufe trotz
+    Python-Code mehrere Kerne nutzen; wie gut, misst ``python benchmark.py
+    retrain`` pro ``num_parallel_calls`` (``decode_images_per_second``). Nach
+    der ersten Epoche kommen die Bilder ohnehin aus dem Cache.
+    """
+    img = tf.numpy_function(lambda path: preprocessing.load_image(path.decode(), meta), [path], tf.uint8)
+    img.set_shape((meta["img_height"], meta["img_width"], 3))
+    return img, label
+
+def build_augmentation():
+    """Zufällige Transformationen, die vektorisiert auf ganze Batches angewendet werden."""
+    return tf.keras.Sequential([
+        layers.RandomRotation(40 / 360, fill_mode='nearest'),
+        layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        layers.RandomZoom(0.2, fill_mode='nearest'),
+        layers.RandomFlip('horizontal')
+    ])
+
+def cache_path(samples, meta, name):
+    """Dateiname des Disk-Caches; ändert sich, sobald sich Bilder oder Vorverarbeitung ändern."""
+    digest = hashlib.sha1(json.dumps({"roi": meta["roi"], "size": [meta["img_height"], meta["img_width"]], "draft": meta["jpeg_draft"]}).encode())
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return os.path.join(CACHE_FOLDER, f"{name}_{digest.hexdigest()[:16]}")
+
+def prepare_cache_folder(keep):
+    """Entfernt Disk-Caches früherer Trainings und unvollständige Caches abgebrochener Trainings.
+
+    Ein Cache von tf.data ist erst vollständig, wenn ``<prefix>.index``
+    existiert. Ein abgebrochenes Training hinterlässt ``<prefix>.lockfile`` und
+    Teildateien ``<prefix>_<n>.*``; damit würde jedes weitere Training mit
+    unverändertem Dataset scheitern. Da Trainings nie parallel laufen, ist jede
+    vorhandene Lock-Datei verwaist.
+    """
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    names = [os.path.basename(prefix) for prefix in keep]
+    complete = {name for name in names if os.path.exists(os.path.join(CACHE_FOLDER, name + '.index'))}
+    for entry in os.listdir(CACHE_FOLDER):
+        name = next((name for name in names if entry.startswith(name)), None)
+        if name in complete and (entry == name + '.index' or entry.startswith(name + '.data-')):
+            continue
+        if name is not None:
+            append_log(f"Entferne unvollständigen Bild-Cache: {entry}")
+        path = os.path.join(CACHE_FOLDER, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def build_dataset(samples, meta, batch_size, training=False, cache=None, parallel_calls=tf.data.AUTOTUNE):
+    """Erstellt eine tf.data-Pipeline mit parallelem Dekodieren, Cache und Prefetching.
+
+    ``cache`` ist ein Dateipfad für den Disk-Cache, '' für einen Cache im
+    Speicher oder None für keinen Cache. Zwischengespeichert werden die
+    skalierten uint8-Bilder; Normalisierung und Augmentierung laufen danach auf
+    ganzen Batches. ``parallel_calls`` gilt für das Dekodieren.
+
+    Beim Training wird die Liste der Dateipfade vor dem Dekodieren gemischt, so
+    dass nie alle dekodierten Bilder gleichzeitig im Speicher liegen. Ein Cache
+    liefert ab der zweiten Epoche die Reihenfolge der ersten; dahinter mischt nur
+    ein begrenzter Puffer von ``TRAIN_SHUFFLE_BUFFER`` Bildern.
+    """
+    paths = tf.constant([path for path, _ in samples], dtype=tf.string)
+    labels = tf.constant([float(label) for _, label in samples], dtype=tf.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training:
+        dataset = dataset.shuffle(max(len(samples), 1), reshuffle_each_iteration=True)
+    dataset = dataset.map(lambda path, label: decode_image(path, label, meta), num_parallel_calls=parallel_calls)
+    if cache is not None:
+        dataset = dataset.cache(cache)
+        if training:
+            dataset = dataset.shuffle(max(TRAIN_SHUFFLE_BUFFER, 1), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    scale = preprocessing.model_input_scale(meta)
+    dataset = dataset.map(lambda images, labels: (tf.cast(images, tf.float32) * scale, labels),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    if training:
+        augmentation = build_augmentation()
+        dataset = dataset.map(lambda images, labels: (augmentation(images, training=True), labels),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def build_model(img_height, img_width, weights='imagenet'):
+    """Erstellt MobileNetV2 mit eingefrorenem Basismodell und binärem Klassifikationskopf.
+
+    ``weights=None`` erzeugt ein zufällig initialisiertes Modell (ohne Download, z. B. für Benchmarks).
+    Die Normalisierung auf 0 bis 1 ist als Rescaling-Schicht Teil des Modells.
+    """
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=(img_height, img_width, 3),
+        include_top=False,
+        weights=weights
+    )
+    base_model.trainable = False  # Basismodell einfrieren
+
+    model = models.Sequential([
+        layers.Rescaling(1 / 255.0, input_shape=(img_height, img_width, 3)),
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(1, activation='sigmoid')
+    ])
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=0.0001),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
+    return model, base_model
+
+def rescales_input(model):
+    """True, wenn das Modell die Pixel selbst normalisiert (neuere Modelle mit Rescaling-Schicht)."""
+    return isinstance(model.layers[0], layers.Rescaling)
+
+def compute_embeddings(extractor, samples, meta, cache, batch_size=32):
+    """Liefert die Backbone-Embeddings aller Bilder; nur Bilder ohne Cache-Eintrag laufen durch das Backbone."""
+    hashes = [content_hash(path) for path, _ in samples]
+    embeddings = [cache.get(content_hash) for content_hash in hashes]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        computed = extractor.predict(build_dataset([samples[i] for i in missing], meta, batch_size), verbose=0)
+        for i, embedding in zip(missing, computed):
+            cache.put(hashes[i], embedding)
+            embeddings[i] = embedding
+    append_log(f"Embeddings: {len(samples) - len(missing)} aus dem Cache, {len(missing)} neu berechnet.")
+    features = np.stack(embeddings) if embeddings else np.zeros((0, extractor.output_shape[-1]), dtype=np.float32)
+    return features, hashes
+
+def backbone_extractor(model):
+    """Backbone bis zur Pooling-Schicht; die Embeddings sind die Eingabe des Klassifikationskopfs."""
+    dense = model.layers[-1]
+    if not isinstance(dense, layers.Dense) or dense.units != 1:
+        raise ValueError("Kopf-Training erwartet ein Modell, das mit einer Dense(1)-Schicht endet.")
+    return tf.keras.Model(model.inputs, model.layers[-2].output)
+
+def backbone_key(model, meta):
+    """Schlüssel des Backbones (alle Schichten außer dem Kopf) für Embedding-Cache und Geräte-Köpfe."""
+    weights = [weight for layer in model.layers[:-1] for weight in layer.get_weights()]
+    return feature_cache.backbone_key(weights, meta)
+
+def fit_head(initial_weights, x_train, y_train, x_val, y_val, callbacks=()):
+    """Trainiert eine Dense(1)-Schicht auf Embeddings und gibt ihre Gewichte und die Val_Accuracy zurück."""
+    head = models.Sequential([layers.Dense(1, activation='sigmoid', input_shape=(x_train.shape[1],))])
+    head.layers[-1].set_weights(initial_weights)
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
+    head.fit(
+        x_train, y_train,
+        validation_data=(x_val, y_val),
+        epochs=HEAD_EPOCHS,
+        batch_size=32,
+        verbose=0,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
+            *callbacks
+        ]
+    )
+    _, val_accuracy = head.evaluate(x_val, y_val, verbose=0)
+    return head.layers[-1].get_weights(), float(val_accuracy)
+
+def labels_of(samples):
+    return np.array([label for _, label in samples], dtype=np.float32)
+
+def train_head(model, meta, training_samples, validation_samples):
+    """Trainiert nur die Dense-Schicht auf zwischengespeicherten Embeddings des eingefrorenen Backbones.
+
+    Gibt die Inhalts-Hashes der verwendeten Embeddings zurück.
+    """
+    extractor = backbone_extractor(model)
+    if not training_samples or not validation_samples:
+        raise ValueError("Kopf-Training benötigt Trainings- und Validierungsbilder.")
+    cache = feature_cache.FeatureCache(EMBEDDING_CACHE_FOLDER, backbone_key(model, meta))
+
+    x_train, train_hashes = compute_embeddings(extractor, training_samples, meta, cache)
+    x_val, val_hashes = compute_embeddings(extractor, validation_samples, meta, cache)
+    append_log("Starte Kopf-Training...")
+    weights, _ = fit_head(model.layers[-1].get_weights(), x_train, labels_of(training_samples),
+                          x_val, labels_of(validation_samples),
+                          callbacks=[EpochMetricsLogger(HEAD_EPOCHS, len(training_samples))])
+    model.layers[-1].set_weights(weights)
+    return set(train_hashes) | set(val_hashes)
+
+def train_device_heads(model, meta):
+    """Trainiert die Köpfe der Geräte-Modelle auf den Embeddings des gemeinsamen Backbones.
+
+    Jeder Unterordner von dataset/models/ ist ein Modellname. Der Kopf startet
+    mit den Gewichten des Standardkopfs; Bilder, deren Embedding schon im Cache
+    liegt, laufen nicht erneut durch das Backbone. Gibt die trainierten Köpfe
+    als (Name, Gewichte, Metadaten) und die verwendeten Inhalts-Hashes zurück.
+    """
+    names = sorted(name for name in os.listdir(HEAD_DATASET_FOLDER)
+                   if os.path.isdir(os.path.join(HEAD_DATASET_FOLDER, name))) if os.path.isdir(HEAD_DATASET_FOLDER) else []
+    if not names:
+        return [], set()
+    extractor = backbone_extractor(model)
+    cache = feature_cache.FeatureCache(EMBEDDING_CACHE_FOLDER, meta["backbone_key"])
+    trained, used = [], set()
+    for name in names:
+        training_samples, validation_samples = split_dataset(0.2, os.path.join(HEAD_DATASET_FOLDER, name))
+        if not validation_samples or len({label for _, label in training_samples}) < 2:
+            append_log(f"Kopf {name}: zu wenige Bilder (mindestens 5 pro Klasse), übersprungen.")
+            continue
+        append_log(f"Trainiere Kopf {name} mit {len(training_samples)} Trainings- und {len(validation_samples)} Validierungsbildern...")
+        x_train, train_hashes = compute_embeddings(extractor, training_samples, meta, cache)
+        x_val, val_hashes = compute_embeddings(extractor, validation_samples, meta, cache)
+        used |= set(train_hashes) | set(val_hashes)
+        weights, val_accuracy = fit_head(model.layers[-1].get_weights(), x_train, labels_of(training_samples),
+                                         x_val, labels_of(validation_samples))
+        append_log(f"Kopf {name}: Val_Accuracy {val_accuracy:.4f}")
+        head_meta = dict(meta, trained_at=datetime.now().isoformat(timespec='seconds'),
+                         train_samples=len(training_samples), validation_samples=len(validation_samples),
+                         val_accuracy=val_accuracy)
+        trained.append((name, weights, head_meta))
+    return trained, used
+
+def save_device_heads(trained, model_path):
+    """Veröffentlicht die Köpfe nach dem Backbone, zu dem sie gehören."""
+    model_folder = os.path.dirname(model_path)
+    for name, (kernel, bias), head_meta in trained:
+        path = heads.head_path(model_folder, name)
+        heads.save_head(path, kernel, bias, head_meta)
+        append_log(f"Kopf {name} gespeichert unter {path}")
+
+def export_tflite(model, tflite_path, meta, quantize='none'):
+    """Exportiert das Modell als TFLite, optional mit Post-Training-Quantisierung.
+
+    Exportiert werden Vorhersage und Embedding, damit auch die Geräte-Köpfe mit
+    dem TFLite-Backend laufen.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(backends.embedding_model(model) or model)
+    if quantize in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == 'int8':
+        calibration = sample_dataset(TFLITE_CALIBRATION_SAMPLES)
+        append_log(f"Kalibriere int8-Quantisierung mit {len(calibration)} Bildern...")
+
+        def representative_dataset():
+            for path, _ in calibration:
+                yield [load_sample(path, meta)]
+
+        converter.representative_dataset = representative_dataset
+
+    tflite_model = converter.convert()
+    with open(tflite_path, 'wb') as tflite_file:
+        tflite_file.write(tflite_model)
+    append_log(f"TFLite-Modell ({quantize}) exportiert ({len(tflite_model) / 1e6:.1f} MB)")
+
+def compare_backends(model, model_path, tflite_path, meta, quantize, report_path):
+    """Vergleicht Genauigkeit und Latenz von Keras und TFLite auf einer Stichprobe des Datasets."""
+    interpreter = tf.lite.Interpreter(model_path=tflite_path)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_details, _ = backends.split_outputs(interpreter.get_output_details())
+
+    keras_times, tflite_times, keras_correct, tflite_correct, agree, diffs = [], [], 0, 0, 0, []
+    samples = sample_dataset(TFLITE_REPORT_SAMPLES, seed=7)
+    for path, label in samples:
+        img_array = load_sample(path, meta)
+
+        start = time.perf_counter()
+        keras_prob = float(model(img_array, training=False)[0][0])
+        keras_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        interpreter.set_tensor(input_details['index'], img_array)
+        interpreter.invoke()
+        tflite_prob = float(interpreter.get_tensor(output_details['index'])[0][0])
+        tflite_times.append(time.perf_counter() - start)
+
+        keras_correct += int((keras_prob > 0.5) == bool(label))
+        tflite_correct += int((tflite_prob > 0.5) == bool(label))
+        agree += int((keras_prob > 0.5) == (tflite_prob > 0.5))
+        diffs.append(abs(keras_prob - tflite_prob))
+
+    count = len(samples)
+    report = {
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "quantize": quantize,
+        "samples": count,
+        "keras": {
+            "accuracy": keras_correct / count if count else None,
+            "latency_ms_mean": 1000 * float(np.mean(keras_times)) if count else None,
+            "size_mb": os.path.getsize(model_path) / 1e6
+        },
+        "tflite": {
+            "accuracy": tflite_correct / count if count else None,
+            "latency_ms_mean": 1000 * float(np.mean(tflite_times)) if count else None,
+            "size_mb": os.path.getsize(tflite_path) / 1e6
+        },
+        "agreement": agree / count if count else None,
+        "mean_abs_probability_diff": float(np.mean(diffs)) if count else None
+    }
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    if count:
+        append_log(
+            f"Vergleich Keras/TFLite auf {count} Bildern: Genauigkeit {report['keras']['accuracy']:.3f}/"
+            f"{report['tflite']['accuracy']:.3f}, Latenz {report['keras']['latency_ms_mean']:.1f}/"
+            f"{report['tflite']['latency_ms_mean']:.1f} ms, Übereinstimmung {report['agreement']:.3f}"
+        )
+    append_log(f"Vergleichsbericht gespeichert unter {report_path}")
+
+def retrain_model(model_path, mode='full'):
     setup_logging()
 
     if is_locked():
         append_log("Retraining läuft bereits. Abbruch.")
         print("Retraining läuft bereits. Abbruch.")
-        return
+        return False
 
     try:
         lock()
+        signal.signal(signal.SIGTERM, cancel_handler)
         append_log("TensorFlow Version: " + tf.__version__)
         append_log("Keras Version: " + tf.keras.__version__)
         # Startzeit speichern
         start_time = datetime.now()
         append_log(f"Startzeit: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        append_log(f"Modus: {mode}")
 
         batch_size = 32
-        img_height = 512
-        img_width = 896
-
-        # Daten-Generatoren mit Datenaugmentation
-        train_datagen = ImageDataGenerator(
-            rescale=1./255,
-            validation_split=0.2,
-            rotation_range=40,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            shear_range=0.2,
-            zoom_range=0.2,
-            horizontal_flip=True,
-            fill_mode='nearest'
-        )
+        # Auflösung und ROI kommen aus der Umgebung und werden mit dem Modell gespeichert
+        meta = preprocessing.config_from_env()
+        img_height = meta["img_height"]
+        img_width = meta["img_width"]
+        append_log(f"Auflösung: {img_height}x{img_width}, ROI: {meta['roi'] or 'ganzes Bild'}")
 
-        train_generator = train_datagen.flow_from_directory(
-            directory='/app/dataset',
-            target_size=(img_height, img_width),
-            batch_size=batch_size,
-            class_mode='binary',
-            subset='training'
-        )
-        append_log(f"Training Images: {train_generator.samples} found.")
-
-        validation_datagen = ImageDataGenerator(
-            rescale=1./255,
-            validation_split=0.2
-        )
-
-        validation_generator = validation_datagen.flow_from_directory(
-            directory='/app/dataset',
-            target_size=(img_height, img_width),
-            batch_size=batch_size,
-            class_mode='binary',
-            subset='validation'
-        )
-        append_log(f"Validation Images: {validation_generator.samples} found.")
+        training_samples, validation_samples = split_dataset(validation_split=0.2)
+        append_log(f"Training Images: {len(training_samples)} found.")
+        append_log(f"Validation Images: {len(validation_samples)} found.")
 
         # Modell erstellen oder bestehendes Modell laden
+        model = None
+        base_model = None
         if os.path.exists(model_path):
             append_log(f"Lade bestehendes Modell: {model_path}")
             model = tf.keras.models.load_model(model_path)
-        else:
+            if tuple(model.input_shape[1:3]) != (img_height, img_width):
+                append_log(f"Modell erwartet {model.input_shape[1]}x{model.input_shape[2]}, konfiguriert ist {img_height}x{img_width}. Erstelle neues Modell.")
+                model = None
+        if model is None:
             append_log("Erstelle neues Modell...")
-            base_model = tf.keras.applications.MobileNetV2(
-                input_shape=(img_height, img_width, 3),
-                include_top=False,
-                weights='imagenet'
-            )
-            base_model.trainable = False  # Basismodell einfrieren
-
-            model = models.Sequential([
-                base_model,
-                layers.GlobalAveragePooling2D(),
-                layers.Dense(1, activation='sigmoid')
-            ])
-
-            model.compile(
-                optimizer=tf.keras.optimizers.Adam(learning_rate=0.0001),
-                loss='binary_crossentropy',
-                metrics=['accuracy']
-            )
-            append_log(f"Neues Modell erfolgreich erstellt.")
-
-        # Feinjustierung aktivieren
-        if 'base_model' in locals():
-            append_log("Feinjustierung der letzten Schichten...")
-            base_model.trainable = True
-            fine_tune_at = len(base_model.layers) - 5  # Letzte 5 Schichten feinjustieren
-            for layer in base_model.layers[:fine_tune_at]:
-                layer.trainable = False
-
-            model.compile(
-                optimizer=tf.keras.optimizers.Adam(learning_rate=0.00001),
-                loss='binary_crossentropy',
-                metrics=['accuracy']
-            )
-
-        epochs = 25  # Reduzierte Anzahl an Epochen
-        append_log("Starte Training...")
-        history = model.fit(
-            train_generator,
-            validation_data=validation_generator,
-            epochs=epochs,
-            callbacks=[
-                tf.keras.callbacks.EarlyStopping(
-                    monitor='val_loss',  # Überwacht Validierungsverlust
-                    patience=5,  # Stoppt, wenn sich Val_Loss für 5 Epochen nicht verbessert
-                    restore_best_weights=True
-                ),
-                tf.keras.callbacks.ReduceLROnPlateau(
-                    monitor='val_loss',
-                    factor=0.5,
-                    patience=3,
-                    min_lr=1e-6,
-                    verbose=1
-                ),
-                tf.keras.callbacks.LambdaCallback(on_epoch_end=lambda epoch, logs: append_log(
-                    f"Epoche {epoch+1}/{epochs}: Loss: {logs['loss']:.4f}, Accuracy: {logs['accuracy']:.4f}, "
-                    f"Val_Loss: {logs['val_loss']:.4f}, Val_Accuracy: {logs['val_accuracy']:.4f}"
-                ))
-            ]
-        )
+            model, base_model = build_model(img_height, img_width)
+            append_log("Neues Modell erfolgreich erstellt.")
+        meta["rescale_in_model"] = rescales_input(model)
+        # JPEG_DRAFT gilt nur für neue Trainings; der Webserver dekodiert danach wie in den Metadaten gespeichert
+        meta["jpeg_draft"] = preprocessing.JPEG_DRAFT
+
+        embedding_hashes = set()
+        if mode == 'head':
+            embedding_hashes = train_head(model, meta, training_samples, validation_samples)
+        else:
+            train_full(model, base_model, meta, training_samples, validation_samples, batch_size)
+
+        # Geräte-Köpfe gehören zu genau diesem Backbone
+        meta["backbone_key"] = backbone_key(model, meta)
+        trained_heads, head_hashes = train_device_heads(model, meta)
+        removed = feature_cache.FeatureCache(EMBEDDING_CACHE_FOLDER, meta["backbone_key"]).prune(embedding_hashes | head_hashes)
+        if removed:
+            append_log(f"{removed} Embeddings entfernter Bilder gelöscht.")
 
-        model.save(model_path, save_format='keras')
-        append_log(f"Modell gespeichert unter {model_path}")
+        # Das Speichern wird nicht mehr abgebrochen, sonst passen Keras- und TFLite-Modell nicht zusammen
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        save_model(model, model_path, meta)
+        save_device_heads(trained_heads, model_path)
 
         # Endzeit und Dauer berechnen
         end_time = datetime.now()
         duration = end_time - start_time
         append_log(f"Endzeit: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         append_log(f"Dauer des Trainings: {str(timedelta(seconds=duration.total_seconds()))}")
+        return True
 
+    except RetrainCancelled:
+        append_log("Retraining abgebrochen, das bisherige Modell bleibt erhalten.")
+        return False
     except Exception as e:
         append_log(f"Fehler während des Retrainings: {e}")
         print(f"Fehler während des Retrainings: {e}")
+        return False
     finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
         unlock()
 
+def train_full(model, base_model, meta, training_samples, validation_samples, batch_size):
+    """Trainiert das Modell mit Augmentierung; ein neues Modell wird zusätzlich feinjustiert."""
+    # tf.data-Pipeline: paralleles Dekodieren, Cache der skalierten Bilder, Augmentierung pro Batch
+    if TRAIN_CACHE == 'disk':
+        train_cache = cache_path(training_samples, meta, 'train')
+        validation_cache = cache_path(validation_samples, meta, 'validation')
+        prepare_cache_folder([train_cache, validation_cache])
+    else:
+        train_cache = validation_cache = '' if TRAIN_CACHE == 'memory' else None
+    append_log(f"Bild-Cache: {TRAIN_CACHE}")
+    train_generator = build_dataset(training_samples, meta, batch_size, training=True, cache=train_cache)
+    validation_generator = build_dataset(validation_samples, meta, batch_size, cache=validation_cache)
+
+    # Feinjustierung aktivieren
+    if base_model is not None:
+        append_log("Feinjustierung der letzten Schichten...")
+        base_model.trainable = True
+        fine_tune_at = len(base_model.layers) - 5  # Letzte 5 Schichten feinjustieren
+        for layer in base_model.layers[:fine_tune_at]:
+            layer.trainable = False
+
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=0.00001),
+            loss='binary_crossentropy',
+            metrics=['accuracy']
+        )
+
+    epochs = 25  # Reduzierte Anzahl an Epochen
+    append_log("Starte Training...")
+    history = model.fit(
+        train_generator,
+        validation_data=validation_generator,
+        epochs=epochs,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(
+                monitor='val_loss',  # Überwacht Validierungsverlust
+                patience=5,  # Stoppt, wenn sich Val_Loss für 5 Epochen nicht verbessert
+                restore_best_weights=True
+            ),
+            tf.keras.callbacks.ReduceLROnPlateau(
+                monitor='val_loss',
+                factor=0.5,
+                patience=3,
+                min_lr=1e-6,
+                verbose=1
+            ),
+            EpochMetricsLogger(epochs, len(training_samples))
+        ]
+    )
+
+def save_model(model, model_path, meta):
+    """Speichert Modell, Metadaten und optional das TFLite-Modell als zusammengehörige Version."""
+    # Alle Dateien entstehen zunächst unter temporären Namen, denn TFLite-Export und Vergleich
+    # dauern Minuten. Danach werden sie kurz nacheinander veröffentlicht: TFLite-Modell, Metadaten
+    # und zuletzt das Keras-Modell, an dessen Änderungszeit der Webserver eine neue Version erkennt.
+    base_path = os.path.splitext(model_path)[0]
+    tmp_model_path = base_path + '.tmp.keras'
+    model.save(tmp_model_path, save_format='keras')
+
+    tflite_path = base_path + '.tflite'
+    tmp_tflite_path = base_path + '.tmp.tflite'
+    exported = False
+    if TFLITE_EXPORT:
+        try:
+            export_tflite(model, tmp_tflite_path, meta, TFLITE_QUANTIZE)
+            exported = True
+            compare_backends(model, tmp_model_path, tmp_tflite_path, meta, TFLITE_QUANTIZE, base_path + '_tflite_report.json')
+        except Exception as e:
+            append_log(f"Fehler beim TFLite-Export: {e}")
+            if not exported and os.path.exists(tmp_tflite_path):
+                os.remove(tmp_tflite_path)
+
+    if exported:
+        os.replace(tmp_tflite_path, tflite_path)
+        append_log(f"TFLite-Modell ({TFLITE_QUANTIZE}) gespeichert unter {tflite_path}")
+    elif os.path.exists(tflite_path):
+        # Ein altes TFLite-Modell gehört nicht zur neuen Version; der Webserver fällt sichtbar auf Keras zurück
+        os.remove(tflite_path)
+        append_log(f"Veraltetes TFLite-Modell entfernt: {tflite_path}")
+    preprocessing.save_metadata(model_path, meta)
+    os.replace(tmp_model_path, model_path)
+    append_log(f"Modell gespeichert unter {model_path}")
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Verwendung: python retrain.py <model_path>")
+    if len(sys.argv) not in (2, 3):
+        print("Verwendung: python retrain.py <model_path> [full|head]")
         sys.exit(1)
 
     model_path = sys.argv[1]
-    retrain_model(model_path)
+    mode = sys.argv[2].lower() if len(sys.argv) == 3 else RETRAIN_MODE
+    if mode not in RETRAIN_MODES:
+        print(f"Unbekannter Modus: {mode} (erlaubt: {', '.join(RETRAIN_MODES)})")
+        sys.exit(1)
+    configure_threads()
+    sys.exit(0 if retrain_model(model_path, mode) else 1)
@@ -1,21 +1,23 @@
 #!/bin/bash
 
-MODEL_PATH="/app/model/garage_door_model.keras"
+# Basisverzeichnis wie in app.py und retrain.py
+BASE_DIR="${APP_BASE_DIR:-/app}"
+MODEL_PATH="$BASE_DIR/model/garage_door_model.keras"
 
 # Sicherstellen, dass die Verzeichnisse existieren
-if [ ! -d "/app/dataset/open" ] || [ ! -d "/app/dataset/closed" ]; then
+if [ ! -d "$BASE_DIR/dataset/open" ] || [ ! -d "$BASE_DIR/dataset/closed" ]; then
     echo "Dataset-Verzeichnisse fehlen. Bitte überprüfe, ob die Verzeichnisse 'open' und 'closed' existieren."
     exit 1
 fi
 
-LOCK_FILE="/app/retrain.lock"
+LOCK_FILE="$BASE_DIR/retrain.lock"
 
 # Logfile bereinigen
-RETRAIN_LOG="/app/retrain.log"
+RETRAIN_LOG="$BASE_DIR/retrain.log"
 > "$RETRAIN_LOG"
 
 # Retrain das Modell
-python /app/retrain.py $MODEL_PATH
+python "$(dirname "$0")/retrain.py" "$MODEL_PATH"
 
 # Optional: Wenn du die Datensätze nach dem Training leeren möchtest, entferne das Kommentarzeichen
 # rm -rf /dataset/open/*
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import log_tail
+
+logger = logging.getLogger(__name__)
+
+RETRAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'retrain.py')
+
+
+class RetrainJob:
+    """Zustand eines Retraining-Prozesses."""
+
+    def __init__(self, model_path, mode, process):
+        self.model_path = model_path
+        self.mode = mode
+        self.process = process
+        self.pid = process.pid
+        self.state = 'running'
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.returncode = None
+        self.cancel_requested = False
+
+    def is_running(self):
+        return self.state in ('running', 'cancelling')
+
+
+class RetrainJobManager:
+    """Startet retrain.py als Unterprozess und überwacht ihn.
+
+    Es läuft höchstens ein Job gleichzeitig, da alle Jobs dieselbe Log-,
+    Metrik- und Lock-Datei verwenden. Der Prozess läuft mit niedrigerer
+    Priorität (``nice``); die Thread-Limits für TensorFlow liest retrain.py
+    selbst aus der Umgebung. Ein Abbruch sendet SIGTERM, retrain.py beendet
+    sich dann ohne das Modell zu speichern.
+    """
+
+    def __init__(self, log_file, metrics_file, lock_file, nice=10, kill_timeout=120):
+        self.log_file = log_file
+        self.metrics_file = metrics_file
+        self.lock_file = lock_file
+        self.nice = nice
+        self.kill_timeout = kill_timeout
+        self._job = None
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        """True, solange ein Job läuft oder retrain.py manuell mit Lock-Datei gestartet wurde."""
+        with self._lock:
+            if self._job and self._job.is_running():
+                return True
+        return os.path.exists(self.lock_file)
+
+    def start(self, model_path, mode='full'):
+        """Startet einen neuen Job; RuntimeError, falls bereits einer läuft."""
+        with self._lock:
+            if (self._job and self._job.is_running()) or os.path.exists(self.lock_file):
+                raise RuntimeError("Retraining läuft bereits.")
+            command = [sys.executable, RETRAIN_SCRIPT, model_path, mode]
+            if self.nice:
+                # Über nice statt preexec_fn, das in Prozessen mit Threads nicht sicher ist
+                command = ['nice', '-n', str(self.nice)] + command
+            # Metriken des letzten Laufs sofort verwerfen, nicht erst wenn retrain.py sie löscht
+            if os.path.exists(self.metrics_file):
+                os.remove(self.metrics_file)
+            with open(self.log_file, 'a') as log_file:
+                process = subprocess.Popen(
+                    command,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    cwd=os.path.dirname(RETRAIN_SCRIPT)
+                )
+            job = RetrainJob(model_path, mode, process)
+            self._job = job
+        logger.info(f"Retraining gestartet (PID {job.pid}, Modus {mode}).")
+        threading.Thread(target=self._wait, args=(job,), daemon=True).start()
+        return job
+
+    def cancel(self):
+        """Bricht den laufenden Job ab; False, wenn keiner läuft."""
+        with self._lock:
+            job = self._job
+            if not job or not job.is_running():
+                return False
+            job.cancel_requested = True
+            job.state = 'cancelling'
+        logger.info(f"Breche Retraining ab (PID {job.pid}) ...")
+        job.process.send_signal(signal.SIGTERM)
+        threading.Thread(target=self._kill_after_timeout, args=(job,), daemon=True).start()
+        return True
+
+    def status(self):
+        """Zustand des laufenden bzw. letzten Jobs inklusive Epochen-Fortschritt und ETA."""
+        with self._lock:
+            job = self._job
+        if not job:
+            return {"state": 'running' if os.path.exists(self.lock_file) else 'idle'}
+
+        end = job.finished_at or datetime.now()
+        status = {
+            "state": job.state,
+            "mode": job.mode,
+            "pid": job.pid,
+            "model_path": job.model_path,
+            "started_at": job.started_at.isoformat(timespec='seconds'),
+            "finished_at": job.finished_at.isoformat(timespec='seconds') if job.finished_at else None,
+            "elapsed_seconds": round((end - job.started_at).total_seconds(), 1),
+            "returncode": job.returncode,
+            "epoch": None,
+            "epochs": None,
+            "progress": None,
+            "eta_seconds": None
+        }
+        metrics = log_tail.read_metrics(self.metrics_file)
+        if metrics:
+            last = metrics[-1]
+            status["epoch"] = last["epoch"]
+            status["epochs"] = last["epochs"]
+            status["progress"] = round(last["epoch"] / last["epochs"], 3)
+            if job.is_running():
+                # Obergrenze: EarlyStopping kann das Training früher beenden
+                mean_epoch_seconds = sum(m["epoch_seconds"] for m in metrics) / len(metrics)
+                status["eta_seconds"] = round(mean_epoch_seconds * (last["epochs"] - last["epoch"]), 1)
+        return status
+
+    def _wait(self, job):
+        returncode = job.process.wait()
+        with self._lock:
+            job.returncode = returncode
+            job.finished_at = datetime.now()
+            if returncode == 0:
+                # Während des Speicherns wird SIGTERM ignoriert, das Training ist dann trotzdem abgeschlossen
+                job.state = 'succeeded'
+            else:
+                job.state = 'cancelled' if job.cancel_requested else 'failed'
+        logger.info(f"Retraining beendet (PID {job.pid}): {job.state}, Exit-Code {returncode}.")
+
+    def _kill_after_timeout(self, job):
+        deadline = time.monotonic() + self.kill_timeout
+        while time.monotonic() < deadline:
+            if job.process.poll() is not None:
+                return
+            time.sleep(0.5)
+        logger.warning(f"Retraining (PID {job.pid}) reagiert nicht auf SIGTERM, beende mit SIGKILL.")
+        job.process.kill()
+        # Bei SIGKILL kann retrain.py die Lock-Datei nicht mehr entfernen
+        job.process.wait()
+        if os.path.exists(self.lock_file):
+            os.remove(self.lock_file)
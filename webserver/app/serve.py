@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Produktiver Start des Webservers mit waitress.
+
+Mehrere Threads beantworten Anfragen gleichzeitig und teilen sich die einmal
+geladenen Modelle; der Inferenz-Worker bündelt ihre Vorhersagen. Bewusst
+läuft nur ein Prozess: TensorFlow ist nach einem fork nicht zuverlässig
+nutzbar, und Zustand, MQTT-Verbindung und Inferenz-Worker gibt es pro Prozess.
+
+Verwendung:
+    python serve.py
+"""
+import logging
+import os
+
+from waitress import serve
+
+from app import app, startup
+
+# Anzahl gleichzeitig bearbeiteter Anfragen (jeder offene Log-Stream belegt einen Thread)
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 8))
+# Maximale Anzahl offener Verbindungen
+WSGI_CONNECTION_LIMIT = int(os.getenv('WSGI_CONNECTION_LIMIT', 100))
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == '__main__':
+    startup()
+    port = int(os.getenv('PORT', 5000))
+    logger.info(f"Starte waitress auf Port {port} mit {WSGI_THREADS} Threads.")
+    serve(app, host='0.0.0.0', port=port, threads=WSGI_THREADS, connection_limit=WSGI_CONNECTION_LIMIT,
+          ident='garage-door-state')
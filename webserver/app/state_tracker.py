@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+
+
+class StateTracker:
+    """Entprellt Vorhersagen pro Gerät und meldet nur bestätigte Zustandswechsel.
+
+    Für jedes Gerät wird ein kleines Fenster der letzten Wahrscheinlichkeiten
+    gehalten. Ein Bild zählt nur als "open" bzw. "closed", wenn seine
+    Wahrscheinlichkeit mindestens ``margin`` vom Schwellwert entfernt ist. Ein
+    Zustandswechsel gilt erst als bestätigt, wenn die letzten ``confirm_frames``
+    Bilder übereinstimmen.
+    """
+
+    def __init__(self, confirm_frames=2, margin=0.1, window_size=5, heartbeat_seconds=0, threshold=0.5):
+        self.confirm_frames = max(1, confirm_frames)
+        self.margin = margin
+        self.threshold = threshold
+        self.heartbeat_seconds = heartbeat_seconds
+        self.window_size = max(window_size, self.confirm_frames)
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def classify(self, probability):
+        """Ordnet eine Wahrscheinlichkeit einem Zustand zu oder gibt None zurück, wenn sie zu knapp ist."""
+        if probability >= self.threshold + self.margin:
+            return "open"
+        if probability <= self.threshold - self.margin:
+            return "closed"
+        return None
+
+    def update(self, device_id, probability, now=None):
+        """Nimmt eine neue Vorhersage auf.
+
+        Gibt den zu sendenden Zustand zurück, wenn ein Wechsel bestätigt wurde,
+        sonst None.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            device = self._devices.setdefault(device_id, {
+                'window': deque(maxlen=self.window_size),
+                'state': None,
+                'last_published': None,
+                'last_change': None
+            })
+            device['window'].append(probability)
+
+            recent = list(device['window'])[-self.confirm_frames:]
+            if len(recent) < self.confirm_frames:
+                return None
+            states = {self.classify(p) for p in recent}
+            if len(states) != 1:
+                return None
+            candidate = states.pop()
+            if candidate is None or candidate == device['state']:
+                return None
+
+            device['state'] = candidate
+            device['last_published'] = now
+            device['last_change'] = now
+            return candidate
+
+    def due_heartbeats(self, now=None):
+        """Gibt (Gerät, Zustand) für alle Geräte zurück, deren Zustand erneut gesendet werden soll."""
+        if not self.heartbeat_seconds:
+            return []
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            for device_id, device in self._devices.items():
+                if device['state'] and now - device['last_published'] >= self.heartbeat_seconds:
+                    device['last_published'] = now
+                    due.append((device_id, device['state']))
+        return due
+
+    def current_state(self, device_id):
+        with self._lock:
+            device = self._devices.get(device_id)
+            return device['state'] if device else None
+
+    def pending_change(self, device_id):
+        """True, wenn das letzte Bild einen anderen als den bestätigten Zustand zeigt, der Wechsel aber noch aussteht."""
+        with self._lock:
+            device = self._devices.get(device_id)
+            if not device or not device['window']:
+                return False
+            candidate = self.classify(device['window'][-1])
+            return candidate is not None and candidate != device['state']
+
+    def last_change(self, device_id):
+        """Zeitpunkt des letzten bestätigten Zustandswechsels oder None."""
+        with self._lock:
+            device = self._devices.get(device_id)
+            return device['last_change'] if device else None
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import os
+
+from PIL import Image
+
+# Maximale Kantenlänge der Vorschaubilder in der Galerie
+THUMBNAIL_SIZE = (480, 270)
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_path(folder, filename):
+    return os.path.join(folder, os.path.splitext(filename)[0] + '.jpg')
+
+
+def create_thumbnail(source, folder, filename=None):
+    """Erzeugt das Vorschaubild zu ``source`` in ``folder`` und gibt dessen Pfad zurück.
+
+    JPEGs werden per ``draft`` direkt in reduzierter Auflösung dekodiert. Das
+    Bild wird zuerst in eine temporäre Datei geschrieben, damit ein gleichzeitiger
+    Abruf nie ein halbes Vorschaubild ausliefert.
+    """
+    path = thumbnail_path(folder, filename or os.path.basename(source))
+    tmp_path = path + '.tmp'
+    with Image.open(source) as img:
+        img.draft('RGB', THUMBNAIL_SIZE)
+        img = img.convert('RGB')
+        img.thumbnail(THUMBNAIL_SIZE, Image.BILINEAR)
+        img.save(tmp_path, 'JPEG', quality=THUMBNAIL_QUALITY)
+    os.replace(tmp_path, path)
+    return path
+
+
+def remove_thumbnail(folder, filename):
+    try:
+        os.remove(thumbnail_path(folder, filename))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import zipfile
+
+# Bereits komprimierte Formate werden nur gespeichert, nicht erneut komprimiert
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CHUNK_SIZE = 1 << 16
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Nicht durchsuchbarer Puffer, den ZipFile beschreibt und der Generator leert."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """Erzeugt ein ZIP-Archiv stückweise, ohne temporäre Datei.
+
+    ``entries`` liefert (Dateipfad, Name im Archiv). Da der Puffer nicht
+    durchsuchbar ist, schreibt ZipFile Größen und CRC als Data Descriptor
+    hinter jede Datei. JPEG/PNG werden unkomprimiert (STORED) abgelegt.
+    Dateien, die zwischenzeitlich gelöscht wurden, werden übersprungen.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for path, arcname in entries:
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                source = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            info.compress_type = zipfile.ZIP_STORED if path.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            with source, archive.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
+
+
+def archive_name(path, root):
+    """Pfad relativ zu ``root`` mit ``/`` als Trenner."""
+    return os.path.relpath(path, root).replace(os.sep, '/')
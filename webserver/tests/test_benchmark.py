@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Tests von benchmark.py: Suiten-Beschreibung, Argumente, preprocess und compare."""
+import argparse
+import json
+import re
+
+import pytest
+
+pytest.importorskip('PIL')
+
+import benchmark
+
+
+def test_docstring_all_lists_exactly_the_suites_it_runs():
+    line = next(line for line in benchmark.__doc__.splitlines() if line.strip().startswith('all '))
+    listed = re.findall(r'\w+', line.split('(')[0])[1:]
+    assert [name for name in listed if name != 'und'] == list(benchmark.SUITES)
+
+
+def test_docstring_describes_every_suite():
+    described = {line.split()[0] for line in benchmark.__doc__.splitlines() if line.startswith('    ') and line.strip()}
+    assert set(benchmark.SUITES + benchmark.DATASET_SUITES) <= described
+
+
+def test_parse_resolutions():
+    assert benchmark.parse_resolutions('224x224,512X896') == [(224, 224), (512, 896)]
+    with pytest.raises(ValueError):
+        benchmark.parse_resolutions('224-224')
+
+
+def test_run_preprocess_measures_both_variants(tmp_path):
+    args = argparse.Namespace(resolutions=[(16, 32)], roi=None, images_dir='', frame_size=(64, 48),
+                              images=2, runs=3, warmup=1)
+    results = benchmark.run_preprocess(args, str(tmp_path))
+
+    assert [(r["suite"], r["resolution"], r["variant"]) for r in results] == [
+        ('preprocess', '16x32', 'legacy'), ('preprocess', '16x32', 'optimized')]
+    for result in results:
+        assert result["total"]["runs"] == 3
+        assert 0 <= result["total"]["p50_ms"] <= result["total"]["p99_ms"]
+
+
+def test_compare_reports_changes_and_unmatched_results(tmp_path, capsys):
+    baseline = tmp_path / 'vorher.json'
+    candidate = tmp_path / 'nachher.json'
+    baseline.write_text(json.dumps({"results": [
+        {"suite": 'latency', "resolution": '224x224', "backend": 'keras', "batch_size": 4, "total": {"p50_ms": 10.0, "runs": 5}},
+        {"suite": 'preprocess', "resolution": '224x224', "variant": 'legacy', "total": {"p50_ms": 2.0}}]}))
+    candidate.write_text(json.dumps({"results": [
+        {"suite": 'latency', "resolution": '224x224', "backend": 'keras', "batch_size": 4, "total": {"p50_ms": 8.0, "runs": 5}}]}))
+
+    benchmark.compare(str(baseline), str(candidate))
+
+    lines = capsys.readouterr().out.splitlines()
+    changed = next(line for line in lines if line.startswith('latency 224x224 keras batch 4'))
+    assert 'total.p50_ms' in changed and '-20.0 %' in changed
+    assert not any('total.runs' in line for line in lines)
+    assert any(line.startswith('preprocess 224x224 legacy') and 'nur in vorher' in line for line in lines)
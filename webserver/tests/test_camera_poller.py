@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Tests der Snapshot-Abfrage gegen einen lokalen HTTP-Server als Kamera-Ersatz."""
+import importlib
+import io
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from camera_poller import Camera, CameraPoller
+from state_tracker import StateTracker
+
+
+def make_jpeg(color=(200, 120, 40)):
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class StandInCamera(BaseHTTPRequestHandler):
+    """/ok liefert ``snapshot``, /error antwortet mit 500, /slow antwortet erst nach ``delay`` Sekunden."""
+
+    snapshot = b''
+    delay = 1.0
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == '/error':
+            self.send_error(500)
+            return
+        if self.path == '/slow':
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.snapshot)))
+        self.end_headers()
+        self.wfile.write(self.snapshot)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def camera_server():
+    StandInCamera.snapshot = make_jpeg()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInCamera)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class RecordingPoller(CameraPoller):
+    """Merkt sich jede geplante Pause und wartet nur kurz, damit die Tests schnell laufen."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sleeps = []
+
+    async def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        await super()._sleep(min(seconds, 0.02))
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def run_poller(poller, predicate, timeout=5.0):
+    poller.start()
+    try:
+        assert wait_for(predicate, timeout)
+    finally:
+        poller.stop()
+
+
+def test_healthy_fetch_passes_snapshot_to_handler(camera_server):
+    frames = []
+    poller = RecordingPoller([Camera('garage', camera_server.url + '/ok', interval=30, active_interval=5)],
+                             lambda camera, data: frames.append((camera.id, data)))
+    run_poller(poller, lambda: frames)
+
+    assert frames[0] == ('garage', StandInCamera.snapshot)
+    status = poller.status()['garage']
+    assert status['frames'] >= 1
+    assert status['failures'] == 0
+    assert status['last_error'] is None
+    assert status['last_success'] is not None
+    # Ohne aktiven Zustand gilt das normale Intervall
+    assert 29 < poller.sleeps[0] <= 30
+    assert camera_server.url not in str(poller.status())
+
+
+def test_http_error_backs_off_exponentially_up_to_max(camera_server):
+    poller = RecordingPoller([Camera('garage', camera_server.url + '/error', interval=1, timeout=2)],
+                             lambda camera, data: pytest.fail("Fehlerantwort darf nicht ausgewertet werden"),
+                             max_backoff=4)
+    run_poller(poller, lambda: len(poller.sleeps) >= 5)
+
+    assert poller.sleeps[:5] == [2, 4, 4, 4, 4]
+    status = poller.status()['garage']
+    assert status['failures'] >= 5
+    # Nur der Statuscode, keine URL mit möglichen Zugangsdaten
+    assert status['last_error'] == 'HTTP 500'
+    assert status['next_poll_seconds'] == 4
+
+
+def test_backoff_resets_after_recovery(camera_server):
+    camera = Camera('garage', camera_server.url + '/error', interval=1, timeout=2)
+    frames = []
+    poller = RecordingPoller([camera], lambda camera, data: frames.append(data), max_backoff=8)
+    poller.start()
+    try:
+        assert wait_for(lambda: len(poller.sleeps) >= 2)
+        camera.url = camera_server.url + '/ok'
+        assert wait_for(lambda: frames)
+    finally:
+        poller.stop()
+
+    assert poller.status()['garage']['failures'] == 0
+    assert poller.sleeps[0] == 2
+
+
+def test_timeout_counts_as_failure(camera_server):
+    StandInCamera.delay = 1.0
+    poller = RecordingPoller([Camera('garage', camera_server.url + '/slow', interval=1, timeout=0.2)],
+                             lambda camera, data: pytest.fail("Zu späte Antwort darf nicht ausgewertet werden"),
+                             max_backoff=4)
+    started = time.monotonic()
+    run_poller(poller, lambda: poller.sleeps)
+
+    # Der Abruf wird nach dem Timeout abgebrochen, nicht erst nach der Antwort
+    assert time.monotonic() - started < StandInCamera.delay
+    status = poller.status()['garage']
+    assert status['failures'] == 1
+    assert status['last_error'] == 'TimeoutError'
+    assert poller.sleeps[0] == 2
+
+
+def test_pending_change_switches_to_active_interval(camera_server):
+    tracker = StateTracker(confirm_frames=2, margin=0.1)
+    probabilities = iter([0.1, 0.1, 0.9, 0.9, 0.9, 0.9, 0.9, 0.9])
+
+    def is_active(camera):
+        return tracker.pending_change(camera.id)
+
+    def handle_frame(camera, data):
+        tracker.update(camera.id, next(probabilities, 0.9))
+
+    poller = RecordingPoller([Camera('garage', camera_server.url + '/ok', interval=30, active_interval=5)],
+                             handle_frame, is_active=is_active)
+    run_poller(poller, lambda: len(poller.sleeps) >= 4)
+
+    # Ein abweichendes Bild verkürzt den Abstand, bis closed bzw. open bestätigt ist; danach gilt wieder das normale Intervall
+    assert tracker.current_state('garage') == 'open'
+    assert [29 < s <= 30 for s in poller.sleeps[:4]] == [False, True, False, True]
+    assert 4 < poller.sleeps[2] <= 5
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    pytest.importorskip('flask')
+    pytest.importorskip('numpy')
+    pytest.importorskip('PIL')
+    base_dir = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in {
+            'APP_BASE_DIR': str(base_dir),
+            'DEVICES_FILE': str(base_dir / 'devices.json'),
+            'MQTT_HOST': '127.0.0.1',
+            'MQTT_PORT': '9',
+            'STATE_CONFIRM_FRAMES': '1',
+            'FRAME_CACHE_ENABLED': 'false'
+        }.items():
+            mp.setenv(name, value)
+        module = importlib.import_module('app')
+        yield module
+        module.mqtt_publisher.stop()
+        # Damit ein späterer Import von app wieder von vorn beginnt
+        module.metrics.REGISTRY.unregister(module.state_collector)
+        sys.modules.pop('app', None)
+
+
+@pytest.fixture
+def snapshot_app(app_module, monkeypatch):
+    """App mit ersetzter Vorhersage und MQTT; ``cache_hit`` und die Wahrscheinlichkeit legt der Test fest."""
+    published = []
+    prediction = {"probability": 0.9, "cache_hit": False}
+
+    def predict_files(device, uploads):
+        return [dict(prediction, filename=filename, latency=0.01, model_version='test') for filename, _, _ in uploads]
+
+    monkeypatch.setattr(app_module, 'predict_files', predict_files)
+    monkeypatch.setattr(app_module, 'state_tracker', StateTracker(confirm_frames=1))
+    monkeypatch.setattr(app_module.mqtt_publisher, 'publish',
+                        lambda topic, payload, retain=False: published.append((topic, payload)) or True)
+    app_module.published = published
+    app_module.prediction = prediction
+    return app_module
+
+
+@pytest.mark.parametrize('mode, cache_hit, saved', [
+    ('all', False, True),
+    ('all', True, True),
+    ('changed', False, True),
+    ('changed', True, False),
+    ('none', False, False),
+    ('none', True, False),
+])
+def test_handle_snapshot_save_modes(snapshot_app, camera_server, monkeypatch, mode, cache_hit, saved):
+    app = snapshot_app
+    monkeypatch.setattr(app, 'SNAPSHOT_SAVE', mode)
+    app.prediction["cache_hit"] = cache_hit
+    # Eigener Bildinhalt pro Fall, da Uploads unter dem Hash ihres Inhalts gespeichert werden
+    StandInCamera.snapshot = make_jpeg((len(mode) * 20, 255 if cache_hit else 0, 80))
+    filename = app.dedup.content_name(StandInCamera.snapshot)
+    device = app.devices.default
+
+    poller = RecordingPoller([Camera(device.id, camera_server.url + '/ok', interval=30)], app.handle_snapshot)
+    run_poller(poller, lambda: poller.status()[device.id]['frames'] >= 1)
+
+    # Der Zustand wird unabhängig vom Speichern sofort gesendet
+    assert app.published == [(device.state_topic, 'open')]
+    assert app.get_last_result(device)["filename"] == filename
+    assert os.path.exists(os.path.join(app.UPLOAD_FOLDER, filename)) == saved
+    assert (filename in os.listdir(os.path.join(app.LAST_IMAGE_FOLDER, device.id))) == saved
+
+
+def test_handle_snapshot_ignores_invalid_image(snapshot_app):
+    app = snapshot_app
+    device = app.devices.default
+    app.handle_snapshot(Camera(device.id, 'http://camera.invalid/'), b'kein Bild')
+
+    assert app.published == []
+    assert not os.path.exists(os.path.join(app.UPLOAD_FOLDER, app.dedup.content_name(b'kein Bild')))
+
+
+def test_app_poller_uses_configured_backoff(app_module):
+    assert app_module.camera_poller.max_backoff == app_module.SNAPSHOT_MAX_BACKOFF
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tests der Geräte-Köpfe auf dem gemeinsamen Backbone."""
+import numpy as np
+import pytest
+
+pytest.importorskip('PIL')
+
+from heads import Head, HeadRegistry, head_path, load_head, save_head
+from inference import InferenceWorker
+from model_registry import LoadedModel
+
+
+class FakeBackbone:
+    """Backbone mit Embedding = Mittelwert pro Farbkanal und Standardkopf = Mittelwert des Embeddings."""
+
+    name = 'fake'
+    supports_embeddings = True
+
+    def predict(self, images, batch_size=None, verbose=0):
+        return self.predict_with_embeddings(images)[0]
+
+    def predict_with_embeddings(self, images, batch_size=None):
+        embeddings = np.asarray(images, dtype=np.float32).mean(axis=(1, 2))
+        return embeddings.mean(axis=1, keepdims=True), embeddings
+
+
+def test_head_round_trip_and_backbone_match(tmp_path):
+    path = head_path(str(tmp_path), 'right')
+    save_head(path, [[1.0], [0.0], [-1.0]], [0.5], {"backbone_key": "abc", "img_height": 4, "img_width": 4})
+
+    head = load_head(path)
+    assert head.matches({"backbone_key": "abc"})
+    assert not head.matches({"backbone_key": "other"})
+    assert not head.matches({})
+    expected = 1 / (1 + np.exp(-(0.2 - 0.6 + 0.5)))
+    assert head.predict(np.array([[0.2, 0.4, 0.6]]))[0][0] == pytest.approx(expected)
+
+
+def test_head_registry_loads_and_archives(tmp_path):
+    path = head_path(str(tmp_path), 'right')
+    save_head(path, [[1.0]], [0.0], {"backbone_key": "abc"})
+    registry = HeadRegistry(path, poll_seconds=0)
+
+    assert registry.reload()
+    loaded = registry.current()
+    assert loaded.backend.name == 'head'
+    assert loaded.meta["backbone_key"] == "abc"
+    assert registry.versions() == [loaded.version]
+
+
+def test_worker_applies_heads_in_shared_batch():
+    meta = {"img_height": 2, "img_width": 2, "rescale_in_model": True}
+    backbone = LoadedModel(FakeBackbone(), meta, 'v1', 'model.keras', 0.0, 0.0)
+    head = LoadedModel(Head([[0.0], [0.0], [1.0]], [0.0], {}), {}, 'h1', 'head.npz', 0.0, 0.0)
+    worker = InferenceWorker(lambda: backbone, max_batch_size=4, max_wait_ms=200)
+
+    image = np.full((2, 2, 3), 2, dtype=np.uint8)
+    image[..., 2] = 5
+    worker.start()
+    futures = [worker.submit(image, model=backbone), worker.submit(image, model=backbone, head=head)]
+
+    assert futures[0].result(timeout=5) == pytest.approx(3.0)
+    assert futures[1].result(timeout=5) == pytest.approx(1 / (1 + np.exp(-5.0)))
+
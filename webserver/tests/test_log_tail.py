@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Tests für das inkrementelle Lesen des Trainings-Logs."""
+import log_tail
+
+
+def test_reads_only_new_lines(tmp_path):
+    path = tmp_path / 'retrain.log'
+    path.write_text("Starte neues Retraining (2025-01-01 10:00:00)...\nEpoche 1\n")
+    text, offset, reset = log_tail.read_from_offset(str(path), 0)
+    assert text.endswith("Epoche 1\n") and not reset
+
+    with open(path, 'a') as log_file:
+        log_file.write("Epoche 2\n")
+    text, offset, reset = log_tail.read_from_offset(str(path), offset)
+    assert (text, reset) == ("Epoche 2\n", False)
+
+
+def test_reset_when_new_log_grew_past_old_offset(tmp_path):
+    path = tmp_path / 'retrain.log'
+    path.write_text("Starte neues Retraining (2025-01-01 10:00:00)...\nkurz\n")
+    _, offset, _ = log_tail.read_from_offset(str(path), 0)
+
+    # Neues Training leert die Datei und schreibt mehr, als der Client schon gelesen hatte
+    new_log = "Starte neues Retraining (2025-01-01 11:00:00)...\n" + "Epoche 1 mit längerer Zeile\n" * 5
+    with open(path, 'w') as log_file:
+        log_file.write(new_log)
+    text, _, reset = log_tail.read_from_offset(str(path), offset)
+    assert reset
+    assert text == new_log
+
+
+def test_plain_byte_offset_and_missing_file(tmp_path):
+    path = tmp_path / 'retrain.log'
+    assert log_tail.read_from_offset(str(path), 5) == ("", "0", True)
+    path.write_text("abc\ndef\n")
+    assert log_tail.read_from_offset(str(path), 4)[0] == "def\n"
+    assert log_tail.parse_offset('kaputt:x') is None
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Tests der Zustandsmetriken, die erst beim Abruf gelesen werden."""
+import pytest
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+import metrics
+
+
+def test_state_collector_reports_only_current_model_version():
+    registry = prometheus_client.CollectorRegistry()
+    state = {"models": [{"model": "default", "version": "v1", "backend": "keras",
+                         "load_seconds": 2.5, "warmup_seconds": None}],
+             "mqtt_connected": 1, "retrain_progress": None}
+    registry.register(metrics.StateCollector(lambda: state))
+
+    assert registry.get_sample_value('garage_model_info', {"model": "default", "version": "v1", "backend": "keras"}) == 1
+    assert registry.get_sample_value('garage_model_load_seconds', {"model": "default"}) == 2.5
+    assert registry.get_sample_value('garage_model_warmup_seconds', {"model": "default"}) == 0
+    assert registry.get_sample_value('garage_mqtt_connected') == 1
+    assert registry.get_sample_value('garage_retrain_progress') == 0
+
+    # Nach einem Modellwechsel verschwindet die alte Version ohne clear()
+    state["models"][0]["version"] = "v2"
+    assert registry.get_sample_value('garage_model_info', {"model": "default", "version": "v1", "backend": "keras"}) is None
+    assert registry.get_sample_value('garage_model_info', {"model": "default", "version": "v2", "backend": "keras"}) == 1
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Das verkleinerte JPEG-Dekodieren folgt den Metadaten des Modells, nicht der Umgebung."""
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import preprocessing
+
+META = {"img_height": 224, "img_width": 224, "roi": None}
+
+
+def jpeg(size=(1920, 1080)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (10, 20, 30)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('env_draft', [True, False])
+def test_decode_follows_model_metadata(monkeypatch, env_draft):
+    monkeypatch.setattr(preprocessing, 'JPEG_DRAFT', env_draft)
+
+    # Modelle ohne jpeg_draft wurden mit voller Auflösung trainiert
+    assert preprocessing.decode_image(jpeg(), META).size == (1920, 1080)
+    assert preprocessing.decode_image(jpeg(), dict(META, jpeg_draft=False)).size == (1920, 1080)
+    assert preprocessing.decode_image(jpeg(), dict(META, jpeg_draft=True)).size == (480, 270)